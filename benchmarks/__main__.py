@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from benchmarks.scenarios import run_isolated, scenarios
+
+logger = logging.getLogger('benchmarks')
+
+
+def _get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            check=True,
+            cwd=Path(__file__).parent,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('-o', '--output', type=str, default='bench_output.json')
+@click.option('-s', '--scenario', type=click.Choice(tuple(scenarios)), multiple=True, default=tuple(scenarios))
+@click.option('--feeds', type=int, default=20)
+@click.option('--entries', type=int, default=2000)
+@click.option('--episodes-per-feed', type=int, default=10)
+@click.option('--media-size', type=int, default=2 * 1024 * 1024)
+@click.option('--latency', type=float, default=0.02)
+@click.option('--bandwidth', type=int, default=0)
+@click.option('--throttle-every', type=int, default=0)
+@click.option('-t', '--threads', type=int, default=10)
+@click.option('--tag-files', type=int, default=50)
+@click.option('--feed-list-entries', type=int, default=100000)
+def main(
+        bandwidth: int,
+        entries: int,
+        episodes_per_feed: int,
+        feed_list_entries: int,
+        feeds: int,
+        latency: float,
+        media_size: int,
+        output: str,
+        scenario: tuple[str],
+        tag_files: int,
+        threads: int,
+        throttle_every: int,
+):
+    logging.basicConfig(level=logging.WARNING, format='[%(asctime)s - %(name)s - %(levelname)s] - %(message)s')
+    logger.setLevel(logging.INFO)
+    parameters = {
+        'feed_parsing': {'entry_count': entries, 'latency': latency},
+        'download': {
+            'feed_count': feeds,
+            'entry_count': episodes_per_feed,
+            'media_size': media_size,
+            'latency': latency,
+            'bandwidth': bandwidth,
+            'throttle_every': throttle_every,
+            'threads': threads,
+        },
+        'tagging': {'file_count': tag_files, 'media_size': media_size},
+        'writer': {'entry_count': entries, 'repeats': 20},
+        'feed_list': {'entry_count': feed_list_entries},
+        'startup': {'repeats': 5},
+    }
+    results = {}
+    for name in scenario:
+        logger.info(f'Running benchmark {name}')
+        # Each scenario runs in a fresh process so that the peak RSS belongs to that scenario alone
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            results[name] = executor.submit(run_isolated, name, parameters[name]).result()
+        logger.info(f'{name}: {json.dumps(results[name])}')
+    report = {
+        'commit': _get_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': {name: parameters[name] for name in scenario},
+        'results': results,
+    }
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    logger.info(f'Benchmark results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import resource
+import statistics
+import sys
+import time
+from typing import Optional
+
+
+def get_peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class EventLoopLagMonitor:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        samples = sorted(self.samples) or [0.0]
+        return {
+            'loop_lag_mean': statistics.fmean(samples),
+            'loop_lag_p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            'loop_lag_max': samples[-1],
+        }
+
+    async def __aenter__(self) -> 'EventLoopLagMonitor':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if not self._task.done():
+            await self.stop()
+
+
+class Timer:
+    def __init__(self):
+        self.start_time = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.perf_counter() - self.start_time
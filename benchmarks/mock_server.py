@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import functools
+import hashlib
+import logging
+import struct
+import threading
+from typing import Optional
+
+import aiohttp.web
+
+logger = logging.getLogger(__name__)
+
+_mp3_frame = b'\xff\xfb\x90\x64' + bytes(413)
+
+
+def _atom(name: bytes, data: bytes = b'') -> bytes:
+    return struct.pack('>I', 8 + len(data)) + name + data
+
+
+def _full_atom(name: bytes, data: bytes) -> bytes:
+    return _atom(name, bytes(4) + data)
+
+
+def make_mp3(size: int) -> bytes:
+    frame_count = max(1, size // len(_mp3_frame))
+    return _mp3_frame * frame_count
+
+
+def make_m4a(size: int) -> bytes:
+    timescale = 44100
+    duration = timescale * max(1, size // 16000)
+    mvhd = _full_atom(b'mvhd', struct.pack('>IIII', 0, 0, timescale, duration) + bytes(80))
+    mdhd = _full_atom(b'mdhd', struct.pack('>IIIIHH', 0, 0, timescale, duration, 0, 0))
+    hdlr = _full_atom(b'hdlr', struct.pack('>I4s12s', 0, b'soun', bytes(12)) + b'\x00')
+    stbl = _atom(b'stbl', _full_atom(b'stsd', struct.pack('>I', 0)))
+    trak = _atom(b'trak', _atom(b'mdia', mdhd + hdlr + _atom(b'minf', stbl)))
+    header = _atom(b'ftyp', b'M4A ' + bytes(4) + b'M4A isom') + _atom(b'moov', mvhd + trak)
+    return header + _atom(b'mdat', bytes(max(0, size - len(header) - 8)))
+
+
+@functools.lru_cache(maxsize=8)
+def make_payload(media_format: str, size: int) -> bytes:
+    if media_format == 'mp3':
+        return make_mp3(size)
+    elif media_format == 'm4a':
+        return make_m4a(size)
+    else:
+        raise ValueError(f'Unknown media format {media_format}')
+
+
+def make_feed(base_url: str, name: str, entry_count: int, media_format: str = 'mp3', media_size: int = 0) -> str:
+    mime_type = {'mp3': 'audio/mpeg', 'm4a': 'audio/mp4'}[media_format]
+    items = ''.join(
+        f'<item>'
+        f'<title>{name} episode {i}</title>'
+        f'<guid>{name}-{i}</guid>'
+        f'<pubDate>Mon, 01 Jan 2001 00:00:00 GMT</pubDate>'
+        f'<description>Show notes for episode {i} of {name}. {"Lorem ipsum dolor sit amet. " * 20}</description>'
+        f'<enclosure url="{base_url}/media/{name}/{i}.{media_format}" length="{media_size}" type="{mime_type}"/>'
+        f'</item>\n'
+        for i in range(entry_count - 1, -1, -1)
+    )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>'
+        f'<title>{name}</title><description>Synthetic feed {name}</description>\n{items}</channel></rss>\n'
+    )
+
+
+class MockPodcastServer:
+    def __init__(
+            self,
+            entry_count: int = 100,
+            media_size: int = 1024 * 1024,
+            media_format: str = 'mp3',
+            latency: float = 0,
+            bandwidth: Optional[int] = None,
+            throttle_every: int = 0,
+            support_conditional: bool = True,
+            support_range: bool = True,
+    ):
+        self.entry_count = entry_count
+        self.media_size = media_size
+        self.media_format = media_format
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle_every = throttle_every
+        self.support_conditional = support_conditional
+        self.support_range = support_range
+        self.request_counts: dict[str, int] = {'feed': 0, 'not_modified': 0, 'media': 0, 'head': 0, 'throttled': 0}
+        self.base_url: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[aiohttp.web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _make_app(self) -> aiohttp.web.Application:
+        app = aiohttp.web.Application()
+        app.router.add_get('/feeds/{name}.xml', self._handle_feed)
+        app.router.add_route('*', '/media/{name}/{file}', self._handle_media)
+        return app
+
+    async def _handle_feed(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        await asyncio.sleep(self.latency)
+        entry_count = int(request.query.get('entries', self.entry_count))
+        name = request.match_info['name']
+        etag = '"' + hashlib.sha1(f'{name}-{entry_count}'.encode()).hexdigest() + '"'
+        if self.support_conditional and request.headers.get('If-None-Match') == etag:
+            self.request_counts['not_modified'] += 1
+            return aiohttp.web.Response(status=304, headers={'ETag': etag})
+        self.request_counts['feed'] += 1
+        feed = make_feed(self.base_url, name, entry_count, self.media_format, self.media_size)
+        headers = {'ETag': etag} if self.support_conditional else {}
+        return aiohttp.web.Response(text=feed, content_type='application/rss+xml', headers=headers)
+
+    async def _handle_media(self, request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
+        await asyncio.sleep(self.latency)
+        media_format = request.match_info['file'].rpartition('.')[2]
+        payload = make_payload(media_format, self.media_size)
+        headers = {'Content-Type': {'mp3': 'audio/mpeg', 'm4a': 'audio/mp4'}[media_format]}
+        if self.support_range:
+            headers['Accept-Ranges'] = 'bytes'
+        if request.method == 'HEAD':
+            self.request_counts['head'] += 1
+            headers['Content-Length'] = str(len(payload))
+            return aiohttp.web.Response(headers=headers)
+        self.request_counts['media'] += 1
+        if self.throttle_every and self.request_counts['media'] % self.throttle_every == 0:
+            self.request_counts['throttled'] += 1
+            return aiohttp.web.Response(status=429, headers={'Retry-After': '1'})
+        start = (request.http_range.start or 0) if self.support_range else 0
+        status = 206 if start else 200
+        if start:
+            headers['Content-Range'] = f'bytes {start}-{len(payload) - 1}/{len(payload)}'
+        response = aiohttp.web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(payload) - start
+        await response.prepare(request)
+        chunk_size = 64 * 1024
+        for position in range(start, len(payload), chunk_size):
+            await response.write(payload[position:position + chunk_size])
+            if self.bandwidth:
+                await asyncio.sleep(chunk_size / self.bandwidth)
+        await response.write_eof()
+        return response
+
+    def feed_urls(self, feed_count: int, entry_count: Optional[int] = None) -> list[str]:
+        query = f'?entries={entry_count}' if entry_count is not None else ''
+        return [f'{self.base_url}/feeds/feed{i}.xml{query}' for i in range(feed_count)]
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._runner = aiohttp.web.AppRunner(self._make_app(), access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = aiohttp.web.TCPSite(self._runner, '127.0.0.1', 0)
+            self._loop.run_until_complete(site.start())
+            port = self._runner.addresses[0][1]
+            self.base_url = f'http://127.0.0.1:{port}'
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        # The server runs on its own loop so that it does not add to the lag measured on the client's loop
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self) -> 'MockPodcastServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
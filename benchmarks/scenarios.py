@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import logging
+import subprocess
+import sys
+import tempfile
+import xml.sax.saxutils
+from pathlib import Path
+
+import aiohttp
+
+from benchmarks.measure import EventLoopLagMonitor, Timer, get_peak_rss
+from benchmarks.mock_server import MockPodcastServer, make_payload
+from podcastdownloader.__main__ import download_episodes, open_download_index
+from podcastdownloader.episode import Episode
+from podcastdownloader.feed_cache import FeedCache
+from podcastdownloader.podcast import Podcast
+from podcastdownloader.tag_engine import TagEngine
+from podcastdownloader.utility_functions import load_feeds_from_opml, load_feeds_from_text_file
+from podcastdownloader.writer import PLAYLIST_FORMATS, write_episode_playlist
+
+logger = logging.getLogger(__name__)
+
+
+async def _fill_feed(url: str, cache: FeedCache) -> Podcast:
+    podcast = Podcast(url)
+    async with aiohttp.ClientSession() as session:
+        await podcast.download_feed(session, cache)
+    return podcast
+
+
+def benchmark_feed_parsing(entry_count: int, latency: float) -> dict:
+    with MockPodcastServer(entry_count=entry_count, latency=latency) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        url = server.feed_urls(1)[0]
+        cache = FeedCache(Path(directory))
+
+        async def run() -> dict:
+            async with EventLoopLagMonitor() as monitor:
+                with Timer() as full_timer:
+                    podcast = await _fill_feed(url, cache)
+                with Timer() as cached_timer:
+                    await _fill_feed(url, cache)
+                result = await monitor.stop()
+            result.update({
+                'entries': len(podcast.episodes),
+                'wall_time': full_timer.elapsed,
+                'entries_per_second': len(podcast.episodes) / full_timer.elapsed,
+                'not_modified_wall_time': cached_timer.elapsed,
+            })
+            return result
+        return asyncio.run(run())
+
+
+def benchmark_download(
+        feed_count: int,
+        entry_count: int,
+        media_size: int,
+        latency: float,
+        bandwidth: int,
+        throttle_every: int,
+        threads: int,
+) -> dict:
+    with MockPodcastServer(
+            entry_count=entry_count,
+            media_size=media_size,
+            latency=latency,
+            bandwidth=bandwidth or None,
+            throttle_every=throttle_every,
+    ) as server, tempfile.TemporaryDirectory() as directory:
+        destination = Path(directory)
+
+        async def run() -> dict:
+            with open_download_index(destination) as download_index:
+                async with EventLoopLagMonitor() as monitor:
+                    with Timer() as timer:
+                        await download_episodes(
+                            set(server.feed_urls(feed_count)),
+                            destination,
+                            threads,
+                            (),
+                            None,
+                            download_index=download_index,
+                        )
+                    result = await monitor.stop()
+            total_bytes = sum(f.stat().st_size for f in destination.glob('*/*.mp3'))
+            result.update({
+                'episodes': feed_count * entry_count,
+                'bytes': total_bytes,
+                'wall_time': timer.elapsed,
+                'throughput_bytes_per_second': total_bytes / timer.elapsed,
+                'requests': dict(server.request_counts),
+            })
+            return result
+        return asyncio.run(run())
+
+
+def benchmark_tagging(file_count: int, media_size: int) -> dict:
+    result = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for media_format in ('mp3', 'm4a'):
+            episodes = []
+            for i in range(file_count):
+                episode = Episode(f'Episode {i}', '', 'Benchmark', summary='Show notes ' * 50)
+                episode.file_path = Path(directory, f'{i}.{media_format}')
+                episode.file_path.write_bytes(make_payload(media_format, media_size))
+                episodes.append(episode)
+            with Timer() as first_timer:
+                [TagEngine.tag_episode(e) for e in episodes]
+            with Timer() as repeat_timer:
+                [TagEngine.tag_episode(e) for e in episodes]
+            result[media_format] = {
+                'files': file_count,
+                'wall_time': first_timer.elapsed,
+                'files_per_second': file_count / first_timer.elapsed,
+                'unchanged_wall_time': repeat_timer.elapsed,
+            }
+    return result
+
+
+def benchmark_writer(entry_count: int, repeats: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        podcast = Podcast('')
+        podcast.name = 'Benchmark'
+        for i in range(entry_count):
+            episode = Episode(f'Episode {i}', '', podcast.name, duration=3600)
+            episode.file_path = Path(directory, podcast.name, f'Episode {i}.mp3')
+            podcast.episodes.append(episode)
+        Path(directory, podcast.name).mkdir()
+        [episode.file_path.touch() for episode in podcast.episodes]
+        result = {}
+        for playlist_format in PLAYLIST_FORMATS:
+            with Timer() as first_timer:
+                write_episode_playlist(podcast, (playlist_format,))
+            with Timer() as timer:
+                for _ in range(repeats):
+                    write_episode_playlist(podcast, (playlist_format,))
+            result[playlist_format] = {
+                'entries': entry_count,
+                'wall_time': first_timer.elapsed,
+                'unchanged_wall_time': timer.elapsed / repeats,
+            }
+    return result
+
+
+def benchmark_feed_list(entry_count: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        urls = [f'https://feeds.example.com/{i}/feed.rss' for i in range(entry_count)]
+        text_file = Path(directory, 'feeds.txt')
+        text_file.write_text(''.join(f'{url} # Podcast {i}\n' for i, url in enumerate(urls)))
+        opml_file = Path(directory, 'feeds.opml')
+        outlines = ''.join(
+            f'<outline text="Podcast {i}" type="rss" xmlUrl={xml.sax.saxutils.quoteattr(url)}/>\n'
+            for i, url in enumerate(urls))
+        opml_file.write_text(f'<opml version="2.0"><body><outline text="Podcasts">\n{outlines}</outline></body></opml>')
+        with Timer() as text_timer:
+            text_feeds = load_feeds_from_text_file((str(text_file),))
+        with Timer() as opml_timer:
+            opml_feeds = load_feeds_from_opml((str(opml_file),))
+    return {
+        'entries': entry_count,
+        'text_feeds': len(text_feeds),
+        'text_wall_time': text_timer.elapsed,
+        'opml_feeds': len(opml_feeds),
+        'opml_wall_time': opml_timer.elapsed,
+    }
+
+
+def benchmark_startup(repeats: int) -> dict:
+    with Timer() as timer:
+        for _ in range(repeats):
+            subprocess.run([sys.executable, '-m', 'podcastdownloader', '--help'], capture_output=True, check=True)
+    return {'help_wall_time': timer.elapsed / repeats}
+
+
+def run_isolated(scenario: str, parameters: dict) -> dict:
+    result = scenarios[scenario](**parameters)
+    result['peak_rss'] = get_peak_rss()
+    return result
+
+
+scenarios = {
+    'feed_parsing': benchmark_feed_parsing,
+    'download': benchmark_download,
+    'tagging': benchmark_tagging,
+    'writer': benchmark_writer,
+    'feed_list': benchmark_feed_list,
+    'startup': benchmark_startup,
+}
@@ -1,21 +1,48 @@
 #!/usr/bin/env python3
 
 import asyncio
+import collections
+import contextlib
+import functools
+import heapq
 import itertools
+import json
 import logging
-import random
+import multiprocessing
+import signal
 import sys
+import time
 from asyncio.queues import Queue
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Optional
+from typing import Awaitable, Callable, Collection, Optional, Union
 
 import aiohttp
 import click
 
 import podcastdownloader.utility_functions as util
-from podcastdownloader.exceptions import EpisodeException, PodcastException
+from podcastdownloader.admission import AdmissionController, parse_bandwidth, parse_bandwidth_schedule, parse_size
+from podcastdownloader.connection import ConnectionSettings
+from podcastdownloader.deduplicator import Deduplicator
+from podcastdownloader.download_index import DownloadIndex
+from podcastdownloader.episode import DEFAULT_CHUNK_SIZE, Episode, ExtensionLookups
+from podcastdownloader.exceptions import (
+    EpisodeException,
+    InsufficientSpaceException,
+    PodcastException,
+    RetryableEpisodeException,
+    TagEngineError,
+)
+from podcastdownloader.feed_cache import FeedCache
+from podcastdownloader.metrics import Metrics, MetricsReporter, ThroughputHistory, format_size
+from podcastdownloader.planner import DownloadPlan
 from podcastdownloader.podcast import Podcast
-from podcastdownloader.writer import write_episode_playlist
+from podcastdownloader.poll_schedule import PollSchedule
+from podcastdownloader.resolution_cache import ResolutionCache
+from podcastdownloader.scheduler import SCHEDULING_POLICIES, DownloadScheduler
+from podcastdownloader.sharding import EpisodeLocks, Shard, parse_shard
+from podcastdownloader.verifier import EpisodeVerifier
+from podcastdownloader.writer import PLAYLIST_FORMATS, PlaylistWriter
 
 logger = logging.getLogger()
 
@@ -42,42 +69,417 @@ _common_options = [
     click.option('--opml', type=str, multiple=True, default=[]),
 ]
 
+_feed_stage_options = [
+    click.option('-t', '--threads', type=int, default=10),
+    click.option('--no-feed-cache', is_flag=True, default=False),
+    click.option('--clear-feed-cache', is_flag=True, default=False),
+    click.option('-p', '--pool-size', type=click.IntRange(min=1), default=None),
+    click.option('--rebuild-index', is_flag=True, default=False),
+    click.option('--no-redirect-cache', is_flag=True, default=False),
+    click.option('--redirect-cache-ttl', type=click.FloatRange(min=0), default=86400),
+    click.option('--redirect-cache-size', type=click.IntRange(min=1), default=100000),
+]
 
-async def fill_individual_feed(in_queue: Queue, out_queue: Queue, destination: Path, session: aiohttp.ClientSession):
-    while not in_queue.empty():
-        podcast = await in_queue.get()
-        if podcast is None:
-            break
-        logger.debug(f'Beginning retrieval for {podcast.url}')
-        try:
-            await podcast.download_feed(session)
-            for episode in podcast.episodes:
-                try:
-                    await episode.calculate_path(destination, session)
-                except TypeError:
-                    logger.error(f'Failed to parse {episode.title} in {episode.podcast_name}')
-        except PodcastException as e:
-            logger.error(e)
-        except Exception:
-            logger.critical(f'Error with {podcast.url}')
-            raise
-        else:
-            await out_queue.put(podcast)
-            logger.info(f'Retrieved RSS for {podcast.name}')
+
+def _parse_size_option(_context: click.Context, _parameter: click.Parameter, value: Optional[str]) -> Optional[int]:
+    try:
+        return parse_size(value) if value is not None else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _parse_bandwidth_option(
+        _context: click.Context,
+        _parameter: click.Parameter,
+        value: Optional[str],
+) -> Optional[int]:
+    try:
+        return parse_bandwidth(value) if value is not None else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _parse_schedule_option(_context: click.Context, _parameter: click.Parameter, value: tuple[str]) -> list:
+    try:
+        return parse_bandwidth_schedule(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _parse_shard_option(_context: click.Context, _parameter: click.Parameter, value: Optional[str]) -> Shard:
+    try:
+        return parse_shard(value) if value is not None else Shard()
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+_transfer_options = [
+    click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE),
+    click.option('--max-attempts', type=click.IntRange(min=1), default=10),
+    click.option('--max-host-connections', type=click.IntRange(min=1), default=4),
+    click.option('--host-rate-limit', type=click.FloatRange(min=0, min_open=True), default=None),
+]
+
+_download_stage_options = [
+    click.option('-l', '--limit', type=int, default=None),
+    click.option('-w', '--write-playlist', type=click.Choice(PLAYLIST_FORMATS), default=(), multiple=True),
+    *_transfer_options,
+    click.option('--priority', type=click.Choice(SCHEDULING_POLICIES), default='newest'),
+    click.option('--process-pool', is_flag=True, default=False),
+    click.option('-s', '--suppress-progress', is_flag=True, default=False),
+    click.option('--stats-file', type=str, default=None),
+    click.option('--stats-interval', type=click.FloatRange(min=0, min_open=True), default=10),
+    click.option('--metrics-port', type=click.IntRange(min=0, max=65535), default=None),
+    click.option('--min-free-space', type=str, default='0', callback=_parse_size_option),
+    click.option('--bandwidth-limit', type=str, default=None, callback=_parse_bandwidth_option),
+    click.option('--bandwidth-schedule', type=str, multiple=True, default=(), callback=_parse_schedule_option),
+    click.option('--no-deduplicate', is_flag=True, default=False),
+]
+
+_shard_options = [
+    click.option('--shard', type=str, default=None, callback=_parse_shard_option),
+    click.option('--processes', type=click.IntRange(min=1), default=1),
+]
+
+_connection_options = [
+    click.option('--connection-limit', type=click.IntRange(min=1), default=100),
+    click.option('--connection-limit-per-host', type=click.IntRange(min=0), default=0),
+    click.option('--keepalive-timeout', type=click.FloatRange(min=0), default=30),
+    click.option('--dns-cache-ttl', type=click.IntRange(min=0), default=300),
+    click.option('--connect-timeout', type=click.FloatRange(min=0, min_open=True), default=30),
+    click.option('--read-timeout', type=click.FloatRange(min=0, min_open=True), default=60),
+    click.option('--total-timeout', type=click.FloatRange(min=0, min_open=True), default=None),
+]
+
+
+async def fill_podcast(
+    podcast: Podcast,
+    destination: Path,
+    session: aiohttp.ClientSession,
+    feed_cache: Optional[FeedCache],
+    limit: Optional[int],
+    executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+    resolutions: Optional[ResolutionCache] = None,
+    offline_paths: bool = False,
+    extension_lookups: Optional[ExtensionLookups] = None,
+) -> bool:
+    logger.debug(f'Beginning retrieval for {podcast.url}')
+    try:
+        await podcast.download_feed(session, feed_cache, executor, limit, metrics)
+        unresolved = [episode for episode in podcast.episodes if not episode.file_path]
+        with metrics.timed('path_resolution') if metrics else contextlib.nullcontext():
+            if offline_paths:
+                # Paths are only guessed from what is already known, so that no media server is contacted
+                results = []
+                for episode in unresolved:
+                    try:
+                        results.append(episode.guess_path(destination, resolutions))
+                    except TypeError as e:
+                        results.append(e)
+            else:
+                results = await asyncio.gather(
+                    *[episode.calculate_path(destination, session, resolutions, extension_lookups)
+                      for episode in unresolved],
+                    return_exceptions=True,
+                )
+        for episode, result in zip(unresolved, results):
+            if isinstance(result, TypeError):
+                logger.error(f'Failed to parse {episode.title} in {episode.podcast_name}')
+            elif isinstance(result, EpisodeException):
+                logger.error(result)
+            elif isinstance(result, BaseException):
+                raise result
+    except PodcastException as e:
+        logger.error(e)
+        if metrics:
+            metrics.increment('feeds_failed')
+        return False
+    except Exception:
+        logger.critical(f'Error with {podcast.url}')
+        raise
+    logger.info(f'Retrieved RSS for {podcast.name}')
+    if metrics:
+        metrics.increment('feeds_filled')
+    return True
+
+
+async def fill_individual_feed(
+    in_queue: Queue,
+    destination: Path,
+    session: aiohttp.ClientSession,
+    feed_cache: Optional[FeedCache],
+    limit: Optional[int],
+    on_filled: Callable[[Podcast], Awaitable[None]],
+    executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+    resolutions: Optional[ResolutionCache] = None,
+    offline_paths: bool = False,
+    extension_lookups: Optional[ExtensionLookups] = None,
+):
+    while (podcast := await in_queue.get()) is not None:
+        if await fill_podcast(
+                podcast,
+                destination,
+                session,
+                feed_cache,
+                limit,
+                executor,
+                metrics,
+                resolutions,
+                offline_paths,
+                extension_lookups,
+        ):
+            await on_filled(podcast)
         in_queue.task_done()
+    in_queue.task_done()
+
+
+def find_missing_episodes(episodes: list[Episode], download_index: Optional[DownloadIndex]) -> list[Episode]:
+    if download_index is None:
+        return [e for e in episodes if not e.file_path or not e.file_path.exists()]
+    present = download_index.lookup(episodes)
+    for episode, file_path in present.items():
+        episode.file_path = file_path
+    return [e for e in episodes if e not in present]
+
+
+async def queue_podcast_episodes(
+    podcast: Podcast,
+    scheduler: DownloadScheduler,
+    playlist_writer: PlaylistWriter,
+    download_index: Optional[DownloadIndex] = None,
+    feed_weights: Optional[dict[str, float]] = None,
+):
+    if feed_weights and podcast.url in feed_weights:
+        scheduler.set_weight(podcast.name, feed_weights[podcast.url])
+    # Episodes whose path could not be calculated have already been reported while filling the podcast
+    unfilled_episodes = find_missing_episodes([e for e in podcast.episodes if e.file_path], download_index)
+    playlist_writer.add_podcast(podcast, unfilled_episodes)
+    logger.info(f'{len(unfilled_episodes)} episodes to download from {podcast.name}')
+    for episode in unfilled_episodes:
+        scheduler.put(episode)
 
 
-async def download_individual_episode(in_queue: Queue, session: aiohttp.ClientSession):
-    while not in_queue.empty():
-        episode = await in_queue.get()
-        if episode is None:
-            break
+async def fetch_episode(
+    episode: Episode,
+    session: aiohttp.ClientSession,
+    chunk_size: int,
+    executor: Optional[Executor],
+    metrics: Metrics,
+    admission: Optional[AdmissionController] = None,
+    deduplicator: Optional[Deduplicator] = None,
+    resolutions: Optional[ResolutionCache] = None,
+    overwrite: bool = False,
+):
+    if deduplicator and (copy := deduplicator.find_copy(episode)):
+        source, episode.content_hash = copy
+        try:
+            # A hardlink shares its tags with the original file, so it is only used when those are already correct
+            method = deduplicator.link(
+                source,
+                episode.file_path,
+                allow_hardlink=await episode.has_tags_of(source, executor),
+                reserve=functools.partial(admission.reserve, episode) if admission else None,
+            )
+        finally:
+            if admission:
+                admission.release(episode)
+        logger.info(f'Stored {episode.title} in podcast {episode.podcast_name} as a {method} of {source}')
+        if method != 'hardlink':
+            await episode.tag(executor, metrics)
+    else:
+        await episode.download(session, chunk_size, executor, metrics, admission, resolutions, overwrite)
+        if not deduplicator or not (source := deduplicator.find_identical(episode)):
+            method = None
+        elif method := deduplicator.link(
+                source,
+                episode.file_path,
+                allow_copy=False,
+                allow_hardlink=await episode.has_tags_of(source, executor),
+        ):
+            logger.info(f'Replaced {episode.title} in podcast {episode.podcast_name} with a {method} of {source}')
+            if method == 'reflink':
+                await episode.tag(executor, metrics)
+    if deduplicator:
+        deduplicator.record(episode)
+        if method and method != 'copy':
+            metrics.increment('episodes_deduplicated')
+            metrics.increment('bytes_deduplicated', episode.file_path.stat().st_size)
+
+
+async def download_individual_episode(
+    scheduler: DownloadScheduler,
+    session: aiohttp.ClientSession,
+    chunk_size: int,
+    executor: Optional[Executor] = None,
+    download_index: Optional[DownloadIndex] = None,
+    metrics: Optional[Metrics] = None,
+    on_finished: Optional[Callable[[Episode], None]] = None,
+    admission: Optional[AdmissionController] = None,
+    deduplicator: Optional[Deduplicator] = None,
+    episode_locks: Optional[EpisodeLocks] = None,
+    resolutions: Optional[ResolutionCache] = None,
+    overwrite: bool = False,
+):
+    metrics = metrics or Metrics()
+    while (episode := await scheduler.get()) is not None:
         logger.debug(f'Attempting download of episode {episode.title} in {episode.podcast_name}')
         try:
-            await episode.download(session)
+            with episode_locks.hold(episode) if episode_locks else contextlib.nullcontext(True) as held:
+                if not held:
+                    logger.info(
+                        f'Skipping {episode.title} in {episode.podcast_name}, another process is downloading it')
+                    metrics.increment('episodes_skipped')
+                elif episode_locks and episode.file_path.exists():
+                    # Another process finished the episode after it was queued here
+                    logger.debug(f'{episode.title} in {episode.podcast_name} was downloaded by another process')
+                    if download_index:
+                        download_index.add(episode)
+                    metrics.increment('episodes_skipped')
+                else:
+                    with metrics.active_worker():
+                        await fetch_episode(
+                            episode,
+                            session,
+                            chunk_size,
+                            executor,
+                            metrics,
+                            admission,
+                            deduplicator,
+                            resolutions,
+                            overwrite,
+                        )
+                    if download_index:
+                        download_index.add(episode)
+                    metrics.increment('episodes_downloaded')
+        except RetryableEpisodeException as e:
+            if scheduler.retry(episode, e.retry_after):
+                logger.warning(f'{e}, will retry')
+                metrics.increment('retries')
+                continue
+            logger.error(f'{e}, giving up after {scheduler.max_attempts} attempts')
+            metrics.increment('episodes_failed')
+        except InsufficientSpaceException as e:
+            logger.error(e)
+            metrics.increment('episodes_skipped')
         except EpisodeException as e:
             logger.error(e)
-        in_queue.task_done()
+            metrics.increment('episodes_failed')
+        finally:
+            scheduler.task_done(episode)
+        if on_finished:
+            on_finished(episode)
+
+
+def open_download_index(destination: Path, rebuild: bool = False) -> DownloadIndex:
+    download_index = DownloadIndex(Path(util.get_state_directory(destination), 'index.sqlite'), destination)
+    if rebuild or download_index.is_empty():
+        logger.info('Scanning destination to build the download index')
+        download_index.rebuild()
+    return download_index
+
+
+async def fill_feeds(
+    all_feeds: Collection[str],
+    destination: Path,
+    session: aiohttp.ClientSession,
+    threads: int,
+    feed_cache: Optional[FeedCache],
+    limit: Optional[int],
+    on_filled: Callable[[Podcast], Awaitable[None]],
+    executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+    resolutions: Optional[ResolutionCache] = None,
+    offline_paths: bool = False,
+):
+    unfilled_podcasts = Queue()
+    [unfilled_podcasts.put_nowait(Podcast(url)) for url in all_feeds]
+    [unfilled_podcasts.put_nowait(None) for _ in range(threads)]
+    extension_lookups = ExtensionLookups()
+    if metrics:
+        metrics.register_gauge('feeds_queued', unfilled_podcasts.qsize)
+    feed_fillers = [asyncio.create_task(fill_individual_feed(
+        unfilled_podcasts,
+        destination,
+        session,
+        feed_cache,
+        limit,
+        on_filled,
+        executor,
+        metrics,
+        resolutions,
+        offline_paths,
+        extension_lookups,
+    )) for _ in range(threads)]
+    await asyncio.gather(*feed_fillers)
+    logger.info('All feeds filled')
+
+
+def _prepare_destination(destination: str) -> Path:
+    destination = Path(destination).expanduser().resolve()
+    if not destination.exists():
+        logger.warning(f'Specified destination {destination} does not exist, creating it now')
+        destination.mkdir(parents=True)
+    return destination
+
+
+def _open_feed_cache(destination: Path, no_feed_cache: bool, clear_feed_cache: bool) -> Optional[FeedCache]:
+    feed_cache = FeedCache(Path(util.get_state_directory(destination), 'feeds'))
+    if clear_feed_cache:
+        feed_cache.clear()
+    return None if no_feed_cache else feed_cache
+
+
+def _open_resolution_cache(
+    destination: Path,
+    no_redirect_cache: bool,
+    redirect_cache_ttl: float,
+    redirect_cache_size: int,
+) -> Union[ResolutionCache, contextlib.nullcontext]:
+    if no_redirect_cache:
+        return contextlib.nullcontext()
+    database_path = Path(util.get_state_directory(destination), 'redirects.sqlite')
+    return ResolutionCache(database_path, redirect_cache_ttl, redirect_cache_size)
+
+
+def _get_throughput_history(destination: Path) -> ThroughputHistory:
+    return ThroughputHistory(Path(util.get_state_directory(destination), 'throughput.json'))
+
+
+def _load_all_feeds(
+    feed: tuple[str],
+    file: tuple[str],
+    opml: tuple[str],
+    shard: Optional[Shard] = None,
+) -> dict[str, dict[str, str]]:
+    # Feeds from an OPML file keep the attributes of their outline
+    all_feeds = util.load_feeds_from_opml(opml)
+    for url in itertools.chain(feed, util.load_feeds_from_text_file(file)):
+        all_feeds.setdefault(url, {})
+    if shard and shard.is_partial:
+        total = len(all_feeds)
+        all_feeds = shard.select(all_feeds)
+        logger.info(f'{len(all_feeds)} of {total} feeds found in shard {shard}')
+    else:
+        logger.info(f'{len(all_feeds)} feeds found')
+    return all_feeds
+
+
+def _create_metrics_reporter(
+    metrics: Metrics,
+    suppress_progress: bool,
+    stats_file: Optional[str],
+    stats_interval: float,
+    metrics_port: Optional[int],
+) -> MetricsReporter:
+    return MetricsReporter(
+        metrics,
+        show_progress=not suppress_progress and sys.stderr.isatty(),
+        stats_file=Path(stats_file).expanduser() if stats_file else None,
+        stats_interval=stats_interval,
+        metrics_port=metrics_port,
+    )
 
 
 def add_common_options(func):
@@ -86,87 +488,857 @@ def add_common_options(func):
     return func
 
 
+def add_feed_stage_options(func):
+    for option in _feed_stage_options:
+        func = option(func)
+    return func
+
+
+def add_download_stage_options(func):
+    for option in _download_stage_options:
+        func = option(func)
+    return func
+
+
+def add_transfer_options(func):
+    for option in _transfer_options:
+        func = option(func)
+    return func
+
+
+def add_connection_options(func):
+    @functools.wraps(func)
+    def wrapper(
+            *args,
+            connection_limit: int,
+            connection_limit_per_host: int,
+            keepalive_timeout: float,
+            dns_cache_ttl: int,
+            connect_timeout: float,
+            read_timeout: float,
+            total_timeout: Optional[float],
+            **kwargs,
+    ):
+        connection_settings = ConnectionSettings(
+            connection_limit,
+            connection_limit_per_host,
+            keepalive_timeout,
+            dns_cache_ttl,
+            connect_timeout,
+            read_timeout,
+            total_timeout,
+        )
+        return func(*args, connection_settings=connection_settings, **kwargs)
+    for option in _connection_options:
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def _run_command_worker(command_name: str, kwargs: dict, transferred: multiprocessing.SimpleQueue):
+    # A forked worker inherits the coordinator's handlers, and the command sets up its own
+    logger.handlers.clear()
+    # Commands that download return the number of bytes they transferred
+    if (byte_count := cli.commands[command_name].callback(**kwargs)) is not None:
+        transferred.put(byte_count)
+
+
+def _prepare_worker_arguments(kwargs: dict, worker_index: int) -> dict:
+    result = dict(kwargs)
+    # The state shared between workers is prepared once by the coordinator instead
+    result.update(clear_feed_cache=False, rebuild_index=False, suppress_progress=True)
+    if result.get('stats_file'):
+        stats_file = Path(result['stats_file'])
+        result['stats_file'] = str(stats_file.with_name(f'{stats_file.stem}.{worker_index + 1}{stats_file.suffix}'))
+    if result.get('metrics_port'):
+        result['metrics_port'] += worker_index
+    return result
+
+
+def _coordinate_workers(command_name: str, shard: Shard, processes: int, kwargs: dict) -> bool:
+    _setup_logging(kwargs['verbose'])
+    destination = _prepare_destination(kwargs['destination'])
+    _open_feed_cache(destination, False, kwargs['clear_feed_cache'])
+    # Otherwise every worker would find the same empty index and scan the destination into it at once
+    open_download_index(destination, kwargs['rebuild_index']).close()
+    workers = []
+    transferred = multiprocessing.SimpleQueue()
+    start_time = time.monotonic()
+    for worker_index in range(processes):
+        worker_kwargs = _prepare_worker_arguments(kwargs, worker_index)
+        worker_kwargs.update(shard=shard.for_worker(worker_index, processes), processes=1)
+        worker = multiprocessing.Process(target=_run_command_worker, args=(command_name, worker_kwargs, transferred))
+        worker.start()
+        logger.info(f'Started worker {worker.pid} for shard {worker_kwargs["shard"]}')
+        workers.append(worker)
+
+    def stop_workers(_signal_number: int, _frame):
+        for running_worker in workers:
+            running_worker.terminate()
+    previous_handler = signal.signal(signal.SIGTERM, stop_workers)
+    try:
+        for worker in workers:
+            while True:
+                try:
+                    worker.join()
+                    break
+                except KeyboardInterrupt:
+                    # The workers receive the interrupt as well and stop by themselves
+                    continue
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+    byte_counts = []
+    while not transferred.empty():
+        byte_counts.append(transferred.get())
+    # The workers ran side by side, so their combined rate is what a later run on this machine can expect
+    if byte_counts:
+        _get_throughput_history(destination).record(sum(byte_counts), time.monotonic() - start_time)
+    failed = [worker for worker in workers if worker.exitcode != 0]
+    for worker in failed:
+        logger.error(f'Worker {worker.pid} exited with code {worker.exitcode}')
+    return not failed
+
+
+def add_shard_options(func):
+    @functools.wraps(func)
+    def wrapper(*args, processes: int, shard: Shard, **kwargs):
+        if processes == 1:
+            return func(*args, shard=shard, **kwargs)
+        command_name = click.get_current_context().info_name
+        if not _coordinate_workers(command_name, shard, processes, kwargs):
+            sys.exit(1)
+    for option in _shard_options:
+        wrapper = option(wrapper)
+    return wrapper
+
+
 @click.group()
 def cli():
     pass
 
 
 @cli.command('download')
+@add_shard_options
 @add_common_options
-@click.option('-l', '--limit', type=int, default=None)
-@click.option('-t', '--threads', type=int, default=10)
-@click.option('-w', '--write-playlist', type=click.Choice(('m3u',)), default=(), multiple=True)
+@add_feed_stage_options
+@add_connection_options
+@add_download_stage_options
 def cli_download(
+        bandwidth_limit: Optional[int],
+        bandwidth_schedule: list,
+        chunk_size: int,
+        clear_feed_cache: bool,
+        connection_settings: ConnectionSettings,
         destination: str,
         feed: tuple[str],
         file: tuple[str],
+        host_rate_limit: Optional[float],
         limit: Optional[int],
+        max_attempts: int,
+        max_host_connections: int,
+        metrics_port: Optional[int],
+        min_free_space: int,
+        no_deduplicate: bool,
+        no_feed_cache: bool,
+        no_redirect_cache: bool,
         opml: tuple[str],
+        pool_size: Optional[int],
+        priority: str,
+        process_pool: bool,
+        rebuild_index: bool,
+        redirect_cache_size: int,
+        redirect_cache_ttl: float,
+        shard: Shard,
+        stats_file: Optional[str],
+        stats_interval: float,
+        suppress_progress: bool,
         threads: int,
         verbose: int,
         write_playlist: tuple[str],
 ):
     _setup_logging(verbose)
-    destination = Path(destination).expanduser().resolve()
-    if not destination.exists():
-        logger.warning(f'Specified destination {destination} does not exist, creating it now')
-        destination.mkdir(parents=True)
-
-    all_feeds = set(itertools.chain(feed, util.load_feeds_from_text_file(file), util.load_feeds_from_opml(opml)))
-    logger.info(f'{len(all_feeds)} feeds found')
+    destination = _prepare_destination(destination)
+    feed_cache = _open_feed_cache(destination, no_feed_cache, clear_feed_cache)
+    all_feeds = _load_all_feeds(feed, file, opml, shard)
+    bytes_transferred = None
     if all_feeds:
-        asyncio.run(download_episodes(all_feeds, destination, threads, write_playlist, limit))
+        with util.create_executor(pool_size, process_pool) as executor, \
+                open_download_index(destination, rebuild_index) as download_index, \
+                _open_resolution_cache(
+                    destination, no_redirect_cache, redirect_cache_ttl, redirect_cache_size) as resolutions:
+            metrics = Metrics()
+            reporter = _create_metrics_reporter(metrics, suppress_progress, stats_file, stats_interval, metrics_port)
+            asyncio.run(reporter.run(download_episodes(
+                all_feeds,
+                destination,
+                threads,
+                write_playlist,
+                limit,
+                chunk_size=chunk_size,
+                feed_cache=feed_cache,
+                max_attempts=max_attempts,
+                max_host_connections=max_host_connections,
+                host_rate_limit=host_rate_limit,
+                executor=executor,
+                download_index=download_index,
+                metrics=metrics,
+                connection_settings=connection_settings,
+                resolutions=resolutions,
+                admission=AdmissionController(destination, min_free_space, bandwidth_limit, bandwidth_schedule),
+                deduplicator=None if no_deduplicate else Deduplicator(download_index),
+                priority=priority,
+                feed_weights=util.get_feed_weights(all_feeds),
+            )))
+            # Workers started with --processes leave the recording to the coordinator, which sees all of them
+            if shard.worker_count == 1:
+                _get_throughput_history(destination).record(
+                    metrics.bytes_total, time.monotonic() - metrics.start_time)
+            bytes_transferred = metrics.bytes_total
     else:
         logger.error('No feeds have been provided')
     logger.info('Program Complete')
+    return bytes_transferred
+
+
+def log_deduplication_report(deduplicator: Deduplicator):
+    counts = deduplicator.link_counts
+    if counts:
+        logger.info(
+            f'{counts["reflink"]} duplicate episodes stored as reflinks, {counts["hardlink"]} as hardlinks, and '
+            f'{counts["copy"]} copied, saving {format_size(deduplicator.bytes_saved)}')
 
 
 async def download_episodes(
-    all_feeds: set[str],
+    all_feeds: Collection[str],
     destination: Path,
     threads: int,
     playlist_formats: tuple[str],
     limit: Optional[int],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    feed_cache: Optional[FeedCache] = None,
+    max_attempts: int = 10,
+    max_host_connections: int = 4,
+    host_rate_limit: Optional[float] = None,
+    executor: Optional[Executor] = None,
+    download_index: Optional[DownloadIndex] = None,
+    metrics: Optional[Metrics] = None,
+    connection_settings: Optional[ConnectionSettings] = None,
+    admission: Optional[AdmissionController] = None,
+    deduplicator: Optional[Deduplicator] = None,
+    priority: str = 'newest',
+    feed_weights: Optional[dict[str, float]] = None,
+    resolutions: Optional[ResolutionCache] = None,
 ):
-    unfilled_podcasts = Queue()
-    filled_podcasts = Queue()
-    episodes = Queue()
-    [await unfilled_podcasts.put(Podcast(url)) for url in all_feeds]
-    async with aiohttp.ClientSession() as session:
-        feed_fillers = [asyncio.create_task(
-            fill_individual_feed(unfilled_podcasts, filled_podcasts, destination, session)
-        ) for _ in range(1, threads)]
-        await asyncio.gather(*feed_fillers)
-        await unfilled_podcasts.join()
-        logger.info('All feeds filled')
-
-        podcasts = []
-        while not filled_podcasts.empty():
-            podcast = filled_podcasts.get_nowait()
-            write_episode_playlist(podcast, playlist_formats)
-            podcasts.append(podcast)
-
-        if limit:
-            logger.info(f'Limiting episodes per podcast to {limit} entries')
-            for podcast in podcasts:
-                podcast.episodes = podcast.episodes[:limit]
-
-        unfilled_episodes = list(filter(
-            lambda e: not e.file_path or not e.file_path.exists(),
-            [ep for pod in podcasts for ep in pod.episodes],
-        ))
-        logger.info(f'{len(unfilled_episodes)} episodes to download')
-
-        random.shuffle(unfilled_episodes)
-
-        [await episodes.put(ep) for ep in unfilled_episodes]
-
-        episode_downloaders = [asyncio.create_task(
-            download_individual_episode(episodes, session)
-        ) for _ in range(1, threads)]
-
+    scheduler = DownloadScheduler(max_host_connections, host_rate_limit, max_attempts, policy=priority)
+    episode_locks = EpisodeLocks(Path(util.get_state_directory(destination), 'episodes.lock'))
+    playlist_writer = PlaylistWriter(playlist_formats)
+    if metrics:
+        metrics.register_gauge('episodes_queued', lambda: scheduler.pending_count)
+    on_filled = functools.partial(
+        queue_podcast_episodes,
+        scheduler=scheduler,
+        playlist_writer=playlist_writer,
+        download_index=download_index,
+        feed_weights=feed_weights,
+    )
+    async with (connection_settings or ConnectionSettings()).create_session(metrics) as session:
+        episode_downloaders = [asyncio.create_task(download_individual_episode(
+            scheduler,
+            session,
+            chunk_size,
+            executor,
+            download_index,
+            metrics,
+            playlist_writer.finish_episode,
+            admission,
+            deduplicator,
+            episode_locks,
+            resolutions,
+        )) for _ in range(threads)]
+        await fill_feeds(
+            all_feeds, destination, session, threads, feed_cache, limit, on_filled, executor, metrics, resolutions)
+        scheduler.close()
         await asyncio.gather(*episode_downloaders)
-        await episodes.join()
+    episode_locks.close()
+    if deduplicator:
+        log_deduplication_report(deduplicator)
+
+
+@cli.command('watch')
+@add_shard_options
+@add_common_options
+@add_feed_stage_options
+@add_connection_options
+@add_download_stage_options
+@click.option('--min-interval', type=click.FloatRange(min=0, min_open=True), default=900)
+@click.option('--max-interval', type=click.FloatRange(min=0, min_open=True), default=86400)
+def cli_watch(
+        bandwidth_limit: Optional[int],
+        bandwidth_schedule: list,
+        chunk_size: int,
+        clear_feed_cache: bool,
+        connection_settings: ConnectionSettings,
+        destination: str,
+        feed: tuple[str],
+        file: tuple[str],
+        host_rate_limit: Optional[float],
+        limit: Optional[int],
+        max_attempts: int,
+        max_host_connections: int,
+        max_interval: float,
+        metrics_port: Optional[int],
+        min_free_space: int,
+        min_interval: float,
+        no_deduplicate: bool,
+        no_feed_cache: bool,
+        no_redirect_cache: bool,
+        opml: tuple[str],
+        pool_size: Optional[int],
+        priority: str,
+        process_pool: bool,
+        rebuild_index: bool,
+        redirect_cache_size: int,
+        redirect_cache_ttl: float,
+        shard: Shard,
+        stats_file: Optional[str],
+        stats_interval: float,
+        suppress_progress: bool,
+        threads: int,
+        verbose: int,
+        write_playlist: tuple[str],
+):
+    _setup_logging(verbose)
+    destination = _prepare_destination(destination)
+    feed_cache = _open_feed_cache(destination, no_feed_cache, clear_feed_cache)
+    all_feeds = _load_all_feeds(feed, file, opml, shard)
+    if all_feeds:
+        with util.create_executor(pool_size, process_pool) as executor, \
+                open_download_index(destination, rebuild_index) as download_index, \
+                _open_resolution_cache(
+                    destination, no_redirect_cache, redirect_cache_ttl, redirect_cache_size) as resolutions:
+            metrics = Metrics()
+            reporter = _create_metrics_reporter(metrics, suppress_progress, stats_file, stats_interval, metrics_port)
+            try:
+                asyncio.run(reporter.run(watch_feeds(
+                    all_feeds,
+                    destination,
+                    threads,
+                    write_playlist,
+                    limit,
+                    PollSchedule(min_interval, max(min_interval, max_interval)),
+                    chunk_size=chunk_size,
+                    feed_cache=feed_cache,
+                    max_attempts=max_attempts,
+                    max_host_connections=max_host_connections,
+                    host_rate_limit=host_rate_limit,
+                    executor=executor,
+                    download_index=download_index,
+                    metrics=metrics,
+                    connection_settings=connection_settings,
+                    resolutions=resolutions,
+                    admission=AdmissionController(destination, min_free_space, bandwidth_limit, bandwidth_schedule),
+                    deduplicator=None if no_deduplicate else Deduplicator(download_index),
+                    priority=priority,
+                    feed_weights=util.get_feed_weights(all_feeds),
+                )))
+            except KeyboardInterrupt:
+                logger.info('Stopping')
+    else:
+        logger.error('No feeds have been provided')
+    logger.info('Program Complete')
+
+
+async def queue_new_episodes(
+    podcast: Podcast,
+    scheduler: DownloadScheduler,
+    playlist_writer: PlaylistWriter,
+    seen_urls: set[str],
+    download_index: Optional[DownloadIndex] = None,
+    feed_weights: Optional[dict[str, float]] = None,
+):
+    if feed_weights and podcast.url in feed_weights:
+        scheduler.set_weight(podcast.name, feed_weights[podcast.url])
+    new_episodes = [e for e in podcast.episodes if e.file_path and e.url not in seen_urls]
+    if not new_episodes:
+        return
+    seen_urls.update(e.url for e in new_episodes)
+    unfilled_episodes = find_missing_episodes(new_episodes, download_index)
+    playlist_writer.add_podcast(podcast, unfilled_episodes)
+    if unfilled_episodes:
+        logger.info(f'{len(unfilled_episodes)} new episodes to download from {podcast.name}')
+    for episode in unfilled_episodes:
+        scheduler.put(episode)
+
+
+async def watch_feeds(
+    all_feeds: Collection[str],
+    destination: Path,
+    threads: int,
+    playlist_formats: tuple[str],
+    limit: Optional[int],
+    poll_schedule: PollSchedule,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    feed_cache: Optional[FeedCache] = None,
+    max_attempts: int = 10,
+    max_host_connections: int = 4,
+    host_rate_limit: Optional[float] = None,
+    executor: Optional[Executor] = None,
+    download_index: Optional[DownloadIndex] = None,
+    metrics: Optional[Metrics] = None,
+    connection_settings: Optional[ConnectionSettings] = None,
+    admission: Optional[AdmissionController] = None,
+    deduplicator: Optional[Deduplicator] = None,
+    stop_event: Optional[asyncio.Event] = None,
+    priority: str = 'newest',
+    feed_weights: Optional[dict[str, float]] = None,
+    resolutions: Optional[ResolutionCache] = None,
+):
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+    scheduler = DownloadScheduler(max_host_connections, host_rate_limit, max_attempts, policy=priority)
+    episode_locks = EpisodeLocks(Path(util.get_state_directory(destination), 'episodes.lock'))
+    playlist_writer = PlaylistWriter(playlist_formats)
+    podcasts = {url: Podcast(url) for url in all_feeds}
+    seen_urls = {url: set() for url in all_feeds}
+    failures = collections.Counter()
+    due = [(0.0, url) for url in sorted(all_feeds)]
+    polls_changed = asyncio.Event()
+    poll_slots = asyncio.Semaphore(threads)
+    extension_lookups = ExtensionLookups()
+    if metrics:
+        metrics.register_gauge('feeds_queued', lambda: sum(1 for due_time, _ in due if due_time <= time.monotonic()))
+        metrics.register_gauge('episodes_queued', lambda: scheduler.pending_count)
+
+    async def poll_feed(session: aiohttp.ClientSession, url: str):
+        podcast = podcasts[url]
+        try:
+            async with poll_slots:
+                if await fill_podcast(
+                        podcast,
+                        destination,
+                        session,
+                        feed_cache,
+                        limit,
+                        executor,
+                        metrics,
+                        resolutions,
+                        extension_lookups=extension_lookups,
+                ):
+                    failures.pop(url, None)
+                    await queue_new_episodes(
+                        podcast, scheduler, playlist_writer, seen_urls[url], download_index, feed_weights)
+                else:
+                    failures[url] += 1
+        except Exception:
+            # An unexpected error is treated as a failed check, so that the feed is still watched afterwards
+            logger.exception(f'Unexpected error while checking {podcast.name or url}')
+            failures[url] += 1
+        interval = poll_schedule.get_interval(podcast, failures[url])
+        logger.debug(f'Next retrieval of {podcast.name or url} in {interval:.0f} seconds')
+        heapq.heappush(due, (time.monotonic() + interval, url))
+        polls_changed.set()
+
+    async with (connection_settings or ConnectionSettings()).create_session(metrics) as session:
+        episode_downloaders = [asyncio.create_task(download_individual_episode(
+            scheduler,
+            session,
+            chunk_size,
+            executor,
+            download_index,
+            metrics,
+            playlist_writer.finish_episode,
+            admission,
+            deduplicator,
+            episode_locks,
+            resolutions,
+        )) for _ in range(threads)]
+        polls = set()
+        try:
+            while not stop_event.is_set():
+                while due and due[0][0] <= time.monotonic():
+                    _, url = heapq.heappop(due)
+                    poll = asyncio.create_task(poll_feed(session, url))
+                    polls.add(poll)
+                    poll.add_done_callback(polls.discard)
+                polls_changed.clear()
+                timeout = max(0.0, due[0][0] - time.monotonic()) if due else None
+                stop_waiter = asyncio.create_task(stop_event.wait())
+                changed_waiter = asyncio.create_task(polls_changed.wait())
+                await asyncio.wait({stop_waiter, changed_waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                stop_waiter.cancel()
+                changed_waiter.cancel()
+        finally:
+            scheduler.close()
+            for task in itertools.chain(polls, episode_downloaders):
+                task.cancel()
+            await asyncio.gather(*polls, *episode_downloaders, return_exceptions=True)
+            episode_locks.close()
+            if deduplicator:
+                log_deduplication_report(deduplicator)
+
+
+@cli.command('plan')
+@add_common_options
+@add_feed_stage_options
+@add_connection_options
+@click.option('-l', '--limit', type=int, default=None)
+@click.option('--no-deduplicate', is_flag=True, default=False)
+@click.option('--report', type=str, default=None)
+def cli_plan(
+        clear_feed_cache: bool,
+        connection_settings: ConnectionSettings,
+        destination: str,
+        feed: tuple[str],
+        file: tuple[str],
+        limit: Optional[int],
+        no_deduplicate: bool,
+        no_feed_cache: bool,
+        no_redirect_cache: bool,
+        opml: tuple[str],
+        pool_size: Optional[int],
+        rebuild_index: bool,
+        redirect_cache_size: int,
+        redirect_cache_ttl: float,
+        report: Optional[str],
+        threads: int,
+        verbose: int,
+):
+    _setup_logging(verbose)
+    destination = _prepare_destination(destination)
+    feed_cache = _open_feed_cache(destination, no_feed_cache, clear_feed_cache)
+    all_feeds = _load_all_feeds(feed, file, opml)
+    if all_feeds:
+        with util.create_executor(pool_size, False) as executor, \
+                open_download_index(destination, rebuild_index) as download_index, \
+                _open_resolution_cache(
+                    destination, no_redirect_cache, redirect_cache_ttl, redirect_cache_size) as resolutions:
+            plan = asyncio.run(plan_downloads(
+                all_feeds,
+                destination,
+                threads,
+                limit,
+                feed_cache=feed_cache,
+                executor=executor,
+                download_index=download_index,
+                connection_settings=connection_settings,
+                resolutions=resolutions,
+                deduplicator=None if no_deduplicate else Deduplicator(download_index),
+            ))
+        bytes_per_second = _get_throughput_history(destination).get_bytes_per_second()
+        click.echo(plan.format_table(bytes_per_second))
+        if report:
+            report = Path(report).expanduser().resolve()
+            with open(report, 'w') as file:
+                json.dump(plan.to_dict(bytes_per_second), file, indent=2)
+            logger.info(f'Plan written to {report}')
+    else:
+        logger.error('No feeds have been provided')
+    logger.info('Program Complete')
+
+
+async def plan_podcast_episodes(
+    podcast: Podcast,
+    plan: DownloadPlan,
+    download_index: Optional[DownloadIndex] = None,
+):
+    plan.add_podcast(podcast, find_missing_episodes(podcast.episodes, download_index))
+
+
+async def plan_downloads(
+    all_feeds: Collection[str],
+    destination: Path,
+    threads: int,
+    limit: Optional[int],
+    feed_cache: Optional[FeedCache] = None,
+    executor: Optional[Executor] = None,
+    download_index: Optional[DownloadIndex] = None,
+    connection_settings: Optional[ConnectionSettings] = None,
+    resolutions: Optional[ResolutionCache] = None,
+    deduplicator: Optional[Deduplicator] = None,
+) -> DownloadPlan:
+    plan = DownloadPlan(resolutions, deduplicator)
+    on_filled = functools.partial(plan_podcast_episodes, plan=plan, download_index=download_index)
+    async with (connection_settings or ConnectionSettings()).create_session() as session:
+        await fill_feeds(
+            all_feeds,
+            destination,
+            session,
+            threads,
+            feed_cache,
+            limit,
+            on_filled,
+            executor,
+            resolutions=resolutions,
+            offline_paths=True,
+        )
+    return plan
+
+
+@cli.command('verify')
+@add_common_options
+@add_feed_stage_options
+@add_connection_options
+@add_transfer_options
+@click.option('--tolerance', type=click.FloatRange(min=0), default=0.02)
+@click.option('--check-audio', is_flag=True, default=False)
+@click.option('--redownload', is_flag=True, default=False)
+@click.option('--report', type=str, default=None)
+@click.option('--process-pool', is_flag=True, default=False)
+def cli_verify(
+        check_audio: bool,
+        chunk_size: int,
+        clear_feed_cache: bool,
+        connection_settings: ConnectionSettings,
+        destination: str,
+        feed: tuple[str],
+        file: tuple[str],
+        host_rate_limit: Optional[float],
+        max_attempts: int,
+        max_host_connections: int,
+        no_feed_cache: bool,
+        no_redirect_cache: bool,
+        opml: tuple[str],
+        pool_size: Optional[int],
+        process_pool: bool,
+        rebuild_index: bool,
+        redirect_cache_size: int,
+        redirect_cache_ttl: float,
+        redownload: bool,
+        report: Optional[str],
+        threads: int,
+        tolerance: float,
+        verbose: int,
+):
+    _setup_logging(verbose)
+    destination = _prepare_destination(destination)
+    feed_cache = _open_feed_cache(destination, no_feed_cache, clear_feed_cache)
+    report = Path(report).expanduser().resolve() if report else Path(destination, 'results.json')
+    all_feeds = _load_all_feeds(feed, file, opml)
+    if all_feeds:
+        with util.create_executor(pool_size, process_pool) as executor, \
+                open_download_index(destination, rebuild_index) as download_index, \
+                _open_resolution_cache(
+                    destination, no_redirect_cache, redirect_cache_ttl, redirect_cache_size) as resolutions:
+            asyncio.run(verify_episodes(
+                all_feeds,
+                destination,
+                threads,
+                tolerance,
+                check_audio,
+                redownload,
+                report,
+                chunk_size=chunk_size,
+                feed_cache=feed_cache,
+                max_attempts=max_attempts,
+                max_host_connections=max_host_connections,
+                host_rate_limit=host_rate_limit,
+                executor=executor,
+                download_index=download_index,
+                connection_settings=connection_settings,
+                resolutions=resolutions,
+            ))
+    else:
+        logger.error('No feeds have been provided')
+    logger.info('Program Complete')
+
+
+async def verify_podcast_episodes(
+    podcast: Podcast,
+    verifier: EpisodeVerifier,
+    results: list[tuple[Episode, dict]],
+    download_index: Optional[DownloadIndex] = None,
+):
+    missing = set(find_missing_episodes(podcast.episodes, download_index))
+    present = [e for e in podcast.episodes if e.file_path and e not in missing]
+    podcast_results = await verifier.verify_episodes(present)
+    for episode, result in zip(present, podcast_results):
+        if verifier.is_flagged(result):
+            logger.warning(f'{episode.title} in {episode.podcast_name} failed verification: {result["status"]}')
+        results.append((episode, result))
+    logger.info(f'Verified {len(present)} episodes from {podcast.name}')
+
+
+async def verify_episodes(
+    all_feeds: Collection[str],
+    destination: Path,
+    threads: int,
+    tolerance: float,
+    check_audio: bool,
+    redownload: bool,
+    report_path: Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    feed_cache: Optional[FeedCache] = None,
+    max_attempts: int = 10,
+    max_host_connections: int = 4,
+    host_rate_limit: Optional[float] = None,
+    executor: Optional[Executor] = None,
+    download_index: Optional[DownloadIndex] = None,
+    connection_settings: Optional[ConnectionSettings] = None,
+    resolutions: Optional[ResolutionCache] = None,
+):
+    results = []
+    async with (connection_settings or ConnectionSettings()).create_session() as session:
+        verifier = EpisodeVerifier(session, tolerance, check_audio, threads, executor, resolutions)
+        on_filled = functools.partial(
+            verify_podcast_episodes,
+            verifier=verifier,
+            results=results,
+            download_index=download_index,
+        )
+        await fill_feeds(
+            all_feeds, destination, session, threads, feed_cache, None, on_filled, executor, resolutions=resolutions)
+
+        summary = collections.Counter(result['status'] for _, result in results)
+        with open(report_path, 'w') as file:
+            json.dump({'summary': summary, 'episodes': [result for _, result in results]}, file, indent=2)
+        logger.info(f'Verification report written to {report_path}: {dict(summary)}')
+
+        flagged = [episode for episode, result in results if verifier.is_flagged(result)]
+        if redownload and flagged:
+            logger.info(f'Redownloading {len(flagged)} episodes')
+            scheduler = DownloadScheduler(max_host_connections, host_rate_limit, max_attempts)
+            for episode in flagged:
+                scheduler.put(episode)
+            scheduler.close()
+            # The flagged files are kept until their replacements have been downloaded in full
+            await asyncio.gather(*[
+                download_individual_episode(
+                    scheduler,
+                    session,
+                    chunk_size,
+                    executor,
+                    download_index,
+                    resolutions=resolutions,
+                    overwrite=True,
+                )
+                for _ in range(threads)
+            ])
+
+
+@cli.command('update-tags')
+@add_common_options
+@add_feed_stage_options
+@add_connection_options
+def cli_update_tags(
+        clear_feed_cache: bool,
+        connection_settings: ConnectionSettings,
+        destination: str,
+        feed: tuple[str],
+        file: tuple[str],
+        no_feed_cache: bool,
+        no_redirect_cache: bool,
+        opml: tuple[str],
+        pool_size: Optional[int],
+        rebuild_index: bool,
+        redirect_cache_size: int,
+        redirect_cache_ttl: float,
+        threads: int,
+        verbose: int,
+):
+    _setup_logging(verbose)
+    destination = _prepare_destination(destination)
+    feed_cache = _open_feed_cache(destination, no_feed_cache, clear_feed_cache)
+    all_feeds = _load_all_feeds(feed, file, opml)
+    if all_feeds:
+        with util.create_executor(pool_size, True) as executor, \
+                open_download_index(destination, rebuild_index) as download_index, \
+                _open_resolution_cache(
+                    destination, no_redirect_cache, redirect_cache_ttl, redirect_cache_size) as resolutions:
+            asyncio.run(update_episode_tags(
+                all_feeds,
+                destination,
+                threads,
+                executor,
+                feed_cache=feed_cache,
+                download_index=download_index,
+                connection_settings=connection_settings,
+                resolutions=resolutions,
+            ))
+    else:
+        logger.error('No feeds have been provided')
+    logger.info('Program Complete')
+
+
+async def _tag_episode_in_executor(episode: Episode, executor: Optional[Executor]) -> Optional[bool]:
+    try:
+        from podcastdownloader.tag_engine import TagEngine
+        return await asyncio.get_running_loop().run_in_executor(executor, TagEngine.tag_episode, episode)
+    except (OSError, TagEngineError) as e:
+        logger.error(f'Failed to tag episode {episode.title}: {e}')
+        return None
+
+
+def _get_linked_inodes(file_paths: list[Path]) -> list[Optional[tuple[int, int]]]:
+    result = []
+    for file_path in file_paths:
+        try:
+            stat = file_path.stat()
+        except OSError:
+            result.append(None)
+            continue
+        result.append((stat.st_dev, stat.st_ino) if stat.st_nlink > 1 else None)
+    return result
+
+
+async def retag_podcast_episodes(
+    podcast: Podcast,
+    executor: Optional[Executor],
+    counts: collections.Counter,
+    download_index: Optional[DownloadIndex] = None,
+    tagged_inodes: Optional[set[tuple[int, int]]] = None,
+):
+    missing = set(find_missing_episodes(podcast.episodes, download_index))
+    present = [e for e in podcast.episodes if e.file_path and e not in missing]
+    inodes = await asyncio.get_running_loop().run_in_executor(
+        executor, _get_linked_inodes, [e.file_path for e in present])
+    podcast_counts = collections.Counter()
+    to_tag = []
+    for episode, inode in zip(present, inodes):
+        # Hardlinked episodes share one set of tags, so only the first of them is tagged
+        if inode and tagged_inodes is not None:
+            if inode in tagged_inodes:
+                logger.debug(f'Skipping tags for {episode.file_path}, as they are shared with another episode')
+                podcast_counts['shared'] += 1
+                continue
+            tagged_inodes.add(inode)
+        to_tag.append(episode)
+    results = await asyncio.gather(*[_tag_episode_in_executor(episode, executor) for episode in to_tag])
+    podcast_counts.update({True: 'updated', False: 'unchanged', None: 'failed'}[result] for result in results)
+    counts.update(podcast_counts)
+    logger.info(f'Tags for {podcast.name}: {podcast_counts["updated"]} updated, '
+                f'{podcast_counts["unchanged"]} unchanged, {podcast_counts["shared"]} shared, '
+                f'{podcast_counts["failed"]} failed')
+
+
+async def update_episode_tags(
+    all_feeds: Collection[str],
+    destination: Path,
+    threads: int,
+    executor: Optional[Executor],
+    feed_cache: Optional[FeedCache] = None,
+    download_index: Optional[DownloadIndex] = None,
+    connection_settings: Optional[ConnectionSettings] = None,
+    resolutions: Optional[ResolutionCache] = None,
+):
+    counts = collections.Counter()
+    start_time = time.monotonic()
+    on_filled = functools.partial(
+        retag_podcast_episodes,
+        executor=executor,
+        counts=counts,
+        download_index=download_index,
+        tagged_inodes=set(),
+    )
+    async with (connection_settings or ConnectionSettings()).create_session() as session:
+        await fill_feeds(
+            all_feeds, destination, session, threads, feed_cache, None, on_filled, executor, resolutions=resolutions)
+    elapsed = time.monotonic() - start_time
+    total = sum(counts.values())
+    logger.info(f'Checked tags on {total} files in {elapsed:.1f} seconds ({total / max(elapsed, 1e-6):.1f} files/s): '
+                f'{counts["updated"]} updated, {counts["unchanged"]} unchanged, {counts["shared"]} shared, '
+                f'{counts["failed"]} failed')
+    return counts
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import datetime
+import logging
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import InsufficientSpaceException
+from podcastdownloader.metrics import format_size
+from podcastdownloader.scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+_size_pattern = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$', re.IGNORECASE)
+_schedule_pattern = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)$')
+
+
+def parse_size(size: str) -> int:
+    match = _size_pattern.match(size)
+    if not match:
+        raise ValueError(f'Could not parse size {size}')
+    return int(float(match.group(1)) * 1024 ** ' KMGT'.index(match.group(2).upper() or ' '))
+
+
+def parse_bandwidth(size: str) -> int:
+    result = parse_size(size)
+    if result == 0:
+        raise ValueError(f'Bandwidth limit {size} must be more than zero bytes per second')
+    return result
+
+
+def parse_bandwidth_schedule(entries: tuple[str]) -> list[tuple[datetime.time, datetime.time, Optional[int]]]:
+    result = []
+    for entry in entries:
+        match = _schedule_pattern.match(entry)
+        if not match:
+            raise ValueError(f'Could not parse bandwidth schedule entry {entry}')
+        start_hour, start_minute, end_hour, end_minute = (int(group) for group in match.groups()[:4])
+        rate = match.group(5).strip()
+        result.append((
+            datetime.time(start_hour % 24, start_minute),
+            datetime.time(end_hour % 24, end_minute),
+            None if rate.lower() == 'unlimited' else parse_bandwidth(rate),
+        ))
+    return result
+
+
+class AdmissionController:
+    def __init__(
+            self,
+            destination: Path,
+            free_space_floor: int = 0,
+            bandwidth_limit: Optional[int] = None,
+            bandwidth_schedule: Optional[list[tuple[datetime.time, datetime.time, Optional[int]]]] = None,
+    ):
+        self.destination = destination
+        self.free_space_floor = free_space_floor
+        self.bandwidth_limit = bandwidth_limit
+        self.bandwidth_schedule = bandwidth_schedule or []
+        self._reservations: dict[Episode, int] = {}
+        self._bucket: Optional[TokenBucket] = None
+
+    @property
+    def reserved(self) -> int:
+        return sum(self._reservations.values())
+
+    def reserve(self, episode: Episode, size: Optional[int]):
+        size = size or 0
+        other_reservations = self.reserved - self._reservations.get(episode, 0)
+        available = shutil.disk_usage(self.destination).free - other_reservations - self.free_space_floor
+        if size > available:
+            raise InsufficientSpaceException(
+                f'Not enough free space to download "{episode.title}" from "{episode.podcast_name}": '
+                f'{format_size(size)} needed, {format_size(max(available, 0))} available')
+        self._reservations[episode] = size
+
+    def release(self, episode: Episode):
+        self._reservations.pop(episode, None)
+
+    def get_bandwidth_limit(self, now: Optional[datetime.time] = None) -> Optional[int]:
+        now = now or datetime.datetime.now().time()
+        for start, end, rate in self.bandwidth_schedule:
+            # A window that ends before it starts runs over midnight
+            if start <= now < end or (end <= start and (now >= start or now < end)):
+                return rate
+        return self.bandwidth_limit
+
+    def _get_bucket(self) -> Optional[TokenBucket]:
+        rate = self.get_bandwidth_limit()
+        if rate is None:
+            self._bucket = None
+        elif self._bucket is None or self._bucket.rate != rate:
+            logger.debug(f'Limiting downloads to {format_size(rate)}/s')
+            self._bucket = TokenBucket(rate)
+        return self._bucket
+
+    async def transfer(self, episode: Episode, byte_count: int):
+        if episode in self._reservations:
+            self._reservations[episode] = max(0, self._reservations[episode] - byte_count)
+        if bucket := self._get_bucket():
+            if delay := bucket.consume(byte_count):
+                await asyncio.sleep(delay)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import logging
+import types
+from typing import Optional
+
+import aiohttp
+
+from podcastdownloader.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionSettings:
+    def __init__(
+            self,
+            connection_limit: int = 100,
+            connection_limit_per_host: int = 0,
+            keepalive_timeout: float = 30,
+            dns_cache_ttl: Optional[int] = 300,
+            connect_timeout: Optional[float] = 30,
+            read_timeout: Optional[float] = 60,
+            total_timeout: Optional[float] = None,
+    ):
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+
+    def create_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=self.total_timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+
+    def create_connector(self) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.dns_cache_ttl != 0,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+
+    @staticmethod
+    def _create_trace_config(metrics: Metrics) -> aiohttp.TraceConfig:
+        async def on_connection_create_end(_session, _context: types.SimpleNamespace, _params):
+            metrics.increment('connections_created')
+
+        async def on_connection_reuseconn(_session, _context: types.SimpleNamespace, _params):
+            metrics.increment('connections_reused')
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def create_session(self, metrics: Optional[Metrics] = None) -> aiohttp.ClientSession:
+        trace_configs = [self._create_trace_config(metrics)] if metrics else None
+        return aiohttp.ClientSession(
+            connector=self.create_connector(),
+            timeout=self.create_timeout(),
+            trace_configs=trace_configs,
+        )
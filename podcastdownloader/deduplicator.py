@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import collections
+import contextlib
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Optional
+
+from podcastdownloader.download_index import DownloadIndex
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import EpisodeException
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_FICLONE = 0x40049409
+
+# Short GUIDs such as episode numbers are only unique within a single feed
+_MIN_SHARED_GUID_LENGTH = 16
+
+
+class Deduplicator:
+    def __init__(self, download_index: Optional[DownloadIndex] = None):
+        self.download_index = download_index
+        self.link_counts: collections.Counter[str] = collections.Counter()
+        self.bytes_saved = 0
+        self._by_identifier: dict[str, tuple[Path, Optional[str]]] = {}
+        self._by_hash: dict[str, Path] = {}
+
+    @staticmethod
+    def _get_identifiers(episode: Episode) -> list[str]:
+        result = ['url:' + episode.url]
+        if episode.guid and len(episode.guid) >= _MIN_SHARED_GUID_LENGTH:
+            result.append('guid:' + episode.guid)
+        return result
+
+    def find_copy(self, episode: Episode) -> Optional[tuple[Path, Optional[str]]]:
+        for identifier in self._get_identifiers(episode):
+            if identifier in self._by_identifier:
+                path, content_hash = self._by_identifier[identifier]
+                if path != episode.file_path and path.is_file():
+                    return path, content_hash
+        if self.download_index:
+            guid = episode.guid if episode.guid and len(episode.guid) >= _MIN_SHARED_GUID_LENGTH else None
+            return self.download_index.find_by_identifiers(episode.url, guid, episode.file_path)
+        return None
+
+    def find_identical(self, episode: Episode) -> Optional[Path]:
+        if not episode.content_hash:
+            return None
+        path = self._by_hash.get(episode.content_hash)
+        if path and path != episode.file_path and path.is_file():
+            return path
+        if self.download_index:
+            return self.download_index.find_by_hash(episode.content_hash, episode.file_path)
+        return None
+
+    def record(self, episode: Episode):
+        for identifier in self._get_identifiers(episode):
+            self._by_identifier.setdefault(identifier, (episode.file_path, episode.content_hash))
+        if episode.content_hash:
+            self._by_hash.setdefault(episode.content_hash, episode.file_path)
+
+    @staticmethod
+    def _reflink(source: Path, target: Path):
+        if fcntl is None:
+            raise OSError('Reflinks are not supported on this platform')
+        with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+            try:
+                fcntl.ioctl(target_file.fileno(), _FICLONE, source_file.fileno())
+            except OSError:
+                target_file.close()
+                target.unlink()
+                raise
+
+    def _store(
+            self,
+            source: Path,
+            target: Path,
+            allow_copy: bool,
+            allow_hardlink: bool,
+            reserve: Optional[Callable[[int], None]],
+    ) -> Optional[str]:
+        try:
+            self._reflink(source, target)
+            return 'reflink'
+        except OSError:
+            pass
+        if allow_hardlink:
+            try:
+                os.link(source, target)
+                return 'hardlink'
+            except OSError:
+                pass
+        if not allow_copy:
+            return None
+        # Unlike a link, a copy takes up space, so it is admitted like a download of the same size
+        if reserve:
+            reserve(source.stat().st_size)
+        shutil.copyfile(source, target)
+        return 'copy'
+
+    def link(
+            self,
+            source: Path,
+            target: Path,
+            allow_copy: bool = True,
+            allow_hardlink: bool = True,
+            reserve: Optional[Callable[[int], None]] = None,
+    ) -> Optional[str]:
+        temporary_path = target.with_name(target.name + '.link')
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path.unlink(missing_ok=True)
+            method = self._store(source, temporary_path, allow_copy, allow_hardlink, reserve)
+            if method is None:
+                return None
+            size = temporary_path.stat().st_size
+            temporary_path.replace(target)
+        except OSError as e:
+            raise EpisodeException(f'Failed to store {target} as a copy of {source}: {e}')
+        finally:
+            with contextlib.suppress(OSError):
+                temporary_path.unlink(missing_ok=True)
+        self.link_counts[method] += 1
+        if method != 'copy':
+            self.bytes_saved += size
+        logger.debug(f'Stored {target} as a {method} of {source}')
+        return method
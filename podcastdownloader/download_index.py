@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import logging
+import mimetypes
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Optional
+
+from podcastdownloader.episode import Episode
+
+logger = logging.getLogger(__name__)
+
+_playlist_mime_types = ('audio/mpegurl', 'audio/x-mpegurl', 'audio/x-scpls', 'application/vnd.apple.mpegurl')
+
+
+class DownloadIndex:
+    def __init__(self, database_path: Path, destination: Path):
+        self.destination = destination
+        database_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(database_path, timeout=60)
+        with self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS episodes (
+                    path TEXT PRIMARY KEY,
+                    podcast TEXT NOT NULL,
+                    guid TEXT,
+                    url TEXT,
+                    size INTEGER,
+                    hash TEXT
+                )''')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS episodes_guid ON episodes (podcast, guid)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS episodes_url ON episodes (podcast, url)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS episodes_any_guid ON episodes (guid)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS episodes_any_url ON episodes (url)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS episodes_hash ON episodes (hash)')
+
+    def __enter__(self) -> 'DownloadIndex':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def _to_relative(self, path: Path) -> str:
+        return path.relative_to(self.destination).as_posix()
+
+    def _to_absolute(self, path: str) -> Path:
+        return Path(self.destination, path)
+
+    def is_empty(self) -> bool:
+        return self._connection.execute('SELECT 1 FROM episodes LIMIT 1').fetchone() is None
+
+    def count(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM episodes').fetchone()[0]
+
+    def lookup(self, episodes: Iterable[Episode]) -> dict[Episode, Path]:
+        result = {}
+        episodes_by_podcast: dict[str, list[Episode]] = {}
+        for episode in episodes:
+            episodes_by_podcast.setdefault(episode.podcast_name, []).append(episode)
+        adopted = []
+        for podcast_name, podcast_episodes in episodes_by_podcast.items():
+            rows = self._connection.execute(
+                'SELECT path, guid, url FROM episodes WHERE podcast = ?', (podcast_name,)).fetchall()
+            by_guid = {guid: path for path, guid, _ in rows if guid}
+            by_url = {url: path for path, _, url in rows if url}
+            untracked = {path for path, guid, url in rows if not guid and not url}
+            for episode in podcast_episodes:
+                if episode.guid and episode.guid in by_guid:
+                    path = by_guid[episode.guid]
+                elif episode.url in by_url:
+                    path = by_url[episode.url]
+                elif episode.file_path and (path := self._to_relative(episode.file_path)) in untracked:
+                    # Files found when rebuilding the index are matched by path once, then by their identifiers
+                    untracked.remove(path)
+                    adopted.append((episode.guid, episode.url, path))
+                else:
+                    continue
+                result[episode] = self._to_absolute(path)
+        if adopted:
+            with self._connection:
+                self._connection.executemany('UPDATE episodes SET guid = ?, url = ? WHERE path = ?', adopted)
+        return result
+
+    def _first_existing(self, rows: Iterable[tuple[str, Optional[str]]], exclude: Optional[Path]) -> \
+            Optional[tuple[Path, Optional[str]]]:
+        for path, content_hash in rows:
+            path = self._to_absolute(path)
+            if path != exclude and path.is_file():
+                return path, content_hash
+        return None
+
+    def find_by_identifiers(self, url: str, guid: Optional[str], exclude: Optional[Path] = None) -> \
+            Optional[tuple[Path, Optional[str]]]:
+        rows = self._connection.execute('SELECT path, hash FROM episodes WHERE url = ?', (url,)).fetchall()
+        if guid:
+            rows += self._connection.execute('SELECT path, hash FROM episodes WHERE guid = ?', (guid,)).fetchall()
+        return self._first_existing(rows, exclude)
+
+    def find_by_hash(self, content_hash: str, exclude: Optional[Path] = None) -> Optional[Path]:
+        rows = self._connection.execute('SELECT path, hash FROM episodes WHERE hash = ?', (content_hash,)).fetchall()
+        result = self._first_existing(rows, exclude)
+        return result[0] if result else None
+
+    def add(self, episode: Episode, size: Optional[int] = None):
+        if size is None:
+            size = episode.file_path.stat().st_size
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO episodes (path, podcast, guid, url, size, hash) VALUES (?, ?, ?, ?, ?, ?)',
+                (self._to_relative(episode.file_path), episode.podcast_name, episode.guid, episode.url, size,
+                 episode.content_hash),
+            )
+
+    @staticmethod
+    def _is_episode_file(path: Path) -> bool:
+        mime_type = mimetypes.guess_type(path.name)[0]
+        return bool(mime_type) and mime_type.split('/')[0] in ('audio', 'video') and \
+            mime_type not in _playlist_mime_types
+
+    def _scan_destination(self) -> dict[str, tuple[str, int]]:
+        result = {}
+        for podcast_directory in self.destination.iterdir():
+            if not podcast_directory.is_dir() or podcast_directory.name.startswith('.'):
+                continue
+            for file in podcast_directory.iterdir():
+                if file.is_file() and self._is_episode_file(file):
+                    result[self._to_relative(file)] = (podcast_directory.name, file.stat().st_size)
+        return result
+
+    def rebuild(self):
+        on_disk = self._scan_destination()
+        indexed = {path for path, in self._connection.execute('SELECT path FROM episodes')}
+        missing = [(path,) for path in indexed if path not in on_disk]
+        untracked = [(path, podcast, size) for path, (podcast, size) in on_disk.items() if path not in indexed]
+        with self._connection:
+            self._connection.executemany('DELETE FROM episodes WHERE path = ?', missing)
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO episodes (path, podcast, size) VALUES (?, ?, ?)', untracked)
+        logger.info(
+            f'Download index rebuilt: {len(untracked)} files added and {len(missing)} missing files removed')
@@ -1,101 +1,409 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+import asyncio
+import contextlib
+import datetime
+import email.utils
+import hashlib
 import logging
 import mimetypes
 import re
 import urllib.parse
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import aiohttp
 import aiohttp.client_exceptions
-import mutagen
 from multidict import CIMultiDictProxy
 
-from podcastdownloader.exceptions import EpisodeException
+from podcastdownloader.exceptions import EpisodeException, RetryableEpisodeException, TagEngineError
+from podcastdownloader.metrics import Metrics
+from podcastdownloader.resolution_cache import Resolution, ResolutionCache
+
+if TYPE_CHECKING:
+    from podcastdownloader.admission import AdmissionController
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+_extra_mime_type_extensions = {
+    'audio/mp3': '.mp3',
+    'audio/mpeg3': '.mp3',
+    'audio/x-mp3': '.mp3',
+    'audio/x-mpeg': '.mp3',
+    'audio/m4a': '.m4a',
+    'audio/x-m4a': '.m4a',
+}
+
+_retryable_status_codes = (429, 500, 502, 503, 504)
+
 
 class Episode:
-    def __init__(self, title_name: str, episode_url: str, podcast_name: str, feed: dict):
+    # Only the fields used by the downloader, tag engine and writers are kept, as there may be a very large number
+    __slots__ = (
+        'title',
+        'url',
+        'podcast_name',
+        'mime_type',
+        'guid',
+        'length',
+        'date',
+        'summary',
+        'number',
+        'duration',
+        'file_path',
+        'content_hash',
+    )
+
+    def __init__(
+            self,
+            title_name: str,
+            episode_url: str,
+            podcast_name: str,
+            mime_type: Optional[str] = None,
+            guid: Optional[str] = None,
+            length: Optional[int] = None,
+            date: Optional[datetime.datetime] = None,
+            summary: Optional[str] = None,
+            number: Optional[int] = None,
+            duration: Optional[int] = None,
+    ):
         self.title = self._clean_name(title_name)
         self.url = episode_url
         self.podcast_name = podcast_name
+        self.mime_type = mime_type
+        self.guid = guid
+        self.length = length
+        self.date = date
+        self.summary = summary
+        self.number = number
+        self.duration = duration
         self.file_path: Optional[Path] = None
-        self.feed = feed
+        self.content_hash: Optional[str] = None
 
     @staticmethod
     def parse_dict(feed_dict: dict, podcast_name: str) -> 'Episode':
-        episode_url = Episode._find_url(feed_dict)
+        enclosure = Episode._find_enclosure(feed_dict)
         result = Episode(
             feed_dict['title'],
-            episode_url,
+            enclosure.get('href'),
             podcast_name,
-            feed_dict,
+            enclosure.get('type'),
+            feed_dict.get('id'),
+            Episode._parse_positive_integer(enclosure.get('length')),
+            Episode._parse_date(feed_dict.get('published')),
+            feed_dict.get('summary') or None,
+            Episode._parse_positive_integer(feed_dict.get('itunes_episode')),
+            Episode._parse_duration(feed_dict.get('itunes_duration')),
         )
         return result
 
+    @staticmethod
+    def _parse_positive_integer(value: Optional[str]) -> Optional[int]:
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return None
+        return value if value > 0 else None
+
+    @staticmethod
+    def _parse_duration(duration: Optional[str]) -> Optional[int]:
+        # Durations may be given in seconds or as HH:MM:SS or MM:SS
+        match = re.match(r'^\s*(?:(?:(\d+):)?(\d+):)?(\d+)(?:\.\d*)?\s*$', duration or '')
+        if not match:
+            return None
+        hours, minutes, seconds = (int(group or 0) for group in match.groups())
+        return hours * 3600 + minutes * 60 + seconds or None
+
+    @staticmethod
+    def _parse_date(published: Optional[str]) -> Optional[datetime.datetime]:
+        if not published:
+            return None
+        try:
+            result = email.utils.parsedate_to_datetime(published)
+        except (TypeError, ValueError):
+            try:
+                result = datetime.datetime.fromisoformat(published)
+            except ValueError:
+                return None
+        if not result.tzinfo:
+            result = result.replace(tzinfo=datetime.timezone.utc)
+        return result
+
     @staticmethod
     def _clean_name(name: str) -> str:
         name = re.sub(r'([\0/])', '', name)
         return name
 
     @staticmethod
-    def _find_url(feed_dict: dict) -> str:
+    def _find_enclosure(feed_dict: dict) -> dict:
         mime_type_regex = re.compile(r'^audio.*')
         try:
             valid_urls = list(filter(lambda u: re.match(mime_type_regex, u['type']), feed_dict['links']))
         except KeyError:
             valid_urls = None
         if valid_urls:
-            return valid_urls[0].get('href')
+            return valid_urls[0]
         else:
-            raise EpisodeException(f'Could not find a valid link for episode {feed_dict["title"]}')
+            raise EpisodeException(f'Could not find a valid link for episode {feed_dict.get("title")}')
 
     @staticmethod
-    async def _get_file_extension(url: str, session: aiohttp.ClientSession) -> str:
-        url = urllib.parse.urlsplit(url).path
-        mime_type = mimetypes.guess_type(url)
-        mime_type = mime_type[0]
-        if not mime_type:
-            async with session.get(url) as response:
-                headers = response.headers
-            mime_type = headers.get('Content-Type')
+    def _find_url(feed_dict: dict) -> str:
+        return Episode._find_enclosure(feed_dict).get('href')
+
+    @staticmethod
+    def _guess_extension(mime_type: Optional[str]) -> Optional[str]:
         if not mime_type:
-            raise EpisodeException(f'Could not determine MIME type for URL {url}')
-        result = mimetypes.guess_extension(mime_type)
+            return None
+        mime_type = mime_type.split(';')[0].strip().lower()
+        return mimetypes.guess_extension(mime_type) or _extra_mime_type_extensions.get(mime_type)
+
+    @staticmethod
+    def _get_url_pattern(url: str) -> tuple[str, str]:
+        split_url = urllib.parse.urlsplit(url)
+        directory = split_url.path.rpartition('/')[0]
+        return split_url.netloc, re.sub(r'\d+', '#', directory)
+
+    @staticmethod
+    def _guess_url_extension(url: str) -> Optional[str]:
+        return Episode._guess_extension(mimetypes.guess_type(urllib.parse.urlsplit(url).path)[0])
+
+    @staticmethod
+    def _get_resolution_extension(resolution: Resolution) -> Optional[str]:
+        # The file that was redirected to names its type more reliably than a generic content type
+        return Episode._guess_url_extension(resolution.final_url) or Episode._guess_extension(resolution.content_type)
+
+    @staticmethod
+    async def _head_file_extension(
+            url: str,
+            session: aiohttp.ClientSession,
+            resolutions: Optional[ResolutionCache] = None,
+    ) -> Optional[str]:
+        async with session.head(url, allow_redirects=True) as response:
+            if not 200 <= response.status < 300:
+                logger.debug(f'HEAD request for {url} failed with response code {response.status}')
+                return None
+            resolution = Resolution(
+                str(response.url),
+                response.headers.get('Content-Type'),
+                Episode._parse_positive_integer(response.headers.get('Content-Length')),
+            )
+            if resolutions:
+                resolutions.put(url, resolution)
+            return Episode._get_resolution_extension(resolution)
+
+    @staticmethod
+    def _guess_file_extension(
+            url: str,
+            mime_type: Optional[str],
+            resolutions: Optional[ResolutionCache] = None,
+    ) -> Optional[str]:
+        result = Episode._guess_url_extension(url) or Episode._guess_extension(mime_type)
+        if not result and resolutions and (resolution := resolutions.get(url)):
+            result = Episode._get_resolution_extension(resolution)
+        return result
+
+    @staticmethod
+    async def _get_file_extension(
+            url: str,
+            mime_type: Optional[str],
+            session: aiohttp.ClientSession,
+            resolutions: Optional[ResolutionCache] = None,
+            extension_lookups: Optional['ExtensionLookups'] = None,
+    ) -> str:
+        result = Episode._guess_file_extension(url, mime_type, resolutions)
+        if not result:
+            result = await (extension_lookups or ExtensionLookups()).get(url, session, resolutions)
         if result:
             return result
         else:
             raise EpisodeException(f'Could not determine file extension for download {url}')
 
-    async def calculate_path(self, destination: Path, session: aiohttp.ClientSession):
+    def guess_path(self, destination: Path, resolutions: Optional[ResolutionCache] = None) -> bool:
+        # Only what is already known is used, so the path cannot be found for some episodes
+        if file_extension := self._guess_file_extension(self.url, self.mime_type, resolutions):
+            self.file_path = Path(destination, self.podcast_name, self.title + file_extension)
+        return bool(file_extension)
+
+    async def calculate_path(
+            self,
+            destination: Path,
+            session: aiohttp.ClientSession,
+            resolutions: Optional[ResolutionCache] = None,
+            extension_lookups: Optional['ExtensionLookups'] = None,
+    ):
         try:
-            file_extension = await self._get_file_extension(self.url, session)
+            file_extension = await self._get_file_extension(
+                self.url, self.mime_type, session, resolutions, extension_lookups)
             file_name = self.title + file_extension
             self.file_path = Path(destination, self.podcast_name, file_name)
-        except (aiohttp.client_exceptions.ClientError, EpisodeException) as e:
-            raise EpisodeException(f'Failed to determine path for "{self.title}" from "{self.podcast_name}": {e}')
+        except (aiohttp.client_exceptions.ClientError, asyncio.TimeoutError, EpisodeException) as e:
+            raise EpisodeException(
+                f'Failed to determine path for "{self.title}" from "{self.podcast_name}": {e or type(e).__name__}')
+
+    @property
+    def partial_path(self) -> Path:
+        return self.file_path.with_name(self.file_path.name + '.part')
+
+    @staticmethod
+    def _get_range_start(content_range: Optional[str]) -> Optional[int]:
+        match = re.match(r'^\s*bytes\s+(\d+)-', content_range or '')
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def _get_range_total(content_range: Optional[str]) -> Optional[int]:
+        match = re.match(r'^\s*bytes\s+\d+-\d+/(\d+)', content_range or '')
+        return int(match.group(1)) if match else None
 
-    async def download(self, session: aiohttp.ClientSession):
+    @staticmethod
+    def _parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+        if not retry_after:
+            return None
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        try:
+            retry_date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        if not retry_date.tzinfo:
+            retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, (retry_date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+    async def download(
+            self,
+            session: aiohttp.ClientSession,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            executor: Optional[Executor] = None,
+            metrics: Optional[Metrics] = None,
+            admission: Optional['AdmissionController'] = None,
+            resolutions: Optional[ResolutionCache] = None,
+            overwrite: bool = False,
+    ):
         if not self.file_path:
             raise EpisodeException('Episode has no calculated path')
+        # An existing file is only replaced once the new download has finished, so a failure leaves it in place
+        if self.file_path.exists() and not overwrite:
+            logger.debug(f'File already exists at {self.file_path}')
+            return
+        self.file_path.parent.mkdir(exist_ok=True, parents=True)
+        offset = self.partial_path.stat().st_size if self.partial_path.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        if admission:
+            admission.reserve(self, max(self.length - offset, 0) if self.length else None)
+        # Going straight to where the enclosure redirected to last time saves a request for every redirect
+        resolution = resolutions.get(self.url) if resolutions else None
+        if resolution and metrics:
+            metrics.increment('redirects_skipped')
         try:
-            async with session.get(self.url) as response:
-                if not self.file_path.exists():
-                    data = await response.content.read()
-                    self.file_path.parent.mkdir(exist_ok=True, parents=True)
-                    with open(self.file_path, 'wb') as file:
-                        file.write(data)
-                    logger.info(f'Downloaded {self.title} in podcast {self.podcast_name}')
-                    try:
-                        from podcastdownloader.tag_engine import TagEngine
-                        TagEngine.tag_episode(self)
-                    except mutagen.MutagenError as e:
-                        logger.error(f'Failed to tag episode {self.title}: {e}')
+            async with session.get(resolution.final_url if resolution else self.url, headers=headers) as response:
+                if resolution and response.status >= 400 and response.status not in _retryable_status_codes:
+                    logger.debug(f'Previous location of {self.title} failed, following the enclosure again')
+                    resolutions.invalidate(self.url)
+                    return await self.download(
+                        session, chunk_size, executor, metrics, admission, resolutions, overwrite)
+                if response.status == 206 and self._get_range_start(response.headers.get('Content-Range')) == offset:
+                    logger.debug(f'Resuming download of {self.title} from byte {offset}')
+                    mode = 'ab'
+                elif response.status == 200:
+                    if offset:
+                        logger.debug(f'Server does not support resuming {self.title}, downloading in full')
+                    mode = 'wb'
+                elif offset and response.status in (206, 416):
+                    logger.debug(f'Discarding unusable partial download of {self.title}')
+                    self.partial_path.unlink()
+                    return await self.download(
+                        session, chunk_size, executor, metrics, admission, resolutions, overwrite)
+                elif response.status in _retryable_status_codes:
+                    raise RetryableEpisodeException(
+                        f'Failed to download "{self.title}" from "{self.podcast_name}": '
+                        f'Response code {response.status}',
+                        self._parse_retry_after(response.headers.get('Retry-After')),
+                    )
                 else:
-                    logger.debug(f'File already exists at {self.file_path}')
+                    raise EpisodeException(
+                        f'Failed to download "{self.title}" from "{self.podcast_name}": '
+                        f'Response code {response.status}')
+                if admission and response.content_length is not None:
+                    admission.reserve(self, response.content_length)
+                if resolutions:
+                    resolutions.put(self.url, Resolution(
+                        str(response.url),
+                        response.headers.get('Content-Type'),
+                        response.content_length if mode == 'wb' else
+                        self._get_range_total(response.headers.get('Content-Range')),
+                    ))
+                content_hash = hashlib.sha256()
+                if mode == 'ab':
+                    with open(self.partial_path, 'rb') as file:
+                        while chunk := file.read(chunk_size):
+                            content_hash.update(chunk)
+                host = response.url.host
+                with open(self.partial_path, mode) as file:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        file.write(chunk)
+                        content_hash.update(chunk)
+                        if metrics:
+                            metrics.add_bytes(host, len(chunk))
+                        if admission:
+                            await admission.transfer(self, len(chunk))
+        except (aiohttp.client_exceptions.ClientConnectionError,
+                aiohttp.client_exceptions.ClientPayloadError,
+                asyncio.TimeoutError) as e:
+            raise RetryableEpisodeException(
+                f'Failed to download "{self.title}" from "{self.podcast_name}": {e or type(e).__name__}')
         except aiohttp.client_exceptions.ClientError as e:
             raise EpisodeException(f'Failed to download "{self.title}" from "{self.podcast_name}": {e}')
+        except OSError as e:
+            raise EpisodeException(f'Failed to write "{self.title}" from "{self.podcast_name}": {e}')
+        finally:
+            if admission:
+                admission.release(self)
+        self.partial_path.replace(self.file_path)
+        self.content_hash = content_hash.hexdigest()
+        logger.info(f'Downloaded {self.title} in podcast {self.podcast_name}')
+        await self.tag(executor, metrics)
+
+    async def tag(self, executor: Optional[Executor] = None, metrics: Optional[Metrics] = None):
+        try:
+            from podcastdownloader.tag_engine import TagEngine
+            with metrics.timed('tagging') if metrics else contextlib.nullcontext():
+                await asyncio.get_running_loop().run_in_executor(executor, TagEngine.tag_episode, self)
+        except TagEngineError as e:
+            logger.error(f'Failed to tag episode {self.title}: {e}')
+
+    async def has_tags_of(self, file_path: Path, executor: Optional[Executor] = None) -> bool:
+        from podcastdownloader.tag_engine import TagEngine
+        return await asyncio.get_running_loop().run_in_executor(executor, TagEngine.has_episode_tags, self, file_path)
+
+
+class ExtensionLookups:
+    def __init__(self):
+        self._extensions: dict[tuple[str, str], str] = {}
+        self._pending: dict[tuple[str, str], asyncio.Task] = {}
+
+    async def get(
+            self,
+            url: str,
+            session: aiohttp.ClientSession,
+            resolutions: Optional[ResolutionCache] = None,
+    ) -> Optional[str]:
+        # Episodes whose links share a pattern are served the same way, so one request answers for all of them
+        pattern = Episode._get_url_pattern(url)
+        if pattern in self._extensions:
+            return self._extensions[pattern]
+        if pattern not in self._pending:
+            self._pending[pattern] = asyncio.create_task(Episode._head_file_extension(url, session, resolutions))
+        task = self._pending[pattern]
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            if task.done() and self._pending.get(pattern) is task:
+                del self._pending[pattern]
+        # Failed lookups are not remembered, so that the next episode with the pattern asks the server again
+        if result:
+            self._extensions[pattern] = result
+        return result
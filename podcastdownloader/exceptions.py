@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+from typing import Optional
+
+
 class PodcastException(Exception):
     pass
 
@@ -13,5 +16,15 @@ class EpisodeException(PodcastException):
     pass
 
 
+class RetryableEpisodeException(EpisodeException):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class TagEngineError(PodcastException):
     pass
+
+
+class InsufficientSpaceException(EpisodeException):
+    pass
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import hashlib
+import json
+import logging
+import shutil
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FeedCache:
+    cached_entry_keys = ('id', 'title', 'links', 'summary', 'published', 'itunes_episode', 'itunes_duration')
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def _get_cache_path(self, url: str) -> Path:
+        return Path(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, url: str) -> Optional[dict]:
+        cache_path = self._get_cache_path(url)
+        try:
+            with open(cache_path, 'r') as file:
+                result = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f'Ignoring unreadable feed cache entry for {url}: {e}')
+            return None
+        if result.get('url') != url:
+            return None
+        return result
+
+    def save(
+            self,
+            url: str,
+            etag: Optional[str],
+            last_modified: Optional[str],
+            name: str,
+            entries: list[dict],
+            limit: Optional[int] = None,
+    ):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        cache_path = self._get_cache_path(url)
+        data = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'name': name,
+            'limit': limit,
+            'entries': [{key: entry[key] for key in self.cached_entry_keys if key in entry} for entry in entries],
+        }
+        temporary_path = cache_path.with_suffix('.tmp')
+        with open(temporary_path, 'w') as file:
+            json.dump(data, file)
+        temporary_path.replace(cache_path)
+        logger.debug(f'Feed cache for {url} written')
+
+    def clear(self):
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+            logger.info(f'Feed cache at {self.directory} cleared')
+
+    @staticmethod
+    def covers_limit(cached: dict, limit: Optional[int]) -> bool:
+        cached_limit = cached.get('limit')
+        return cached_limit is None or (limit is not None and limit <= cached_limit)
+
+    @staticmethod
+    def get_conditional_headers(cached: Optional[dict]) -> dict[str, str]:
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        return headers
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterator, Optional, TypeVar
+
+if TYPE_CHECKING:
+    import aiohttp.web
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
+
+
+class ThroughputHistory:
+    def __init__(self, file_path: Path, max_runs: int = 10):
+        self.file_path = file_path
+        self.max_runs = max_runs
+
+    def _load_runs(self) -> list[list[float]]:
+        try:
+            with open(self.file_path, 'r') as file:
+                return json.load(file)['runs']
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Ignoring unreadable throughput history {self.file_path}: {e}')
+            return []
+
+    def get_bytes_per_second(self) -> Optional[float]:
+        runs = self._load_runs()
+        seconds = sum(run_seconds for _, run_seconds in runs)
+        return sum(run_bytes for run_bytes, _ in runs) / seconds if seconds > 0 else None
+
+    def record(self, byte_count: int, seconds: float):
+        if byte_count <= 0 or seconds <= 0:
+            return
+        runs = (self._load_runs() + [[byte_count, seconds]])[-self.max_runs:]
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        # Sharded workers record their runs separately, so each needs its own temporary file
+        temporary_path = self.file_path.with_name(f'{self.file_path.name}.{os.getpid()}.tmp')
+        with open(temporary_path, 'w') as file:
+            json.dump({'runs': runs}, file)
+        temporary_path.replace(self.file_path)
+
+
+class Metrics:
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.bytes_total = 0
+        self.bytes_by_host: collections.Counter[str] = collections.Counter()
+        self.counters: collections.Counter[str] = collections.Counter()
+        self.stage_seconds: collections.Counter[str] = collections.Counter()
+        self.active_workers = 0
+        self.loop_lag = 0.0
+        self.max_loop_lag = 0.0
+        self.bytes_per_second = 0.0
+        self.host_bytes_per_second: dict[str, float] = {}
+        self._gauges: dict[str, Callable[[], int]] = {}
+        self._last_sample: tuple[float, int, dict[str, int]] = (self.start_time, 0, {})
+
+    def add_bytes(self, host: str, byte_count: int):
+        self.bytes_total += byte_count
+        self.bytes_by_host[host] += byte_count
+
+    def increment(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def register_gauge(self, name: str, gauge: Callable[[], int]):
+        self._gauges[name] = gauge
+
+    @contextlib.contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] += time.monotonic() - start
+
+    @contextlib.contextmanager
+    def active_worker(self) -> Iterator[None]:
+        self.active_workers += 1
+        try:
+            yield
+        finally:
+            self.active_workers -= 1
+
+    def sample(self, loop_lag: float):
+        now = time.monotonic()
+        last_time, last_bytes, last_host_bytes = self._last_sample
+        elapsed = max(now - last_time, 1e-6)
+        self.bytes_per_second = (self.bytes_total - last_bytes) / elapsed
+        self.host_bytes_per_second = {
+            host: (byte_count - last_host_bytes.get(host, 0)) / elapsed
+            for host, byte_count in self.bytes_by_host.items()
+            if byte_count != last_host_bytes.get(host, 0)
+        }
+        self._last_sample = (now, self.bytes_total, dict(self.bytes_by_host))
+        self.loop_lag = loop_lag
+        self.max_loop_lag = max(self.max_loop_lag, loop_lag)
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self.start_time
+        return {
+            'elapsed_seconds': elapsed,
+            'bytes_total': self.bytes_total,
+            'bytes_per_second': self.bytes_per_second,
+            'average_bytes_per_second': self.bytes_total / max(elapsed, 1e-6),
+            'hosts': {
+                host: {'bytes_total': byte_count, 'bytes_per_second': self.host_bytes_per_second.get(host, 0.0)}
+                for host, byte_count in self.bytes_by_host.items()
+            },
+            'counters': dict(self.counters),
+            'stage_seconds': dict(self.stage_seconds),
+            'queues': {name: gauge() for name, gauge in self._gauges.items()},
+            'active_workers': self.active_workers,
+            'event_loop_lag_seconds': self.loop_lag,
+            'max_event_loop_lag_seconds': self.max_loop_lag,
+        }
+
+    @staticmethod
+    def _escape_label(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            '# TYPE podcastdownloader_bytes_total counter',
+            f'podcastdownloader_bytes_total {snapshot["bytes_total"]}',
+            '# TYPE podcastdownloader_bytes_per_second gauge',
+            f'podcastdownloader_bytes_per_second {snapshot["bytes_per_second"]}',
+            '# TYPE podcastdownloader_host_bytes_total counter',
+        ]
+        for host, values in snapshot['hosts'].items():
+            lines.append(
+                f'podcastdownloader_host_bytes_total{{host="{self._escape_label(host)}"}} '
+                f'{values["bytes_total"]}')
+        lines.append('# TYPE podcastdownloader_host_bytes_per_second gauge')
+        for host, values in snapshot['hosts'].items():
+            lines.append(
+                f'podcastdownloader_host_bytes_per_second{{host="{self._escape_label(host)}"}} '
+                f'{values["bytes_per_second"]}')
+        lines.append('# TYPE podcastdownloader_events_total counter')
+        for name, count in snapshot['counters'].items():
+            lines.append(f'podcastdownloader_events_total{{event="{self._escape_label(name)}"}} {count}')
+        lines.append('# TYPE podcastdownloader_stage_seconds_total counter')
+        for stage, seconds in snapshot['stage_seconds'].items():
+            lines.append(f'podcastdownloader_stage_seconds_total{{stage="{self._escape_label(stage)}"}} {seconds}')
+        lines.append('# TYPE podcastdownloader_queue_depth gauge')
+        for name, depth in snapshot['queues'].items():
+            lines.append(f'podcastdownloader_queue_depth{{queue="{self._escape_label(name)}"}} {depth}')
+        lines.extend((
+            '# TYPE podcastdownloader_active_workers gauge',
+            f'podcastdownloader_active_workers {snapshot["active_workers"]}',
+            '# TYPE podcastdownloader_event_loop_lag_seconds gauge',
+            f'podcastdownloader_event_loop_lag_seconds {snapshot["event_loop_lag_seconds"]}',
+        ))
+        return '\n'.join(lines) + '\n'
+
+    def format_progress(self) -> str:
+        snapshot = self.snapshot()
+        counters = snapshot['counters']
+        queues = ', '.join(f'{depth} {name}' for name, depth in snapshot['queues'].items())
+        return (
+            f'{counters.get("feeds_filled", 0)} feeds filled | '
+            f'{counters.get("episodes_downloaded", 0)} downloaded, {counters.get("episodes_failed", 0)} failed, '
+            f'{counters.get("retries", 0)} retries | {queues or "0 queued"}, {snapshot["active_workers"]} active | '
+            f'{format_size(snapshot["bytes_total"])} at {format_size(snapshot["bytes_per_second"])}/s'
+        )
+
+
+class MetricsReporter:
+    def __init__(
+            self,
+            metrics: Metrics,
+            show_progress: bool = False,
+            stats_file: Optional[Path] = None,
+            stats_interval: float = 10,
+            metrics_port: Optional[int] = None,
+            sample_interval: float = 1,
+    ):
+        self.metrics = metrics
+        self.show_progress = show_progress
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        self.metrics_port = metrics_port
+        self.sample_interval = sample_interval
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.sample_interval)
+            self.metrics.sample(max(0.0, loop.time() - start - self.sample_interval))
+            if self.show_progress:
+                sys.stderr.write('\r\x1b[K' + self.metrics.format_progress())
+                sys.stderr.flush()
+
+    def write_stats_file(self):
+        temporary_path = self.stats_file.with_name(self.stats_file.name + '.tmp')
+        with open(temporary_path, 'w') as file:
+            json.dump(self.metrics.snapshot(), file, indent=2)
+        temporary_path.replace(self.stats_file)
+
+    async def _write_stats_periodically(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.write_stats_file()
+
+    async def _handle_metrics_request(self, _request: 'aiohttp.web.Request') -> 'aiohttp.web.Response':
+        import aiohttp.web
+        return aiohttp.web.Response(text=self.metrics.to_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def run(self, coroutine: Awaitable[T]) -> T:
+        tasks = [asyncio.create_task(self._sample())]
+        if self.stats_file:
+            tasks.append(asyncio.create_task(self._write_stats_periodically()))
+        runner = None
+        if self.metrics_port is not None:
+            # The web server is only loaded when it is asked for
+            import aiohttp.web
+            app = aiohttp.web.Application()
+            app.router.add_get('/metrics', self._handle_metrics_request)
+            runner = aiohttp.web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await aiohttp.web.TCPSite(runner, '127.0.0.1', self.metrics_port).start()
+            logger.info(f'Serving metrics on http://127.0.0.1:{self.metrics_port}/metrics')
+        try:
+            return await coroutine
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if runner:
+                await runner.cleanup()
+            if self.show_progress:
+                sys.stderr.write('\n')
+            if self.stats_file:
+                self.write_stats_file()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import collections
+import logging
+from typing import Optional
+
+from podcastdownloader.deduplicator import Deduplicator
+from podcastdownloader.episode import Episode
+from podcastdownloader.metrics import format_duration, format_size
+from podcastdownloader.podcast import Podcast
+from podcastdownloader.resolution_cache import ResolutionCache
+from podcastdownloader.scheduler import DownloadScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _new_totals() -> dict:
+    return {'episodes': 0, 'bytes': 0, 'unknown_sizes': 0, 'deduplicated': 0}
+
+
+class DownloadPlan:
+    def __init__(self, resolutions: Optional[ResolutionCache] = None, deduplicator: Optional[Deduplicator] = None):
+        self.resolutions = resolutions
+        self.deduplicator = deduplicator
+        self.podcasts: dict[str, dict] = {}
+        self.hosts: collections.defaultdict[str, dict] = collections.defaultdict(_new_totals)
+        self.totals = _new_totals()
+        self._planned_identifiers: set[str] = set()
+
+    def get_expected_size(self, episode: Episode) -> Optional[int]:
+        size = episode.length
+        if not size and self.resolutions and (resolution := self.resolutions.get(episode.url)):
+            size = resolution.content_length
+        if not size:
+            return None
+        # An interrupted download is resumed, so only the rest of the file is downloaded
+        if episode.file_path and episode.partial_path.exists():
+            size = max(size - episode.partial_path.stat().st_size, 0)
+        return size
+
+    def _is_copy(self, episode: Episode) -> bool:
+        identifiers = Deduplicator._get_identifiers(episode)
+        # Episodes that appear in more than one feed are only downloaded for the first of them
+        if not self._planned_identifiers.isdisjoint(identifiers) or self.deduplicator.find_copy(episode):
+            return True
+        self._planned_identifiers.update(identifiers)
+        return False
+
+    def add_podcast(self, podcast: Podcast, missing_episodes: list[Episode]):
+        podcast_totals = self.podcasts.setdefault(podcast.name, _new_totals())
+        for episode in missing_episodes:
+            host = DownloadScheduler.get_host(episode)
+            if self.deduplicator and self._is_copy(episode):
+                for entry in (podcast_totals, self.hosts[host], self.totals):
+                    entry['deduplicated'] += 1
+                continue
+            size = self.get_expected_size(episode)
+            for entry in (podcast_totals, self.hosts[host], self.totals):
+                entry['episodes'] += 1
+                if size is None:
+                    entry['unknown_sizes'] += 1
+                else:
+                    entry['bytes'] += size
+
+    def get_eta(self, bytes_per_second: Optional[float]) -> Optional[float]:
+        if not bytes_per_second:
+            return None
+        return self.totals['bytes'] / bytes_per_second
+
+    def to_dict(self, bytes_per_second: Optional[float] = None) -> dict:
+        return {
+            'totals': self.totals,
+            'bytes_per_second': bytes_per_second,
+            'eta_seconds': self.get_eta(bytes_per_second),
+            'podcasts': self.podcasts,
+            'hosts': dict(self.hosts),
+        }
+
+    @staticmethod
+    def _format_rows(heading: str, rows: dict[str, dict]) -> list[str]:
+        width = max([len(heading)] + [len(name) for name in rows])
+        lines = [f'{heading:<{width}}  {"Episodes":>8}  {"Size":>11}  {"Unknown":>7}  {"Linked":>6}']
+        for name, totals in sorted(rows.items(), key=lambda item: (-item[1]['bytes'], item[0])):
+            lines.append(
+                f'{name:<{width}}  {totals["episodes"]:>8}  {format_size(totals["bytes"]):>11}  '
+                f'{totals["unknown_sizes"]:>7}  {totals["deduplicated"]:>6}')
+        return lines
+
+    def format_table(self, bytes_per_second: Optional[float] = None) -> str:
+        lines = self._format_rows('Podcast', {name: t for name, t in self.podcasts.items() if any(t.values())})
+        lines.append('')
+        lines.extend(self._format_rows('Host', self.hosts))
+        lines.append('')
+        lines.append(
+            f'{self.totals["episodes"]} episodes to download, {format_size(self.totals["bytes"])} in total')
+        if self.totals['unknown_sizes']:
+            lines.append(f'{self.totals["unknown_sizes"]} episodes have no known size and are not counted')
+        if self.totals['deduplicated']:
+            lines.append(f'{self.totals["deduplicated"]} episodes are copies of other episodes and will be linked')
+        if (eta := self.get_eta(bytes_per_second)) is not None:
+            lines.append(f'Estimated time at {format_size(bytes_per_second)}/s: {format_duration(eta)}')
+        else:
+            lines.append('No estimate of the time, as no downloads have been recorded yet')
+        return '\n'.join(lines) + '\n'
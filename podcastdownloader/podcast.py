@@ -1,40 +1,124 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+import asyncio
+import contextlib
+import datetime
+import email.utils
 import logging
+import re
+from concurrent.futures import Executor
 from pathlib import Path
 from typing import Optional
 
 import aiohttp
 import aiohttp.client_exceptions
-import feedparser
-import feedparser.exceptions
+from multidict import CIMultiDictProxy
 
 from podcastdownloader.episode import Episode
 from podcastdownloader.exceptions import FeedException
+from podcastdownloader.feed_cache import FeedCache
+from podcastdownloader.metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
 
+_entry_end_pattern = re.compile(rb'</(?:[\w.-]+:)?(?:item|entry)\s*>', re.IGNORECASE)
+
+
+def _truncate_feed(feed_data: bytes, limit: int) -> bytes:
+    cut_position = None
+    last_position = None
+    for i, match in enumerate(_entry_end_pattern.finditer(feed_data), start=1):
+        if i == limit:
+            cut_position = match.end()
+        last_position = match.end()
+    if cut_position is None or cut_position == last_position:
+        return feed_data
+    # Keep everything after the final entry so that the closing tags of the document remain
+    return feed_data[:cut_position] + feed_data[last_position:]
+
+
+def _compact_entry(entry: dict) -> dict:
+    result = {key: entry[key] for key in FeedCache.cached_entry_keys if key in entry}
+    if 'links' in result:
+        result['links'] = [dict(link) for link in result['links']]
+    return result
+
+
+def _parse_feed(url: str, feed_data: bytes, limit: Optional[int] = None) -> tuple[str, list[dict]]:
+    if limit:
+        feed_data = _truncate_feed(feed_data, limit)
+    import feedparser
+    feed = feedparser.parse(feed_data)
+    if feed['bozo']:
+        raise FeedException(f'Feed from {url} was malformed')
+    # Only the fields that are used are returned, so that the rest of the parsed document can be freed
+    return feed['feed']['title'], [_compact_entry(entry) for entry in feed['entries'][:limit]]
+
+
+def _get_cache_lifetime(headers: CIMultiDictProxy) -> Optional[float]:
+    cache_control = headers.get('Cache-Control', '')
+    if re.search(r'\b(?:no-cache|no-store)\b', cache_control, re.IGNORECASE):
+        return None
+    if match := re.search(r'\bmax-age\s*=\s*"?(\d+)', cache_control, re.IGNORECASE):
+        return float(match.group(1))
+    try:
+        expires = email.utils.parsedate_to_datetime(headers['Expires'])
+        date = email.utils.parsedate_to_datetime(headers['Date']) if 'Date' in headers else None
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not expires.tzinfo:
+        expires = expires.replace(tzinfo=datetime.timezone.utc)
+    if date is None:
+        date = datetime.datetime.now(datetime.timezone.utc)
+    elif not date.tzinfo:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (expires - date).total_seconds())
+
+
 class Podcast:
+    __slots__ = ('url', 'name', 'location', 'episodes', 'unchanged', 'cache_lifetime')
+
     def __init__(self, url: str):
         self.url = url
-        self.feed: Optional[feedparser.FeedParserDict] = None
         self.name: Optional[str] = None
         self.location: Optional[Path] = None
         self.episodes: Optional[list[Episode]] = []
+        self.unchanged = False
+        self.cache_lifetime: Optional[float] = None
 
-    async def download_feed(self, session: aiohttp.ClientSession):
+    async def download_feed(
+            self,
+            session: aiohttp.ClientSession,
+            cache: Optional[FeedCache] = None,
+            executor: Optional[Executor] = None,
+            limit: Optional[int] = None,
+            metrics: Optional[Metrics] = None,
+    ):
+        cached = cache.load(self.url) if cache else None
+        if cached and not FeedCache.covers_limit(cached, limit):
+            cached = None
         try:
-            async with session.get(self.url) as response:
+            async with session.get(self.url, headers=FeedCache.get_conditional_headers(cached)) as response:
+                self.cache_lifetime = _get_cache_lifetime(response.headers)
+                self.unchanged = response.status == 304 and bool(cached)
+                if self.unchanged:
+                    logger.debug(f'Feed from {self.url} unchanged since last retrieval')
+                    if not self.episodes:
+                        self.name = cached['name']
+                        self.episodes = [Episode.parse_dict(entry, self.name) for entry in cached['entries'][:limit]]
+                    return
                 feed_data = await response.content.read()
                 if response.status != 200:
                     raise FeedException(f'Failed to download feed from {self.url}: Response code {response.status}')
-        except aiohttp.client_exceptions.ClientError as e:
-            raise FeedException(f'Failed to download feed from {self.url}: {e}')
-        feed = feedparser.parse(feed_data)
-        if feed['bozo']:
-            raise FeedException(f'Feed from {self.url} was malformed')
-        self.feed = feed
-        self.name = feed['feed']['title']
-        self.episodes = [Episode.parse_dict(entry, self.name) for entry in self.feed['entries']]
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except (aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            raise FeedException(f'Failed to download feed from {self.url}: {e or type(e).__name__}')
+        with metrics.timed('feed_parsing') if metrics else contextlib.nullcontext():
+            self.name, entries = await asyncio.get_running_loop().run_in_executor(
+                executor, _parse_feed, self.url, feed_data, limit)
+        self.episodes = [Episode.parse_dict(entry, self.name) for entry in entries]
+        if cache:
+            cache.save(self.url, etag, last_modified, self.name, entries, limit)
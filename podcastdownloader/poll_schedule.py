@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import datetime
+import logging
+import statistics
+from typing import Optional
+
+from podcastdownloader.podcast import Podcast
+
+logger = logging.getLogger(__name__)
+
+
+class PollSchedule:
+    def __init__(
+            self,
+            min_interval: float,
+            max_interval: float,
+            cadence_fraction: float = 0.25,
+            recent_entries: int = 10,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cadence_fraction = cadence_fraction
+        self.recent_entries = recent_entries
+
+    @staticmethod
+    def get_publish_times(podcast: Podcast) -> list[datetime.datetime]:
+        return sorted((episode.date for episode in podcast.episodes if episode.date), reverse=True)
+
+    def get_publish_cadence(self, podcast: Podcast) -> Optional[float]:
+        publish_times = self.get_publish_times(podcast)[:self.recent_entries]
+        gaps = [(newer - older).total_seconds() for newer, older in zip(publish_times, publish_times[1:])]
+        gaps = [gap for gap in gaps if gap > 0]
+        return statistics.median(gaps) if gaps else None
+
+    def get_interval(self, podcast: Podcast, failures: int = 0) -> float:
+        cadence = self.get_publish_cadence(podcast)
+        interval = cadence * self.cadence_fraction if cadence else self.min_interval
+        if podcast.cache_lifetime:
+            # There is no point asking again before the server's own copy can have changed
+            interval = max(interval, podcast.cache_lifetime)
+        interval *= 2 ** failures
+        return min(max(interval, self.min_interval), self.max_interval)
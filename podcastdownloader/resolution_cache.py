@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Resolution:
+    __slots__ = ('final_url', 'content_type', 'content_length')
+
+    def __init__(self, final_url: str, content_type: Optional[str] = None, content_length: Optional[int] = None):
+        self.final_url = final_url
+        self.content_type = content_type
+        self.content_length = content_length
+
+
+class ResolutionCache:
+    # Uses are recorded in memory and written together, so that a lookup does not need a transaction of its own
+    _uses_per_write = 1000
+
+    def __init__(self, database_path: Path, lifetime: float = 86400, max_entries: int = 100000):
+        self.lifetime = lifetime
+        self.max_entries = max_entries
+        database_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(database_path, timeout=60)
+        with self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS resolutions (
+                    url TEXT PRIMARY KEY,
+                    final_url TEXT NOT NULL,
+                    content_type TEXT,
+                    content_length INTEGER,
+                    resolved_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )''')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS resolutions_used_at ON resolutions (used_at)')
+        self._count = self._connection.execute('SELECT COUNT(*) FROM resolutions').fetchone()[0]
+        self._uses: dict[str, float] = {}
+
+    def __enter__(self) -> 'ResolutionCache':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._write_uses()
+        self._connection.close()
+
+    def count(self) -> int:
+        return self._count
+
+    def get(self, url: str) -> Optional[Resolution]:
+        row = self._connection.execute(
+            'SELECT final_url, content_type, content_length, resolved_at FROM resolutions WHERE url = ?',
+            (url,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[3] > self.lifetime:
+            self.invalidate(url)
+            return None
+        self._uses[url] = now
+        if len(self._uses) >= self._uses_per_write:
+            self._write_uses()
+        return Resolution(row[0], row[1], row[2])
+
+    def put(self, url: str, resolution: Resolution):
+        now = time.time()
+        with self._connection:
+            existing = self._connection.execute('SELECT 1 FROM resolutions WHERE url = ?', (url,)).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO resolutions '
+                '(url, final_url, content_type, content_length, resolved_at, used_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (url, resolution.final_url, resolution.content_type, resolution.content_length, now, now),
+            )
+        if not existing:
+            self._count += 1
+        if self._count > self.max_entries:
+            self._evict()
+
+    def invalidate(self, url: str):
+        self._uses.pop(url, None)
+        with self._connection:
+            if self._connection.execute('DELETE FROM resolutions WHERE url = ?', (url,)).rowcount:
+                self._count -= 1
+
+    def _write_uses(self):
+        if self._uses:
+            with self._connection:
+                self._connection.executemany(
+                    'UPDATE resolutions SET used_at = ? WHERE url = ?', [(t, url) for url, t in self._uses.items()])
+            self._uses.clear()
+
+    def _evict(self):
+        # A tenth is removed at once so that eviction does not run on every insertion once the cache is full
+        keep = self.max_entries - self.max_entries // 10
+        self._write_uses()
+        with self._connection:
+            self._connection.execute('DELETE FROM resolutions WHERE resolved_at < ?', (time.time() - self.lifetime,))
+            self._connection.execute('''
+                DELETE FROM resolutions WHERE url IN (
+                    SELECT url FROM resolutions ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                )''', (keep,))
+        self._count = self._connection.execute('SELECT COUNT(*) FROM resolutions').fetchone()[0]
+        logger.debug(f'Redirect cache trimmed to {self._count} entries')
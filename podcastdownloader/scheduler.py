@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+import urllib.parse
+from typing import Optional
+
+from podcastdownloader.episode import Episode
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_update = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_update) * self.rate)
+        self._last_update = now
+
+    def get_delay(self, amount: float = 1) -> float:
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self._tokens) / self.rate)
+
+    def consume(self, amount: float = 1) -> float:
+        # The bucket may go into debt, in which case the caller should wait for the returned number of seconds
+        self._refill()
+        self._tokens -= amount
+        return max(0.0, -self._tokens / self.rate)
+
+
+class _HostState:
+    def __init__(self, bucket: Optional[TokenBucket]):
+        self.pending: list[tuple[float, int, Episode]] = []
+        self.active = 0
+        self.not_before = 0.0
+        self.bucket = bucket
+
+
+SCHEDULING_POLICIES = ('round-robin', 'newest', 'smallest', 'weighted')
+
+
+class DownloadScheduler:
+    def __init__(
+            self,
+            max_host_connections: int,
+            host_rate_limit: Optional[float],
+            max_attempts: int,
+            retry_base_delay: float = 30,
+            retry_max_delay: float = 300,
+            policy: str = 'round-robin',
+    ):
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f'Unknown scheduling policy: {policy}')
+        self.max_host_connections = max_host_connections
+        self.host_rate_limit = host_rate_limit
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.policy = policy
+        self._hosts: dict[str, _HostState] = {}
+        self._weights: dict[str, float] = {}
+        self._virtual_times: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._attempts: dict[Episode, int] = {}
+        self._unfinished = 0
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    @staticmethod
+    def get_host(episode: Episode) -> str:
+        return urllib.parse.urlsplit(episode.url).netloc
+
+    def _get_host_state(self, episode: Episode) -> _HostState:
+        host = self.get_host(episode)
+        if host not in self._hosts:
+            bucket = TokenBucket(self.host_rate_limit) if self.host_rate_limit else None
+            self._hosts[host] = _HostState(bucket)
+        return self._hosts[host]
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(state.pending) for state in self._hosts.values())
+
+    def set_weight(self, podcast_name: str, weight: float):
+        self._weights[podcast_name] = weight
+
+    def get_priority(self, episode: Episode) -> float:
+        if self.policy == 'newest':
+            return -episode.date.timestamp() if episode.date else math.inf
+        elif self.policy == 'smallest':
+            return episode.length if episode.length else math.inf
+        # Each podcast advances its own clock by the inverse of its weight per queued episode, so heavier
+        # podcasts get proportionally more of the downloads and no podcast waits behind another's whole backlog
+        weight = self._weights.get(episode.podcast_name, 1.0) if self.policy == 'weighted' else 1.0
+        virtual_time = max(self._virtual_times.get(episode.podcast_name, 0.0), self._virtual_time) + 1 / weight
+        self._virtual_times[episode.podcast_name] = virtual_time
+        return virtual_time
+
+    def put(self, episode: Episode):
+        entry = (self.get_priority(episode), next(self._sequence), episode)
+        heapq.heappush(self._get_host_state(episode).pending, entry)
+        self._unfinished += 1
+        self._changed.set()
+
+    def close(self):
+        self._closed = True
+        self._changed.set()
+
+    def _take_ready_episode(self) -> tuple[Optional[Episode], Optional[float]]:
+        now = time.monotonic()
+        next_ready = None
+        best_host = None
+        for host, state in self._hosts.items():
+            if not state.pending or state.active >= self.max_host_connections:
+                continue
+            delay = max(state.not_before - now, state.bucket.get_delay() if state.bucket else 0)
+            if delay > 0:
+                next_ready = delay if next_ready is None else min(next_ready, delay)
+            elif best_host is None or state.pending[0][0] < self._hosts[best_host].pending[0][0]:
+                best_host = host
+        if best_host is None:
+            return None, next_ready
+        state = self._hosts[best_host]
+        if state.bucket:
+            state.bucket.consume()
+        state.active += 1
+        # Move the host to the back so that ties go to a different server next time
+        self._hosts[best_host] = self._hosts.pop(best_host)
+        priority, _, episode = heapq.heappop(state.pending)
+        if self.policy in ('round-robin', 'weighted'):
+            # Podcasts queued later start from the current position rather than ahead of everyone else
+            self._virtual_time = max(self._virtual_time, priority)
+        return episode, None
+
+    async def get(self) -> Optional[Episode]:
+        while not (self._closed and self._unfinished == 0):
+            episode, next_ready = self._take_ready_episode()
+            if episode:
+                return episode
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), next_ready)
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+    def retry(self, episode: Episode, retry_after: Optional[float] = None) -> bool:
+        attempts = self._attempts.pop(episode, 0) + 1
+        if attempts >= self.max_attempts:
+            return False
+        self._attempts[episode] = attempts
+        if retry_after is None:
+            retry_after = min(self.retry_base_delay * 2 ** (attempts - 1), self.retry_max_delay)
+        state = self._get_host_state(episode)
+        state.not_before = max(state.not_before, time.monotonic() + retry_after)
+        logger.debug(f'Delaying requests to {self.get_host(episode)} for {retry_after:.0f} seconds')
+        self.put(episode)
+        return True
+
+    def task_done(self, episode: Episode):
+        self._get_host_state(episode).active -= 1
+        self._unfinished -= 1
+        self._changed.set()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import contextlib
+import errno
+import hashlib
+import logging
+import re
+from pathlib import Path
+from typing import IO, Iterator, Optional, TypeVar
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import EpisodeException
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_shard_pattern = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+
+
+def parse_shard(value: str) -> 'Shard':
+    match = _shard_pattern.match(value)
+    if not match:
+        raise ValueError(f'Could not parse shard {value}, expected the form 1/4')
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f'Shard {value} is out of range')
+    return Shard(index - 1, count)
+
+
+class Shard:
+    def __init__(self, index: int = 0, count: int = 1, worker_index: int = 0, worker_count: int = 1):
+        self.index = index
+        self.count = count
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+
+    def __str__(self) -> str:
+        result = f'{self.index + 1}/{self.count}'
+        if self.worker_count > 1:
+            result += f' worker {self.worker_index + 1}/{self.worker_count}'
+        return result
+
+    @property
+    def is_partial(self) -> bool:
+        return self.count > 1 or self.worker_count > 1
+
+    def for_worker(self, worker_index: int, worker_count: int) -> 'Shard':
+        return Shard(self.index, self.count, worker_index, worker_count)
+
+    @staticmethod
+    def _get_key(url: str) -> int:
+        # The built-in hash is salted per process, so it would give every machine a different split
+        return int.from_bytes(hashlib.sha256(url.encode('utf-8')).digest()[:8], 'big')
+
+    def contains(self, url: str) -> bool:
+        key = self._get_key(url)
+        # Workers split their machine's shard further, so that any number of them can be used on each machine
+        return key % self.count == self.index and (key // self.count) % self.worker_count == self.worker_index
+
+    def select(self, feeds: dict[str, T]) -> dict[str, T]:
+        if not self.is_partial:
+            return feeds
+        return {url: value for url, value in feeds.items() if self.contains(url)}
+
+
+class EpisodeLocks:
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self._lock_file: Optional[IO] = None
+        self._held: set[int] = set()
+
+    def __enter__(self) -> 'EpisodeLocks':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @staticmethod
+    def _get_offset(episode: Episode) -> int:
+        # Only the part of the path below the destination is used, as it may be mounted elsewhere on other machines
+        name = f'{episode.file_path.parent.name}/{episode.file_path.name}'
+        return int.from_bytes(hashlib.sha256(name.encode('utf-8')).digest()[:7], 'big')
+
+    def _get_lock_file(self) -> IO:
+        if self._lock_file is None:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(self.file_path, 'a')
+        return self._lock_file
+
+    @contextlib.contextmanager
+    def hold(self, episode: Episode) -> Iterator[bool]:
+        if fcntl is None:
+            yield True
+            return
+        offset = self._get_offset(episode)
+        # Record locks belong to the whole process, so episodes held by this process are tracked here
+        if offset in self._held:
+            yield False
+            return
+        # Each episode locks a single byte of one shared file, so that no file is left behind for every episode
+        try:
+            lock_file = self._get_lock_file()
+            fcntl.lockf(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EAGAIN):
+                raise EpisodeException(f'Could not lock "{episode.title}" from "{episode.podcast_name}": {e}')
+            yield False
+            return
+        self._held.add(offset)
+        try:
+            yield True
+        finally:
+            self._held.discard(offset)
+            fcntl.lockf(lock_file, fcntl.LOCK_UN, 1, offset)
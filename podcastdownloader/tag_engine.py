@@ -2,6 +2,7 @@
 # coding=utf-8
 
 import logging
+from pathlib import Path
 
 import mutagen
 import mutagen.id3
@@ -20,8 +21,27 @@ class TagEngine:
         pass
 
     @staticmethod
-    def tag_episode(episode: Episode):
-        tag_file = mutagen.File(episode.file_path)
+    def tag_episode(episode: Episode) -> bool:
+        try:
+            tag_file, changed = TagEngine._apply_tags(episode, episode.file_path)
+            # Saving can rewrite the entire file, so it is skipped when the tags are already correct
+            if changed:
+                tag_file.save()
+            return changed
+        except mutagen.MutagenError as e:
+            raise TagEngineError(f'Could not write tags to {episode.title} in {episode.podcast_name}: {e}')
+
+    @staticmethod
+    def has_episode_tags(episode: Episode, file_path: Path) -> bool:
+        # The tags are only applied in memory, to find whether the file already carries those of the episode
+        try:
+            return not TagEngine._apply_tags(episode, file_path)[1]
+        except (mutagen.MutagenError, TagEngineError, OSError):
+            return False
+
+    @staticmethod
+    def _apply_tags(episode: Episode, file_path: Path) -> tuple[mutagen.FileType, bool]:
+        tag_file = mutagen.File(file_path)
         if tag_file is None:
             raise TagEngineError(f'Could not write tags to {episode.title} in {episode.podcast_name}')
         try:
@@ -29,24 +49,41 @@ class TagEngine:
         except mutagen.MutagenError:
             pass
         if isinstance(tag_file.tags, mutagen.id3.ID3):
-            TagEngine._write_id3_tags(episode, tag_file)
+            changed = TagEngine._write_id3_tags(episode, tag_file)
         elif isinstance(tag_file.tags, mutagen.mp4.MP4Tags):
-            TagEngine._write_mp4_tags(episode, tag_file)
+            changed = TagEngine._write_mp4_tags(episode, tag_file)
         else:
             raise TagEngineError(f'Tagging for type {type(tag_file).__name__} not supported')
+        return tag_file, changed
 
     @staticmethod
-    def _write_id3_tags(episode: Episode, tag_file: mutagen.File):
-        tag_file.tags.add(PCST(value=True))  # Podcast Flag
-        tag_file.tags.add(TALB(encoding=3, text=episode.podcast_name))
-        tag_file.tags.add(TDES(encoding=3, text=episode.feed.get('summary', '')))
-        tag_file.tags.add(TIT2(encoding=3, text=episode.title))
-        tag_file.save()
+    def _write_id3_tags(episode: Episode, tag_file: mutagen.File) -> bool:
+        frames = (
+            PCST(value=True),  # Podcast Flag
+            TALB(encoding=3, text=episode.podcast_name),
+            TDES(encoding=3, text=episode.summary or ''),
+            TIT2(encoding=3, text=episode.title),
+        )
+        changed = False
+        for frame in frames:
+            existing = tag_file.tags.get(frame.HashKey)
+            # Empty text frames are not written to the file, so they will never be found on a later run
+            if existing != frame and not (existing is None and getattr(frame, 'text', None) == ['']):
+                tag_file.tags.add(frame)
+                changed = True
+        return changed
 
     @staticmethod
-    def _write_mp4_tags(episode: Episode, tag_file: mutagen.File):
-        tag_file.tags['\xa9nam'] = episode.title  # Episode title
-        tag_file.tags['\xa9alb'] = episode.podcast_name  # Podcast name
-        tag_file.tags['pcst'] = True  # Podcast bit
-        tag_file.tags['desc'] = episode.feed.get('summary', '')
-        tag_file.save()
+    def _write_mp4_tags(episode: Episode, tag_file: mutagen.File) -> bool:
+        tags = {
+            '\xa9nam': [episode.title],  # Episode title
+            '\xa9alb': [episode.podcast_name],  # Podcast name
+            'pcst': True,  # Podcast bit
+            'desc': [episode.summary or ''],
+        }
+        changed = False
+        for key, value in tags.items():
+            if tag_file.tags.get(key) != value:
+                tag_file.tags[key] = value
+                changed = True
+        return changed
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import collections
+import datetime
+import time
+from pathlib import Path
+from typing import Optional
+
+import aiohttp.web
+import pytest
+
+from podcastdownloader.admission import AdmissionController, parse_bandwidth, parse_bandwidth_schedule, parse_size
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import InsufficientSpaceException
+from podcastdownloader.tests.test_episode import _serve_and_download
+
+_DiskUsage = collections.namedtuple('_DiskUsage', ('total', 'used', 'free'))
+
+
+@pytest.mark.parametrize(('test_size', 'expected'), (
+    ('1024', 1024),
+    ('1K', 1024),
+    ('1.5M', 1536 * 1024),
+    ('2GiB', 2 * 1024 ** 3),
+    ('10 kb', 10 * 1024),
+))
+def test_parse_size(test_size: str, expected: int):
+    assert parse_size(test_size) == expected
+
+
+@pytest.mark.parametrize('test_size', ('', 'fast', '1X', '-1'))
+def test_parse_size_bad(test_size: str):
+    with pytest.raises(ValueError):
+        parse_size(test_size)
+
+
+@pytest.mark.parametrize('test_size', ('0', '0K', '0.1'))
+def test_parse_bandwidth_zero(test_size: str):
+    with pytest.raises(ValueError):
+        parse_bandwidth(test_size)
+
+
+@pytest.mark.parametrize('test_entry', ('08:00-18:00=fast', '22:00-06:00=0'))
+def test_parse_bandwidth_schedule_bad(test_entry: str):
+    with pytest.raises(ValueError):
+        parse_bandwidth_schedule((test_entry,))
+
+
+@pytest.mark.parametrize(('test_time', 'expected'), (
+    (datetime.time(9, 0), 1024),
+    (datetime.time(17, 59), 1024),
+    (datetime.time(18, 0), None),
+    (datetime.time(23, 0), 4096),
+    (datetime.time(1, 0), 4096),
+    (datetime.time(7, 0), 2048),
+))
+def test_bandwidth_schedule(test_time: datetime.time, expected: Optional[int]):
+    schedule = parse_bandwidth_schedule(('08:00-18:00=1K', '18:00-22:00=unlimited', '22:00-06:00=4K'))
+    admission = AdmissionController(Path('.'), bandwidth_limit=2048, bandwidth_schedule=schedule)
+    assert admission.get_bandwidth_limit(test_time) == expected
+
+
+def test_reserve_respects_free_space_floor(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr('shutil.disk_usage', lambda _path: _DiskUsage(1000, 0, 1000))
+    admission = AdmissionController(tmp_path, free_space_floor=200)
+    first = Episode('first', 'https://example.com/1.mp3', 'test')
+    second = Episode('second', 'https://example.com/2.mp3', 'test')
+    admission.reserve(first, 500)
+    with pytest.raises(InsufficientSpaceException):
+        admission.reserve(second, 400)
+    asyncio.run(admission.transfer(first, 200))
+    assert admission.reserved == 300
+    admission.release(first)
+    admission.reserve(second, 400)
+    assert admission.reserved == 400
+
+
+def test_transfer_limits_bandwidth(tmp_path: Path):
+    async def run() -> float:
+        admission = AdmissionController(tmp_path, bandwidth_limit=1_000_000)
+        episode = Episode('test', 'https://example.com/1.mp3', 'test')
+        start = time.monotonic()
+        await asyncio.gather(*[admission.transfer(episode, 250_000) for _ in range(5)])
+        return time.monotonic() - start
+    assert asyncio.run(run()) >= 0.1
+
+
+def test_download_refused_without_space(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    requests = []
+
+    async def handler(_request: aiohttp.web.Request):
+        requests.append(_request.path)
+        return aiohttp.web.Response(body=bytes(2000))
+
+    monkeypatch.setattr('shutil.disk_usage', lambda _path: _DiskUsage(10000, 9000, 1000))
+    episode = Episode('test', '', 'test_podcast')
+    episode.file_path = Path(tmp_path, 'test_podcast', 'test.mp3')
+    admission = AdmissionController(tmp_path)
+    with pytest.raises(InsufficientSpaceException):
+        _serve_and_download(episode, handler, admission=admission)
+    assert requests == ['/episode.mp3']
+    assert not episode.file_path.exists()
+    assert not episode.partial_path.exists()
+    assert admission.reserved == 0
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+
+import aiohttp.test_utils
+import aiohttp.web
+import pytest
+
+from podcastdownloader.connection import ConnectionSettings
+from podcastdownloader.exceptions import FeedException
+from podcastdownloader.metrics import Metrics
+from podcastdownloader.podcast import Podcast
+
+
+def test_connection_settings_create_session():
+    async def run():
+        settings = ConnectionSettings(20, 5, 45, 600, 10, 20, 300)
+        async with settings.create_session() as session:
+            assert session.connector.limit == 20
+            assert session.connector.limit_per_host == 5
+            assert session.timeout.sock_connect == 10
+            assert session.timeout.sock_read == 20
+            assert session.timeout.total == 300
+    asyncio.run(run())
+
+
+def test_connection_settings_reuse_connections():
+    async def handler(_request: aiohttp.web.Request):
+        return aiohttp.web.Response(body=b'test')
+
+    async def run() -> Metrics:
+        metrics = Metrics()
+        app = aiohttp.web.Application()
+        app.router.add_get('/', handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            async with ConnectionSettings().create_session(metrics) as session:
+                for _ in range(5):
+                    async with session.get(server.make_url('/')) as response:
+                        await response.read()
+        return metrics
+
+    metrics = asyncio.run(run())
+    assert metrics.counters['connections_created'] == 1
+    assert metrics.counters['connections_reused'] == 4
+
+
+def test_stalled_feed_times_out():
+    async def handler(_request: aiohttp.web.Request):
+        await asyncio.sleep(5)
+        return aiohttp.web.Response(text='')
+
+    async def run():
+        app = aiohttp.web.Application()
+        app.router.add_get('/', handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            async with ConnectionSettings(read_timeout=0.1).create_session() as session:
+                with pytest.raises(FeedException):
+                    await Podcast(str(server.make_url('/'))).download_feed(session)
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from podcastdownloader.deduplicator import Deduplicator
+from podcastdownloader.download_index import DownloadIndex
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import EpisodeException, InsufficientSpaceException
+
+
+def _make_episode(directory: Path, podcast: str, url: str, guid: Optional[str] = None) -> Episode:
+    episode = Episode('test', url, podcast, guid=guid)
+    episode.file_path = Path(directory, podcast, 'test.mp3')
+    return episode
+
+
+def _raise_os_error(*_args):
+    raise OSError('Not supported')
+
+
+def test_find_copy_by_identifiers(tmp_path: Path):
+    deduplicator = Deduplicator()
+    original = _make_episode(tmp_path, 'first', 'https://example.com/1.mp3', 'short')
+    original.file_path.parent.mkdir()
+    original.file_path.write_bytes(b'test')
+    original.content_hash = 'abc'
+    deduplicator.record(original)
+    assert deduplicator.find_copy(_make_episode(tmp_path, 'second', 'https://example.com/1.mp3')) == \
+        (original.file_path, 'abc')
+    # Short GUIDs are not trusted across podcasts
+    assert deduplicator.find_copy(_make_episode(tmp_path, 'second', 'https://example.com/2.mp3', 'short')) is None
+    assert deduplicator.find_copy(original) is None
+
+
+def test_find_copy_from_index(tmp_path: Path):
+    guid = 'urn:uuid:0b7d2f5e-6a56-4b0b-9a47-5d3c2f5a1e8f'
+    with DownloadIndex(Path(tmp_path, 'index.sqlite'), tmp_path) as download_index:
+        original = _make_episode(tmp_path, 'first', 'https://example.com/1.mp3', guid)
+        original.file_path.parent.mkdir()
+        original.file_path.write_bytes(b'test')
+        original.content_hash = 'abc'
+        download_index.add(original)
+        deduplicator = Deduplicator(download_index)
+        republished = _make_episode(tmp_path, 'second', 'https://other.example.com/1.mp3', guid)
+        assert deduplicator.find_copy(republished) == (original.file_path, 'abc')
+        republished.content_hash = 'abc'
+        assert deduplicator.find_identical(republished) == original.file_path
+
+
+def test_link_hardlink(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Deduplicator, '_reflink', staticmethod(_raise_os_error))
+    source = Path(tmp_path, 'source.mp3')
+    source.write_bytes(b'test')
+    target = Path(tmp_path, 'podcast', 'target.mp3')
+    deduplicator = Deduplicator()
+    assert deduplicator.link(source, target) == 'hardlink'
+    assert os.path.samefile(source, target)
+    assert deduplicator.bytes_saved == 4
+    assert not Path(tmp_path, 'podcast', 'target.mp3.link').exists()
+
+
+def test_link_copy_fallback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Deduplicator, '_reflink', staticmethod(_raise_os_error))
+    monkeypatch.setattr(os, 'link', _raise_os_error)
+    source = Path(tmp_path, 'source.mp3')
+    source.write_bytes(b'test')
+    target = Path(tmp_path, 'target.mp3')
+    target.write_bytes(b'existing')
+    deduplicator = Deduplicator()
+    assert deduplicator.link(source, target, allow_copy=False) is None
+    assert target.read_bytes() == b'existing'
+    assert deduplicator.link(source, target) == 'copy'
+    assert target.read_bytes() == b'test'
+    assert deduplicator.bytes_saved == 0
+
+
+def test_link_without_hardlink(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Deduplicator, '_reflink', staticmethod(_raise_os_error))
+    source = Path(tmp_path, 'source.mp3')
+    source.write_bytes(b'test')
+    target = Path(tmp_path, 'target.mp3')
+    deduplicator = Deduplicator()
+    assert deduplicator.link(source, target, allow_copy=False, allow_hardlink=False) is None
+    assert not target.exists()
+    assert deduplicator.link(source, target, allow_hardlink=False) == 'copy'
+    assert not os.path.samefile(source, target)
+
+
+def test_link_copy_failure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Deduplicator, '_reflink', staticmethod(_raise_os_error))
+    monkeypatch.setattr(os, 'link', _raise_os_error)
+
+    def fail_copy(_source: Path, target: Path):
+        target.write_bytes(b'te')
+        raise OSError('No space left on device')
+    monkeypatch.setattr(shutil, 'copyfile', fail_copy)
+    source = Path(tmp_path, 'source.mp3')
+    source.write_bytes(b'test')
+    target = Path(tmp_path, 'target.mp3')
+    with pytest.raises(EpisodeException):
+        Deduplicator().link(source, target)
+    assert list(tmp_path.iterdir()) == [source]
+
+
+def test_link_copy_reserves_space(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Deduplicator, '_reflink', staticmethod(_raise_os_error))
+    monkeypatch.setattr(os, 'link', _raise_os_error)
+    source = Path(tmp_path, 'source.mp3')
+    source.write_bytes(b'test')
+    target = Path(tmp_path, 'target.mp3')
+    reservations = []
+    assert Deduplicator().link(source, target, reserve=reservations.append) == 'copy'
+    assert reservations == [4]
+
+    def refuse(_size: int):
+        raise InsufficientSpaceException('No space')
+    target.unlink()
+    with pytest.raises(InsufficientSpaceException):
+        Deduplicator().link(source, target, reserve=refuse)
+    assert list(tmp_path.iterdir()) == [source]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import sqlite3
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from podcastdownloader.download_index import DownloadIndex
+from podcastdownloader.episode import Episode
+
+
+@pytest.fixture()
+def download_index(tmp_path: Path) -> DownloadIndex:
+    with DownloadIndex(Path(tmp_path, '.podcastdownloader', 'index.sqlite'), tmp_path) as result:
+        yield result
+
+
+def _make_episode(destination: Path, title: str, guid: str = None) -> Episode:
+    episode = Episode(title, f'https://www.example.com/{title}.mp3', 'Test Podcast', guid=guid)
+    episode.file_path = Path(destination, 'Test Podcast', f'{title}.mp3')
+    return episode
+
+
+def test_index_lookup_by_guid_survives_rename(download_index: DownloadIndex, tmp_path: Path):
+    episode = _make_episode(tmp_path, 'Old Title', 'guid-1')
+    download_index.add(episode, 10)
+    renamed = _make_episode(tmp_path, 'New Title', 'guid-1')
+    renamed.url = 'https://www.example.com/new.mp3'
+    assert download_index.lookup([renamed]) == {renamed: episode.file_path}
+
+
+def test_index_lookup_by_url(download_index: DownloadIndex, tmp_path: Path):
+    episode = _make_episode(tmp_path, 'Title')
+    download_index.add(episode, 10)
+    other = _make_episode(tmp_path, 'Other')
+    result = download_index.lookup([episode, other])
+    assert result == {episode: episode.file_path}
+
+
+def test_index_rebuild(download_index: DownloadIndex, tmp_path: Path):
+    assert download_index.is_empty()
+    podcast_directory = Path(tmp_path, 'Test Podcast')
+    podcast_directory.mkdir()
+    Path(podcast_directory, 'Title.mp3').write_bytes(b'test')
+    Path(podcast_directory, 'Partial.mp3.part').write_bytes(b'test')
+    Path(podcast_directory, 'episode_playlist.m3u').write_text('')
+    removed = _make_episode(tmp_path, 'Removed', 'guid-2')
+    download_index.add(removed, 10)
+
+    download_index.rebuild()
+    assert download_index.count() == 1
+    episode = _make_episode(tmp_path, 'Title', 'guid-1')
+    assert download_index.lookup([episode, removed]) == {episode: episode.file_path}
+    renamed = _make_episode(tmp_path, 'New Title', 'guid-1')
+    assert download_index.lookup([renamed]) == {renamed: episode.file_path}
+
+
+class _InterruptedConnection:
+    def __init__(self, connection: sqlite3.Connection, interruption: Callable[[], None]):
+        self._connection = connection
+        self._interruption = interruption
+
+    def __enter__(self):
+        return self._connection.__enter__()
+
+    def __exit__(self, *args):
+        return self._connection.__exit__(*args)
+
+    def __getattr__(self, name: str):
+        return getattr(self._connection, name)
+
+    def execute(self, *args) -> list:
+        result = list(self._connection.execute(*args))
+        self._interruption()
+        return result
+
+
+def test_index_rebuild_concurrently(download_index: DownloadIndex, tmp_path: Path):
+    podcast_directory = Path(tmp_path, 'Test Podcast')
+    podcast_directory.mkdir()
+    Path(podcast_directory, 'Title.mp3').write_bytes(b'test')
+    with DownloadIndex(Path(tmp_path, '.podcastdownloader', 'index.sqlite'), tmp_path) as other_index:
+        # Another process adds the same files after this one has read what is already indexed
+        other_index._connection = _InterruptedConnection(other_index._connection, download_index.rebuild)
+        other_index.rebuild()
+    assert download_index.count() == 1
@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 # coding=utf-8
 import asyncio
+from pathlib import Path
+from typing import Optional
 
 import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
 import pytest
 
-from podcastdownloader.episode import Episode
+from podcastdownloader.episode import Episode, ExtensionLookups
 from podcastdownloader.exceptions import EpisodeException
 
 
-@pytest.fixture(scope='session')
-def client_session() -> aiohttp.ClientSession:
-    out = aiohttp.ClientSession()
-    return out
+def _get_file_extension(url: str, mime_type: Optional[str]) -> str:
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await Episode._get_file_extension(url, mime_type, session)
+    return asyncio.run(run())
 
 
 @pytest.mark.parametrize(('test_link_dict', 'expected'), (
@@ -60,11 +65,97 @@ def test_episode_find_url_bad(test_link_dict: list[dict]):
     ('https://www.example.com/test.mp3?test=value#test', '.mp3'),
     ('https://www.example.com/test.aac', '.aac'),
 ))
-def test_determine_file_extension_from_url(test_url: str, expected: str, client_session):
-    result = asyncio.run(Episode._get_file_extension(test_url, client_session))
+def test_determine_file_extension_from_url(test_url: str, expected: str):
+    result = _get_file_extension(test_url, None)
     assert result == expected
 
 
+@pytest.mark.parametrize(('test_url', 'test_mime_type', 'expected'), (
+    ('https://www.example.com/test.mp3', 'audio/x-m4a', '.mp3'),
+    ('https://www.example.com/redirect/12345', 'audio/mpeg', '.mp3'),
+    ('https://www.example.com/redirect/12345', 'audio/x-m4a', '.m4a'),
+    ('https://www.example.com/redirect/12345', 'audio/mp4', '.m4a'),
+    ('https://www.example.com/redirect/12345', 'audio/mpeg; charset=binary', '.mp3'),
+))
+def test_determine_file_extension_from_enclosure_type(test_url: str, test_mime_type: str, expected: str):
+    result = _get_file_extension(test_url, test_mime_type)
+    assert result == expected
+
+
+def test_determine_file_extension_from_head_request():
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.method)
+        return aiohttp.web.Response(headers={'Content-Type': 'audio/mpeg'})
+
+    async def run():
+        app = aiohttp.web.Application()
+        app.router.add_route('*', '/play/{number}', handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            async with aiohttp.ClientSession() as session:
+                extension_lookups = ExtensionLookups()
+                return await asyncio.gather(*[Episode._get_file_extension(
+                    str(server.make_url(f'/play/{i}')), 'audio/unknown', session, extension_lookups=extension_lookups)
+                    for i in range(5)])
+    assert asyncio.run(run()) == ['.mp3'] * 5
+    assert requests == ['HEAD']
+
+
+def _head_file_extensions(handler, count: int) -> list:
+    async def run():
+        app = aiohttp.web.Application()
+        app.router.add_route('*', '/play/{number}', handler)
+        app.router.add_route('*', '/files/{name}', handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            async with aiohttp.ClientSession() as session:
+                extension_lookups = ExtensionLookups()
+                results = []
+                for i in range(count):
+                    try:
+                        results.append(await Episode._get_file_extension(
+                            str(server.make_url(f'/play/{i}')), None, session, extension_lookups=extension_lookups))
+                    except EpisodeException:
+                        results.append(None)
+                return results
+    return asyncio.run(run())
+
+
+def test_determine_file_extension_ignores_failed_head_request():
+    async def handler(_request: aiohttp.web.Request):
+        return aiohttp.web.Response(status=405, text='Method not allowed')
+    assert _head_file_extensions(handler, 1) == [None]
+
+
+def test_determine_file_extension_retries_failed_head_request():
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.path)
+        if len(requests) == 1:
+            return aiohttp.web.Response(status=503, text='Unavailable')
+        return aiohttp.web.Response(headers={'Content-Type': 'audio/mpeg'})
+    assert _head_file_extensions(handler, 3) == [None, '.mp3', '.mp3']
+    assert requests == ['/play/0', '/play/1']
+
+
+def test_determine_file_extension_from_redirected_url():
+    async def handler(request: aiohttp.web.Request):
+        if request.match_info.get('number'):
+            raise aiohttp.web.HTTPFound('/files/episode.m4a')
+        return aiohttp.web.Response(headers={'Content-Type': 'application/octet-stream'})
+    assert _head_file_extensions(handler, 1) == ['.m4a']
+
+
+@pytest.mark.parametrize(('test_url', 'expected'), (
+    ('https://www.example.com/play/123/456', ('www.example.com', '/play/#')),
+    ('https://www.example.com/play/124/457', ('www.example.com', '/play/#')),
+    ('https://www.example.com/episode', ('www.example.com', '')),
+))
+def test_get_url_pattern(test_url: str, expected: tuple[str, str]):
+    assert Episode._get_url_pattern(test_url) == expected
+
+
 @pytest.mark.parametrize(('test_name', 'expected'), (
     ('test', 'test'),
     ('te/st', 'test'),
@@ -74,3 +165,72 @@ def test_determine_file_extension_from_url(test_url: str, expected: str, client_
 def test_clean_name(test_name: str, expected: str):
     result = Episode._clean_name(test_name)
     assert result == expected
+
+
+def _serve_and_download(episode: Episode, handler, **kwargs):
+    async def run():
+        app = aiohttp.web.Application()
+        app.router.add_get('/episode.mp3', handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            episode.url = str(server.make_url('/episode.mp3'))
+            async with aiohttp.ClientSession() as session:
+                await episode.download(session, **kwargs)
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('chunk_size', (1, 7, 1024, 1024 * 1024))
+def test_download_streams_in_chunks(chunk_size: int, tmp_path: Path):
+    payload = bytes(range(256)) * 40
+
+    async def handler(_request):
+        return aiohttp.web.Response(body=payload)
+
+    episode = Episode('test', '', 'test_podcast')
+    episode.file_path = Path(tmp_path, 'test_podcast', 'test.wav')
+    _serve_and_download(episode, handler, chunk_size=chunk_size)
+    assert episode.file_path.read_bytes() == payload
+
+
+@pytest.mark.parametrize(('partial_length', 'supports_range'), (
+    (0, True),
+    (1000, True),
+    (1000, False),
+    (10240, True),
+))
+def test_download_resumes_partial_file(partial_length: int, supports_range: bool, tmp_path: Path):
+    payload = bytes(range(256)) * 40
+
+    async def handler(request: aiohttp.web.Request):
+        if supports_range and request.http_range.start:
+            start = request.http_range.start
+            if start >= len(payload):
+                return aiohttp.web.Response(status=416)
+            return aiohttp.web.Response(
+                status=206,
+                body=payload[start:],
+                headers={'Content-Range': f'bytes {start}-{len(payload) - 1}/{len(payload)}'},
+            )
+        return aiohttp.web.Response(body=payload)
+
+    episode = Episode('test', '', 'test_podcast')
+    episode.file_path = Path(tmp_path, 'test_podcast', 'test.wav')
+    episode.file_path.parent.mkdir()
+    if partial_length:
+        episode.partial_path.write_bytes(payload[:partial_length])
+    _serve_and_download(episode, handler)
+    assert episode.file_path.read_bytes() == payload
+    assert not episode.partial_path.exists()
+
+
+def test_download_keeps_partial_file_on_error(tmp_path: Path):
+    async def handler(_request):
+        return aiohttp.web.Response(status=404)
+
+    episode = Episode('test', '', 'test_podcast')
+    episode.file_path = Path(tmp_path, 'test_podcast', 'test.wav')
+    episode.file_path.parent.mkdir()
+    episode.partial_path.write_bytes(b'partial')
+    with pytest.raises(EpisodeException):
+        _serve_and_download(episode, handler)
+    assert not episode.file_path.exists()
+    assert episode.partial_path.read_bytes() == b'partial'
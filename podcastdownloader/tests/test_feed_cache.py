@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+from pathlib import Path
+
+import pytest
+
+from podcastdownloader.feed_cache import FeedCache
+
+
+@pytest.fixture()
+def feed_cache(tmp_path: Path) -> FeedCache:
+    return FeedCache(Path(tmp_path, 'feeds'))
+
+
+def test_feed_cache_round_trip(feed_cache: FeedCache):
+    entries = [{
+        'title': 'Episode 1',
+        'links': [{'type': 'audio/mpeg', 'href': 'https://www.example.com/1.mp3'}],
+        'summary': 'summary',
+        'published_parsed': object(),
+    }]
+    feed_cache.save('https://www.example.com/feed', '"abc"', 'Mon, 01 Jan 2001 00:00:00 GMT', 'Test', entries)
+    result = feed_cache.load('https://www.example.com/feed')
+    assert result['etag'] == '"abc"'
+    assert result['name'] == 'Test'
+    assert result['entries'] == [{
+        'title': 'Episode 1',
+        'links': [{'type': 'audio/mpeg', 'href': 'https://www.example.com/1.mp3'}],
+        'summary': 'summary',
+    }]
+
+
+def test_feed_cache_missing_entry(feed_cache: FeedCache):
+    assert feed_cache.load('https://www.example.com/feed') is None
+
+
+def test_feed_cache_corrupt_entry(feed_cache: FeedCache):
+    feed_cache.save('https://www.example.com/feed', None, None, 'Test', [])
+    next(feed_cache.directory.iterdir()).write_text('{')
+    assert feed_cache.load('https://www.example.com/feed') is None
+
+
+def test_feed_cache_clear(feed_cache: FeedCache):
+    feed_cache.save('https://www.example.com/feed', None, None, 'Test', [])
+    feed_cache.clear()
+    assert feed_cache.load('https://www.example.com/feed') is None
+
+
+@pytest.mark.parametrize(('cached', 'expected'), (
+    (None, {}),
+    ({'etag': None, 'last_modified': None}, {}),
+    ({'etag': '"abc"', 'last_modified': None}, {'If-None-Match': '"abc"'}),
+    ({'etag': '"abc"', 'last_modified': 'date'}, {'If-None-Match': '"abc"', 'If-Modified-Since': 'date'}),
+))
+def test_get_conditional_headers(cached: dict, expected: dict):
+    assert FeedCache.get_conditional_headers(cached) == expected
+
+
+@pytest.mark.parametrize(('cached_limit', 'limit', 'expected'), (
+    (None, None, True),
+    (None, 5, True),
+    (5, 5, True),
+    (5, 3, True),
+    (5, 10, False),
+    (5, None, False),
+))
+def test_covers_limit(cached_limit: int, limit: int, expected: bool):
+    assert FeedCache.covers_limit({'limit': cached_limit}, limit) == expected
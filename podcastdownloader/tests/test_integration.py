@@ -1,16 +1,46 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
 from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
 
+import aiohttp.test_utils
+import aiohttp.web
+import click
 import pytest
 from click.testing import CliRunner
 
-from podcastdownloader.__main__ import cli
+import podcastdownloader.__main__
+from podcastdownloader.__main__ import (
+    _coordinate_workers,
+    cli,
+    download_episodes,
+    open_download_index,
+    plan_downloads,
+    retag_podcast_episodes,
+    update_episode_tags,
+    verify_episodes,
+    watch_feeds,
+)
+from podcastdownloader.deduplicator import Deduplicator
+from podcastdownloader.episode import Episode
+from podcastdownloader.metrics import ThroughputHistory
+from podcastdownloader.podcast import Podcast
+from podcastdownloader.poll_schedule import PollSchedule
+from podcastdownloader.sharding import Shard
+from podcastdownloader.utility_functions import get_state_directory
+
+T = TypeVar('T')
 
 
 @pytest.mark.parametrize('test_args', (
     [],
+    ['--shard', '2/3'],
 ))
 def test_download_no_feeds(test_args: list[str], tmp_path: Path):
     runner = CliRunner()
@@ -26,3 +56,370 @@ def test_download_single_feed(test_args: list[str], tmp_path: Path):
     runner = CliRunner()
     result = runner.invoke(cli, ['download', '-vv', str(tmp_path)] + test_args)
     assert result.exit_code == 0
+
+
+def _make_feed(title: str, base_url: str, count: int) -> str:
+    items = ''.join(
+        f'<item><title>{title} {i}</title><guid>{title}-{i}</guid>'
+        f'<enclosure url="{base_url}/media/{title}/{i}.mp3" length="4" type="audio/mpeg"/></item>'
+        for i in range(count)
+    )
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>{title}</title>{items}</channel></rss>'
+
+
+class _PodcastServer:
+    def __init__(self, episode_count: int = 2, media_body: bytes = b'test'):
+        self.episode_count = episode_count
+        self.media_body = media_body
+        self.feed_requests: list[str] = []
+        self.media_requests: list[str] = []
+
+    async def handle_feed(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        self.feed_requests.append(request.path)
+        return aiohttp.web.Response(
+            text=_make_feed(request.match_info['title'], f'{request.scheme}://{request.host}', self.episode_count))
+
+    async def handle_media(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        self.media_requests.append(request.path)
+        return aiohttp.web.Response(body=self.media_body)
+
+    # The handlers are looked up for every request, so that a test can replace either of them
+    async def _dispatch_feed(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return await self.handle_feed(request)
+
+    async def _dispatch_media(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return await self.handle_media(request)
+
+    @staticmethod
+    def feed_urls(server: aiohttp.test_utils.TestServer, *titles: str) -> set[str]:
+        return {str(server.make_url(f'/feed/{title}')) for title in titles}
+
+    def run(self, test: Callable[[aiohttp.test_utils.TestServer], Awaitable[T]]) -> T:
+        async def run():
+            app = aiohttp.web.Application()
+            app.router.add_get('/feed/{title}', self._dispatch_feed)
+            app.router.add_route('*', '/media/{title}/{number}', self._dispatch_media)
+            app.router.add_route('*', '/media/{name}', self._dispatch_media)
+            async with aiohttp.test_utils.TestServer(app) as server:
+                return await test(server)
+        return asyncio.run(run())
+
+
+@pytest.fixture()
+def podcast_server(request: pytest.FixtureRequest) -> _PodcastServer:
+    return _PodcastServer(**getattr(request, 'param', {}))
+
+
+def test_download_episodes_pipelines_feeds(podcast_server: _PodcastServer, tmp_path: Path):
+    events = []
+
+    async def handle_feed(request: aiohttp.web.Request):
+        if request.match_info['title'] == 'slow':
+            await asyncio.sleep(0.5)
+        events.append(f'feed {request.match_info["title"]}')
+        return await _PodcastServer.handle_feed(podcast_server, request)
+
+    async def handle_media(request: aiohttp.web.Request):
+        events.append(f'media {request.match_info["title"]}')
+        return await _PodcastServer.handle_media(podcast_server, request)
+    podcast_server.handle_feed = handle_feed
+    podcast_server.handle_media = handle_media
+
+    podcast_server.run(lambda server: download_episodes(
+        _PodcastServer.feed_urls(server, 'slow', 'fast'), tmp_path, 4, (), None))
+    assert events.index('media fast') < events.index('feed slow')
+    assert sorted(p.name for p in tmp_path.glob('*/*.mp3')) == ['fast 0.mp3', 'fast 1.mp3', 'slow 0.mp3', 'slow 1.mp3']
+
+
+def test_download_episodes_single_worker(podcast_server: _PodcastServer, tmp_path: Path):
+    podcast_server.run(lambda server: download_episodes(
+        _PodcastServer.feed_urls(server, 'first', 'second'), tmp_path, 1, (), None))
+    assert len(list(tmp_path.glob('*/*.mp3'))) == 4
+
+
+@pytest.mark.parametrize('podcast_server', ({'episode_count': 3},), indirect=True)
+def test_download_episodes_writes_playlist_of_downloaded_episodes(podcast_server: _PodcastServer, tmp_path: Path):
+    async def handle_media(request: aiohttp.web.Request):
+        if request.match_info['number'] == '1.mp3':
+            return aiohttp.web.Response(status=404)
+        return aiohttp.web.Response(body=b'test')
+    podcast_server.handle_media = handle_media
+
+    podcast_server.run(lambda server: download_episodes(
+        _PodcastServer.feed_urls(server, 'test'), tmp_path, 2, ('m3u',), None))
+    assert Path(tmp_path, 'test', 'episode_playlist.m3u').read_text() == '#EXTM3U\n./test 2.mp3\n./test 0.mp3\n'
+
+
+def test_download_episodes_uses_index(podcast_server: _PodcastServer, tmp_path: Path):
+    counts = []
+
+    async def run(server: aiohttp.test_utils.TestServer):
+        for _ in range(2):
+            with open_download_index(tmp_path) as download_index:
+                await download_episodes(
+                    _PodcastServer.feed_urls(server, 'test'), tmp_path, 4, (), None, download_index=download_index)
+                counts.append(download_index.count())
+
+    podcast_server.run(run)
+    assert sorted(podcast_server.media_requests) == ['/media/test/0.mp3', '/media/test/1.mp3']
+    # The first run starts with an empty index, and its downloads must still be recorded
+    assert counts == [2, 2]
+
+
+def test_download_episodes_skips_episodes_without_path(podcast_server: _PodcastServer, tmp_path: Path):
+    async def handle_feed(request: aiohttp.web.Request):
+        base_url = f'{request.scheme}://{request.host}/media/test'
+        return aiohttp.web.Response(text=(
+            '<?xml version="1.0"?><rss version="2.0"><channel><title>test</title>'
+            f'<item><title>test 0</title><guid>test-0</guid>'
+            f'<enclosure url="{base_url}/0.mp3" length="4" type="audio/mpeg"/></item>'
+            f'<item><title>test 1</title><guid>test-1</guid>'
+            f'<enclosure url="{base_url}/1" length="4" type="audio/x-unknown"/></item>'
+            '</channel></rss>'))
+
+    async def handle_media(request: aiohttp.web.Request):
+        if request.method == 'HEAD':
+            return aiohttp.web.Response(status=405)
+        return await _PodcastServer.handle_media(podcast_server, request)
+    podcast_server.handle_feed = handle_feed
+    podcast_server.handle_media = handle_media
+
+    podcast_server.run(lambda server: download_episodes(
+        _PodcastServer.feed_urls(server, 'test'), tmp_path, 2, ('m3u',), None))
+    assert [p.name for p in tmp_path.glob('*/*.mp3')] == ['test 0.mp3']
+    assert Path(tmp_path, 'test', 'episode_playlist.m3u').read_text() == '#EXTM3U\n./test 0.mp3\n'
+
+
+def test_plan_downloads_opens_no_media_connections(podcast_server: _PodcastServer, tmp_path: Path):
+    async def run(server: aiohttp.test_utils.TestServer):
+        with open_download_index(tmp_path) as download_index:
+            await download_episodes(
+                _PodcastServer.feed_urls(server, 'first'), tmp_path, 4, (), None, download_index=download_index)
+            podcast_server.media_requests.clear()
+            return await plan_downloads(
+                _PodcastServer.feed_urls(server, 'first', 'second'), tmp_path, 4, None, download_index=download_index)
+
+    plan = podcast_server.run(run)
+    assert podcast_server.media_requests == []
+    assert plan.totals == {'episodes': 2, 'bytes': 8, 'unknown_sizes': 0, 'deduplicated': 0}
+    assert plan.podcasts['first']['episodes'] == 0
+    assert plan.podcasts['second']['episodes'] == 2
+
+
+def test_coordinate_workers_records_combined_throughput(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    @click.command()
+    def transfer(**_kwargs):
+        return 1000
+    monkeypatch.setitem(cli.commands, 'transfer', transfer)
+    arguments = {'verbose': 0, 'destination': str(tmp_path), 'clear_feed_cache': False, 'rebuild_index': False}
+    assert _coordinate_workers('transfer', Shard(), 3, arguments)
+    # The index is prepared before the workers start, so that they do not all build it at once
+    assert Path(get_state_directory(tmp_path), 'index.sqlite').exists()
+    history = ThroughputHistory(Path(get_state_directory(tmp_path), 'throughput.json'))
+    assert [run_bytes for run_bytes, _ in history._load_runs()] == [3000]
+
+
+def test_download_logs_completion(podcast_server: _PodcastServer, tmp_path: Path):
+    async def run(server: aiohttp.test_utils.TestServer):
+        feed_url, = _PodcastServer.feed_urls(server, 'test')
+        return await asyncio.to_thread(
+            CliRunner().invoke, cli, ['download', '-vv', '-s', '-f', feed_url, str(tmp_path)])
+
+    result = podcast_server.run(run)
+    assert result.exit_code == 0
+    assert len(list(tmp_path.glob('*/*.mp3'))) == 2
+    assert 'Program Complete' in result.output
+
+
+@pytest.mark.parametrize('test_args', (
+    ['--bandwidth-limit', '0'],
+    ['--bandwidth-schedule', '22:00-06:00=0'],
+))
+def test_download_zero_bandwidth(test_args: list[str], tmp_path: Path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ['download', str(tmp_path)] + test_args)
+    assert result.exit_code == 2
+    assert 'must be more than zero' in result.output
+
+
+def test_plan_no_feeds(tmp_path: Path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ['plan', '-vv', str(tmp_path)])
+    assert result.exit_code == 0
+    assert 'No feeds have been provided' in result.output
+
+
+def _watch_briefly(server: aiohttp.test_utils.TestServer, destination: Path, poll_schedule: PollSchedule):
+    async def run():
+        stop_event = asyncio.Event()
+        watcher = asyncio.create_task(watch_feeds(
+            _PodcastServer.feed_urls(server, 'test'),
+            destination,
+            2,
+            (),
+            None,
+            poll_schedule,
+            stop_event=stop_event,
+        ))
+        await asyncio.sleep(0.5)
+        stop_event.set()
+        await watcher
+    return run()
+
+
+def test_watch_feeds_downloads_new_episodes(podcast_server: _PodcastServer, tmp_path: Path):
+    async def handle_feed(request: aiohttp.web.Request):
+        podcast_server.episode_count = 1 if not podcast_server.feed_requests else 2
+        return await _PodcastServer.handle_feed(podcast_server, request)
+    podcast_server.handle_feed = handle_feed
+
+    podcast_server.run(lambda server: _watch_briefly(server, tmp_path, PollSchedule(0.05, 0.05)))
+    assert len(podcast_server.feed_requests) > 2
+    assert sorted(podcast_server.media_requests) == ['/media/test/0.mp3', '/media/test/1.mp3']
+    assert sorted(p.name for p in tmp_path.glob('*/*.mp3')) == ['test 0.mp3', 'test 1.mp3']
+
+
+def test_watch_feeds_reschedules_after_unexpected_error(
+        podcast_server: _PodcastServer,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    async def failing_queue(*_args):
+        raise RuntimeError('Unexpected')
+    monkeypatch.setattr(podcastdownloader.__main__, 'queue_new_episodes', failing_queue)
+
+    podcast_server.run(lambda server: _watch_briefly(server, tmp_path, PollSchedule(0.01, 0.05)))
+    assert len(podcast_server.feed_requests) > 1
+
+
+@pytest.mark.parametrize('podcast_server', ({'media_body': b'same audio'},), indirect=True)
+def test_download_episodes_deduplicates(podcast_server: _PodcastServer, tmp_path: Path):
+    def make_feed(title: str, urls: list[str]) -> str:
+        items = ''.join(
+            f'<item><title>{title} {i}</title><guid>{title}-{i}</guid>'
+            f'<enclosure url="{url}" length="4" type="audio/mpeg"/></item>'
+            for i, url in enumerate(urls)
+        )
+        return f'<?xml version="1.0"?><rss version="2.0"><channel><title>{title}</title>{items}</channel></rss>'
+
+    async def handle_feed(request: aiohttp.web.Request):
+        base_url = f'{request.scheme}://{request.host}/media'
+        if request.match_info['title'] == 'original':
+            urls = [f'{base_url}/shared.mp3']
+        else:
+            urls = [f'{base_url}/shared.mp3', f'{base_url}/republished.mp3']
+        return aiohttp.web.Response(text=make_feed(request.match_info['title'], urls))
+    podcast_server.handle_feed = handle_feed
+
+    async def run(server: aiohttp.test_utils.TestServer):
+        with open_download_index(tmp_path) as download_index:
+            for title in ('original', 'bestof'):
+                await download_episodes(
+                    _PodcastServer.feed_urls(server, title),
+                    tmp_path,
+                    2,
+                    (),
+                    None,
+                    download_index=download_index,
+                    deduplicator=Deduplicator(download_index),
+                )
+
+    podcast_server.run(run)
+    assert sorted(podcast_server.media_requests) == ['/media/republished.mp3', '/media/shared.mp3']
+    original = Path(tmp_path, 'original', 'original 0.mp3')
+    assert Path(tmp_path, 'bestof', 'bestof 0.mp3').stat().st_ino == original.stat().st_ino or \
+        Path(tmp_path, 'bestof', 'bestof 0.mp3').read_bytes() == original.read_bytes()
+    assert Path(tmp_path, 'bestof', 'bestof 1.mp3').read_bytes() == b'same audio'
+
+
+def _download_and_verify(
+        server: aiohttp.test_utils.TestServer,
+        destination: Path,
+        damage: Callable[[], None],
+        **kwargs,
+):
+    async def run():
+        feeds = _PodcastServer.feed_urls(server, 'test')
+        with open_download_index(destination) as download_index:
+            await download_episodes(feeds, destination, 4, (), None, download_index=download_index)
+            damage()
+            await verify_episodes(
+                feeds, destination, 4, 0.02, False, True, Path(destination, 'results.json'),
+                download_index=download_index, **kwargs)
+    return run()
+
+
+@pytest.mark.parametrize('podcast_server', ({'episode_count': 3},), indirect=True)
+def test_verify_episodes(podcast_server: _PodcastServer, tmp_path: Path):
+    async def handle_media(request: aiohttp.web.Request):
+        if request.method == 'HEAD' and request.match_info['number'] == '2.mp3':
+            return aiohttp.web.Response(headers={'Content-Length': '100'})
+        return aiohttp.web.Response(body=b'test')
+    podcast_server.handle_media = handle_media
+
+    def damage():
+        Path(tmp_path, 'test', 'test 0.mp3').write_bytes(b'te')
+        Path(tmp_path, 'test', 'test 1.mp3').unlink()
+
+    podcast_server.run(lambda server: _download_and_verify(server, tmp_path, damage))
+    report = json.loads(Path(tmp_path, 'results.json').read_text())
+    assert report['summary'] == {'ok': 1, 'size_mismatch': 1, 'missing': 1}
+    assert {e['title']: e['status'] for e in report['episodes']} == {
+        'test 0': 'size_mismatch',
+        'test 1': 'missing',
+        'test 2': 'ok',
+    }
+    assert [Path(tmp_path, 'test', f'test {i}.mp3').read_bytes() for i in range(2)] == [b'test', b'test']
+
+
+@pytest.mark.parametrize('podcast_server', ({'episode_count': 1},), indirect=True)
+def test_verify_episodes_keeps_file_when_redownload_fails(podcast_server: _PodcastServer, tmp_path: Path):
+    async def handle_media(request: aiohttp.web.Request):
+        if podcast_server.media_requests:
+            return aiohttp.web.Response(status=404)
+        return await _PodcastServer.handle_media(podcast_server, request)
+    podcast_server.handle_media = handle_media
+
+    def damage():
+        Path(tmp_path, 'test', 'test 0.mp3').write_bytes(b'te')
+
+    podcast_server.run(lambda server: _download_and_verify(server, tmp_path, damage, max_attempts=1))
+    assert Path(tmp_path, 'test', 'test 0.mp3').read_bytes() == b'te'
+
+
+@pytest.mark.parametrize('podcast_server', ({'media_body': (b'\xff\xfb\x90\x64' + bytes(413)) * 10},), indirect=True)
+def test_update_episode_tags(podcast_server: _PodcastServer, tmp_path: Path):
+    async def run(server: aiohttp.test_utils.TestServer):
+        feeds = _PodcastServer.feed_urls(server, 'test')
+        with open_download_index(tmp_path) as download_index:
+            await download_episodes(feeds, tmp_path, 4, (), None, download_index=download_index)
+            Path(tmp_path, 'test', 'test 0.mp3').write_bytes(podcast_server.media_body)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+                return await update_episode_tags(feeds, tmp_path, 4, executor, download_index=download_index)
+
+    assert podcast_server.run(run) == {'updated': 1, 'unchanged': 1}
+
+
+def test_retag_podcast_episodes_skips_shared_files(tmp_path: Path):
+    source = Path(tmp_path, 'first', 'episode.mp3')
+    source.parent.mkdir()
+    source.write_bytes((b'\xff\xfb\x90\x64' + bytes(413)) * 10)
+    podcasts = []
+    for name in ('first', 'second'):
+        podcast = Podcast(f'https://example.com/{name}')
+        podcast.name = name
+        episode = Episode('Episode', 'https://example.com/episode.mp3', name)
+        episode.file_path = Path(tmp_path, name, 'episode.mp3')
+        podcast.episodes = [episode]
+        podcasts.append(podcast)
+    podcasts[1].episodes[0].file_path.parent.mkdir()
+    os.link(source, podcasts[1].episodes[0].file_path)
+    counts = collections.Counter()
+    tagged_inodes = set()
+
+    async def run():
+        for podcast in podcasts:
+            await retag_podcast_episodes(podcast, None, counts, tagged_inodes=tagged_inodes)
+
+    asyncio.run(run())
+    assert counts == {'updated': 1, 'shared': 1}
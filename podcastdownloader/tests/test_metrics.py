@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import json
+import socket
+from pathlib import Path
+
+import aiohttp
+import pytest
+
+from podcastdownloader.metrics import Metrics, MetricsReporter, ThroughputHistory, format_duration, format_size
+
+
+@pytest.mark.parametrize(('test_size', 'expected'), (
+    (512, '512.0 B'),
+    (2048, '2.0 KiB'),
+    (5 * 1024 * 1024, '5.0 MiB'),
+))
+def test_format_size(test_size: int, expected: str):
+    assert format_size(test_size) == expected
+
+
+@pytest.mark.parametrize(('test_seconds', 'expected'), (
+    (0, '0:00:00'),
+    (61.5, '0:01:01'),
+    (90061, '25:01:01'),
+))
+def test_format_duration(test_seconds: float, expected: str):
+    assert format_duration(test_seconds) == expected
+
+
+def test_throughput_history(tmp_path: Path):
+    history = ThroughputHistory(Path(tmp_path, 'throughput.json'), max_runs=2)
+    assert history.get_bytes_per_second() is None
+    history.record(1000, 10)
+    history.record(0, 5)
+    assert history.get_bytes_per_second() == 100
+    history.record(3000, 10)
+    history.record(1000, 10)
+    assert history.get_bytes_per_second() == 200
+
+
+def test_throughput_history_unreadable(tmp_path: Path):
+    file_path = Path(tmp_path, 'throughput.json')
+    file_path.write_text('not json')
+    assert ThroughputHistory(file_path).get_bytes_per_second() is None
+
+
+def test_metrics_snapshot():
+    metrics = Metrics()
+    metrics.add_bytes('a.example', 100)
+    metrics.add_bytes('b.example', 50)
+    metrics.add_bytes('a.example', 100)
+    metrics.increment('episodes_downloaded')
+    metrics.register_gauge('episodes_queued', lambda: 3)
+    with metrics.timed('tagging'):
+        pass
+    with metrics.active_worker():
+        assert metrics.snapshot()['active_workers'] == 1
+    metrics.sample(0.25)
+    snapshot = metrics.snapshot()
+    assert snapshot['bytes_total'] == 250
+    assert snapshot['hosts']['a.example']['bytes_total'] == 200
+    assert snapshot['hosts']['a.example']['bytes_per_second'] > 0
+    assert snapshot['counters'] == {'episodes_downloaded': 1}
+    assert snapshot['queues'] == {'episodes_queued': 3}
+    assert 'tagging' in snapshot['stage_seconds']
+    assert snapshot['active_workers'] == 0
+    assert snapshot['event_loop_lag_seconds'] == 0.25
+
+
+def test_metrics_prometheus_format():
+    metrics = Metrics()
+    metrics.add_bytes('a"b.example', 10)
+    metrics.increment('retries', 2)
+    result = metrics.to_prometheus()
+    assert 'podcastdownloader_bytes_total 10\n' in result
+    assert 'podcastdownloader_host_bytes_total{host="a\\"b.example"} 10\n' in result
+    assert 'podcastdownloader_events_total{event="retries"} 2\n' in result
+
+
+def test_reporter_writes_stats_file(tmp_path: Path):
+    async def work(metrics: Metrics) -> str:
+        metrics.add_bytes('a.example', 1024)
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def run() -> str:
+        metrics = Metrics()
+        reporter = MetricsReporter(metrics, stats_file=Path(tmp_path, 'stats.json'), stats_interval=0.01)
+        return await reporter.run(work(metrics))
+
+    assert asyncio.run(run()) == 'done'
+    stats = json.loads(Path(tmp_path, 'stats.json').read_text())
+    assert stats['bytes_total'] == 1024
+    assert not Path(tmp_path, 'stats.json.tmp').exists()
+
+
+def test_reporter_serves_prometheus_endpoint():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    async def fetch() -> str:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+                return await response.text()
+
+    async def run() -> str:
+        metrics = Metrics()
+        metrics.increment('feeds_filled')
+        return await MetricsReporter(metrics, metrics_port=port).run(fetch())
+
+    assert 'podcastdownloader_events_total{event="feeds_filled"} 1' in asyncio.run(run())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import json
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from podcastdownloader.deduplicator import Deduplicator
+from podcastdownloader.episode import Episode
+from podcastdownloader.planner import DownloadPlan
+from podcastdownloader.podcast import Podcast
+from podcastdownloader.resolution_cache import Resolution, ResolutionCache
+
+
+def _make_podcast(name: str) -> Podcast:
+    podcast = Podcast(f'https://feeds.example.com/{name}')
+    podcast.name = name
+    return podcast
+
+
+def _make_episode(
+        directory: Path,
+        podcast: str,
+        url: str,
+        length: Optional[int] = None,
+        guid: Optional[str] = None,
+) -> Episode:
+    episode = Episode(url.rsplit('/', 1)[-1], url, podcast, guid=guid, length=length)
+    episode.file_path = Path(directory, podcast, episode.title + '.mp3')
+    return episode
+
+
+def test_add_podcast_totals(tmp_path: Path):
+    plan = DownloadPlan()
+    plan.add_podcast(_make_podcast('first'), [
+        _make_episode(tmp_path, 'first', 'https://a.example/1', 100),
+        _make_episode(tmp_path, 'first', 'https://b.example/2', 50),
+    ])
+    plan.add_podcast(_make_podcast('second'), [
+        _make_episode(tmp_path, 'second', 'https://a.example/3', 25),
+        _make_episode(tmp_path, 'second', 'https://a.example/4'),
+    ])
+    assert plan.totals == {'episodes': 4, 'bytes': 175, 'unknown_sizes': 1, 'deduplicated': 0}
+    assert plan.podcasts['first']['bytes'] == 150
+    assert plan.podcasts['second'] == {'episodes': 2, 'bytes': 25, 'unknown_sizes': 1, 'deduplicated': 0}
+    assert plan.hosts['a.example']['episodes'] == 3
+    assert plan.hosts['b.example']['bytes'] == 50
+
+
+def test_add_podcast_subtracts_partial_download(tmp_path: Path):
+    episode = _make_episode(tmp_path, 'test', 'https://a.example/1', 100)
+    episode.file_path.parent.mkdir()
+    episode.partial_path.write_bytes(b'0' * 40)
+    plan = DownloadPlan()
+    plan.add_podcast(_make_podcast('test'), [episode])
+    assert plan.totals['bytes'] == 60
+
+
+def test_add_podcast_uses_cached_length(tmp_path: Path):
+    with ResolutionCache(Path(tmp_path, 'redirects.sqlite')) as resolutions:
+        resolutions.put('https://a.example/1', Resolution('https://cdn.example/1', 'audio/mpeg', 300))
+        plan = DownloadPlan(resolutions)
+        plan.add_podcast(_make_podcast('test'), [_make_episode(tmp_path, 'test', 'https://a.example/1')])
+    assert plan.totals['bytes'] == 300
+    assert plan.totals['unknown_sizes'] == 0
+
+
+def test_add_podcast_deduplicates(tmp_path: Path):
+    guid = 'shared-episode-guid'
+    plan = DownloadPlan(deduplicator=Deduplicator())
+    plan.add_podcast(_make_podcast('first'), [_make_episode(tmp_path, 'first', 'https://a.example/1', 100, guid)])
+    plan.add_podcast(_make_podcast('second'), [_make_episode(tmp_path, 'second', 'https://b.example/1', 100, guid)])
+    assert plan.totals == {'episodes': 1, 'bytes': 100, 'unknown_sizes': 0, 'deduplicated': 1}
+    assert plan.podcasts['second']['deduplicated'] == 1
+
+
+@pytest.mark.parametrize(('bytes_per_second', 'expected'), (
+    (None, None),
+    (0, None),
+    (10.0, 100.0),
+))
+def test_get_eta(bytes_per_second: Optional[float], expected: Optional[float], tmp_path: Path):
+    plan = DownloadPlan()
+    plan.add_podcast(_make_podcast('test'), [_make_episode(tmp_path, 'test', 'https://a.example/1', 1000)])
+    assert plan.get_eta(bytes_per_second) == expected
+
+
+def test_plan_output(tmp_path: Path):
+    plan = DownloadPlan()
+    plan.add_podcast(_make_podcast('test'), [_make_episode(tmp_path, 'test', 'https://a.example/1', 3600)])
+    plan.add_podcast(_make_podcast('empty'), [])
+    table = plan.format_table(1.0)
+    assert 'test' in table
+    assert 'empty' not in table
+    assert 'a.example' in table
+    assert '1:00:00' in table
+    result = json.loads(json.dumps(plan.to_dict(1.0)))
+    assert result['eta_seconds'] == 3600
+    assert result['hosts']['a.example']['episodes'] == 1
+    assert 'No estimate' in plan.format_table()
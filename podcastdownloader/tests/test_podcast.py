@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import concurrent.futures
+import gc
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+import feedparser
+import pytest
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from podcastdownloader.exceptions import FeedException
+from podcastdownloader.feed_cache import FeedCache
+from podcastdownloader.podcast import Podcast, _get_cache_lifetime, _truncate_feed
+
+_parse = feedparser.parse
+
+_test_feed = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>Test Podcast</title>
+<item>
+<title>Episode 2</title>
+<guid>episode-2</guid>
+<enclosure url="https://www.example.com/2.mp3" length="2000" type="audio/mpeg"/>
+</item>
+<item>
+<title>Episode 1</title>
+<guid>episode-1</guid>
+<enclosure url="https://www.example.com/1.mp3" length="1000" type="audio/mpeg"/>
+</item>
+</channel>
+</rss>
+'''
+
+
+def _serve_and_fill(podcasts: list[Podcast], handler, **kwargs):
+    async def run():
+        app = aiohttp.web.Application()
+        app.router.add_get('/feed', handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            async with aiohttp.ClientSession() as session:
+                for podcast in podcasts:
+                    podcast.url = str(server.make_url('/feed'))
+                    await podcast.download_feed(session, **kwargs)
+    asyncio.run(run())
+
+
+def test_download_feed_uses_cache_when_not_modified(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return aiohttp.web.Response(status=304)
+        return aiohttp.web.Response(text=_test_feed, headers={'ETag': '"v1"'})
+
+    parsed = []
+    monkeypatch.setattr('feedparser.parse', lambda data: parsed.append(data) or _parse(data))
+
+    podcast = Podcast('')
+    _serve_and_fill([Podcast(''), podcast], handler, cache=FeedCache(tmp_path))
+    assert requests == [None, '"v1"']
+    assert len(parsed) == 1
+    assert podcast.name == 'Test Podcast'
+    assert [e.title for e in podcast.episodes] == ['Episode 2', 'Episode 1']
+
+
+@pytest.mark.parametrize('executor_type', (None, concurrent.futures.ThreadPoolExecutor,
+                                           concurrent.futures.ProcessPoolExecutor))
+def test_download_feed_in_executor(executor_type: Optional[type]):
+    async def handler(_request):
+        return aiohttp.web.Response(text=_test_feed)
+
+    podcast = Podcast('')
+    if executor_type:
+        with executor_type(max_workers=1) as executor:
+            _serve_and_fill([podcast], handler, executor=executor)
+    else:
+        _serve_and_fill([podcast], handler)
+    assert podcast.name == 'Test Podcast'
+    assert [e.url for e in podcast.episodes] == ['https://www.example.com/2.mp3', 'https://www.example.com/1.mp3']
+
+
+def test_download_feed_malformed():
+    async def handler(_request):
+        return aiohttp.web.Response(text='<rss><channel><title>Broken</title>')
+
+    with pytest.raises(FeedException):
+        _serve_and_fill([Podcast('')], handler)
+
+
+@pytest.mark.parametrize(('test_data', 'limit', 'expected'), (
+    (b'<rss><channel><item>1</item><item>2</item><item>3</item></channel></rss>', 2,
+     b'<rss><channel><item>1</item><item>2</item></channel></rss>'),
+    (b'<rss><channel><item>1</item><item>2</item></channel></rss>', 2,
+     b'<rss><channel><item>1</item><item>2</item></channel></rss>'),
+    (b'<rss><channel><item>1</item></channel></rss>', 5,
+     b'<rss><channel><item>1</item></channel></rss>'),
+    (b'<feed><entry>1</entry>\n<entry>2</entry>\n</feed>', 1,
+     b'<feed><entry>1</entry>\n</feed>'),
+    (b'<rdf:RDF><rss:item>1</rss:item><rss:item>2</rss:item></rdf:RDF>', 1,
+     b'<rdf:RDF><rss:item>1</rss:item></rdf:RDF>'),
+))
+def test_truncate_feed(test_data: bytes, limit: int, expected: bytes):
+    assert _truncate_feed(test_data, limit) == expected
+
+
+def test_download_feed_limit(tmp_path: Path):
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return aiohttp.web.Response(status=304)
+        return aiohttp.web.Response(text=_test_feed, headers={'ETag': '"v1"'})
+
+    class _LimitedPodcast(Podcast):
+        async def download_feed(self, *args, **kwargs):
+            await super().download_feed(*args, limit=1, **kwargs)
+
+    podcasts = [_LimitedPodcast(''), _LimitedPodcast(''), Podcast('')]
+    _serve_and_fill(podcasts, handler, cache=FeedCache(tmp_path))
+    assert [[e.title for e in p.episodes] for p in podcasts] == \
+        [['Episode 2'], ['Episode 2'], ['Episode 2', 'Episode 1']]
+    assert requests == [None, '"v1"', None]
+
+
+@pytest.mark.parametrize(('test_headers', 'expected'), (
+    ({}, None),
+    ({'Cache-Control': 'public, max-age=3600'}, 3600),
+    ({'Cache-Control': 'no-cache, max-age=3600'}, None),
+    ({'Expires': 'Wed, 21 Oct 2015 08:00:00 GMT', 'Date': 'Wed, 21 Oct 2015 07:30:00 GMT'}, 1800),
+    ({'Expires': '0'}, None),
+))
+def test_get_cache_lifetime(test_headers: dict, expected: Optional[float]):
+    assert _get_cache_lifetime(CIMultiDictProxy(CIMultiDict(test_headers))) == expected
+
+
+def _make_large_feed(count: int) -> str:
+    show_notes = 'Show notes for the episode. ' * 200
+    items = ''.join(
+        f'<item><title>Episode {i}</title><guid>episode-{i}</guid><description>Summary {i}</description>'
+        f'<content:encoded><![CDATA[{show_notes}]]></content:encoded>'
+        f'<pubDate>Mon, 06 Sep 2021 16:45:00 GMT</pubDate><itunes:episode>{i}</itunes:episode>'
+        f'<enclosure url="https://example.com/{i}.mp3" length="1000" type="audio/mpeg"/></item>'
+        for i in range(count)
+    )
+    return (
+        '<?xml version="1.0"?><rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+        'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+        f'<channel><title>Test</title>{items}</channel></rss>'
+    )
+
+
+def test_download_feed_memory_use():
+    feed = _make_large_feed(200)
+
+    async def handler(_request: aiohttp.web.Request):
+        return aiohttp.web.Response(text=feed)
+
+    podcast = Podcast('')
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _serve_and_fill([podcast], handler)
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(podcast.episodes) == 200
+    assert podcast.episodes[199].number == 199
+    assert podcast.episodes[0].summary == 'Summary 0'
+    # The show notes alone take up over 1 MB, so this can only pass if the parsed feed is released
+    assert retained < 200 * 2048
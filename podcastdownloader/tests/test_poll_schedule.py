@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import datetime
+from typing import Optional
+
+import pytest
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.podcast import Podcast
+from podcastdownloader.poll_schedule import PollSchedule
+
+
+def _make_podcast(gap: Optional[datetime.timedelta], count: int = 5, cache_lifetime: Optional[float] = None) -> Podcast:
+    podcast = Podcast('https://example.com/feed')
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    podcast.episodes = [
+        Episode(f'test {i}', f'https://example.com/{i}.mp3', 'test', date=start + gap * i if gap else None)
+        for i in range(count)
+    ]
+    podcast.cache_lifetime = cache_lifetime
+    return podcast
+
+
+@pytest.mark.parametrize(('test_podcast', 'test_failures', 'expected'), (
+    (_make_podcast(datetime.timedelta(days=7)), 0, 86400),
+    (_make_podcast(datetime.timedelta(days=1)), 0, 21600),
+    (_make_podcast(datetime.timedelta(hours=1)), 0, 900),
+    (_make_podcast(None), 0, 900),
+    (_make_podcast(datetime.timedelta(days=1), cache_lifetime=43200), 0, 43200),
+    (_make_podcast(datetime.timedelta(days=1)), 1, 43200),
+    (_make_podcast(datetime.timedelta(days=1)), 5, 86400),
+))
+def test_poll_schedule_interval(test_podcast: Podcast, test_failures: int, expected: float):
+    schedule = PollSchedule(900, 86400)
+    assert schedule.get_interval(test_podcast, test_failures) == expected
+
+
+def test_poll_schedule_uses_recent_cadence():
+    podcast = _make_podcast(datetime.timedelta(days=30), count=10)
+    latest = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+    for i in range(10):
+        podcast.episodes.append(
+            Episode(f'new {i}', f'https://example.com/new/{i}.mp3', 'test', date=latest + datetime.timedelta(days=i)))
+    assert PollSchedule(900, 86400 * 30).get_publish_cadence(podcast) == 86400
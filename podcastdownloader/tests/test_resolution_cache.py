@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import contextlib
+import sqlite3
+from pathlib import Path
+
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+import pytest
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.resolution_cache import Resolution, ResolutionCache
+from podcastdownloader.verifier import EpisodeVerifier
+
+
+def test_resolution_cache_persists(tmp_path: Path):
+    database_path = Path(tmp_path, 'redirects.sqlite')
+    with ResolutionCache(database_path) as cache:
+        cache.put('https://a/1.mp3', Resolution('https://cdn/1.mp3', 'audio/mpeg', 1000))
+    with ResolutionCache(database_path) as cache:
+        resolution = cache.get('https://a/1.mp3')
+        assert cache.count() == 1
+    assert (resolution.final_url, resolution.content_type, resolution.content_length) == \
+        ('https://cdn/1.mp3', 'audio/mpeg', 1000)
+
+
+def test_resolution_cache_expires(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr('time.time', lambda: now)
+    with ResolutionCache(Path(tmp_path, 'redirects.sqlite'), lifetime=60) as cache:
+        cache.put('https://a/1.mp3', Resolution('https://cdn/1.mp3'))
+        now += 30
+        assert cache.get('https://a/1.mp3') is not None
+        now += 31
+        assert cache.get('https://a/1.mp3') is None
+        assert cache.count() == 0
+
+
+def test_resolution_cache_evicts_least_recently_used(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr('time.time', lambda: now)
+    with ResolutionCache(Path(tmp_path, 'redirects.sqlite'), max_entries=10) as cache:
+        for i in range(10):
+            now += 1
+            cache.put(f'https://a/{i}.mp3', Resolution(f'https://cdn/{i}.mp3'))
+        now += 1
+        cache.get('https://a/0.mp3')
+        now += 1
+        cache.put('https://a/10.mp3', Resolution('https://cdn/10.mp3'))
+        assert cache.count() == 9
+        assert cache.get('https://a/0.mp3') is not None
+        assert cache.get('https://a/1.mp3') is None
+        assert cache.get('https://a/2.mp3') is None
+        assert cache.get('https://a/10.mp3') is not None
+
+
+def test_resolution_cache_writes_uses_together(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr('time.time', lambda: now)
+    database_path = Path(tmp_path, 'redirects.sqlite')
+
+    def get_used_at() -> float:
+        with contextlib.closing(sqlite3.connect(database_path)) as connection:
+            return connection.execute('SELECT used_at FROM resolutions').fetchone()[0]
+
+    with ResolutionCache(database_path) as cache:
+        cache.put('https://a/1.mp3', Resolution('https://cdn/1.mp3'))
+        now += 1
+        for _ in range(10):
+            cache.get('https://a/1.mp3')
+        assert get_used_at() == 1000.0
+    assert get_used_at() == 1001.0
+
+
+def test_download_skips_known_redirects(tmp_path: Path):
+    payload = b'test' * 100
+    requests = []
+    cdn_available = {'old': True}
+
+    async def redirect_handler(request: aiohttp.web.Request):
+        requests.append(request.path)
+        location = 'old' if cdn_available['old'] else 'new'
+        raise aiohttp.web.HTTPFound(f'/{location}/episode.mp3')
+
+    async def cdn_handler(request: aiohttp.web.Request):
+        requests.append(request.path)
+        if not cdn_available[request.match_info['location']]:
+            return aiohttp.web.Response(status=404)
+        return aiohttp.web.Response(body=payload, content_type='audio/mpeg')
+
+    async def run(cache: ResolutionCache):
+        app = aiohttp.web.Application()
+        app.router.add_get('/episode.mp3', redirect_handler)
+        app.router.add_get('/{location}/episode.mp3', cdn_handler)
+        async with aiohttp.test_utils.TestServer(app) as server:
+            async with aiohttp.ClientSession() as session:
+                for i in range(3):
+                    if i == 2:
+                        cdn_available.update(old=False, new=True)
+                    episode = Episode('test', str(server.make_url('/episode.mp3')), 'test_podcast')
+                    episode.file_path = Path(tmp_path, 'test_podcast', f'{i}.mp3')
+                    await episode.download(session, resolutions=cache)
+                    assert episode.file_path.read_bytes() == payload
+
+    with ResolutionCache(Path(tmp_path, 'redirects.sqlite')) as cache:
+        asyncio.run(run(cache))
+        resolution = next(iter(cache._connection.execute('SELECT final_url, content_length FROM resolutions')))
+    assert requests == [
+        '/episode.mp3', '/old/episode.mp3',
+        '/old/episode.mp3',
+        '/old/episode.mp3', '/episode.mp3', '/new/episode.mp3',
+    ]
+    assert resolution[0].endswith('/new/episode.mp3')
+    assert resolution[1] == len(payload)
+
+
+def test_verifier_uses_cached_size(tmp_path: Path):
+    async def run(cache: ResolutionCache):
+        async with aiohttp.ClientSession() as session:
+            verifier = EpisodeVerifier(session, 0.02, False, 1, resolutions=cache)
+            # The address cannot be connected to, so only the cached size can be used
+            return await verifier._get_remote_size('http://127.0.0.1:9/1.mp3')
+
+    with ResolutionCache(Path(tmp_path, 'redirects.sqlite')) as cache:
+        cache.put('http://127.0.0.1:9/1.mp3', Resolution('https://cdn/1.mp3', 'audio/mpeg', 1000))
+        assert asyncio.run(run(cache)) == 1000
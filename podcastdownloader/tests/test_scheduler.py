@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import datetime
+import time
+from typing import Optional
+
+import pytest
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.scheduler import DownloadScheduler, TokenBucket
+
+
+def _make_episode(
+        url: str,
+        podcast_name: str = 'test_podcast',
+        length: Optional[int] = None,
+        day: Optional[int] = None,
+) -> Episode:
+    date = datetime.datetime(2021, 9, day, tzinfo=datetime.timezone.utc) if day else None
+    return Episode('test', url, podcast_name, length=length, date=date)
+
+
+def _take_all(scheduler: DownloadScheduler, count: int) -> list[str]:
+    async def run():
+        return [(await scheduler.get()).url for _ in range(count)]
+    return asyncio.run(run())
+
+
+def test_scheduler_limits_connections_per_host():
+    async def run():
+        scheduler = DownloadScheduler(1, None, 3)
+        episodes = [_make_episode(f'https://{host}/{i}.mp3') for host in ('a', 'b') for i in range(2)]
+        [scheduler.put(e) for e in episodes]
+        first = await scheduler.get()
+        second = await scheduler.get()
+        assert {DownloadScheduler.get_host(first), DownloadScheduler.get_host(second)} == {'a', 'b'}
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.get(), 0.1)
+        scheduler.task_done(first)
+        third = await asyncio.wait_for(scheduler.get(), 0.1)
+        assert DownloadScheduler.get_host(third) == DownloadScheduler.get_host(first)
+    asyncio.run(run())
+
+
+def test_scheduler_finishes_when_closed_and_drained():
+    async def run():
+        scheduler = DownloadScheduler(1, None, 3)
+        scheduler.put(_make_episode('https://a/1.mp3'))
+        scheduler.close()
+        episode = await scheduler.get()
+        waiter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        scheduler.task_done(episode)
+        assert await asyncio.wait_for(waiter, 0.1) is None
+    asyncio.run(run())
+
+
+def test_scheduler_retry_backs_off_host_only():
+    async def run():
+        scheduler = DownloadScheduler(2, None, 3)
+        failing = _make_episode('https://a/1.mp3')
+        scheduler.put(failing)
+        assert await scheduler.get() is failing
+        assert scheduler.retry(failing, 0.2)
+        scheduler.task_done(failing)
+        other = _make_episode('https://b/1.mp3')
+        scheduler.put(other)
+        assert await asyncio.wait_for(scheduler.get(), 0.1) is other
+        start = time.monotonic()
+        assert await asyncio.wait_for(scheduler.get(), 1) is failing
+        assert time.monotonic() - start >= 0.15
+    asyncio.run(run())
+
+
+def test_scheduler_retry_gives_up():
+    async def run():
+        scheduler = DownloadScheduler(1, None, 2, retry_base_delay=0)
+        episode = _make_episode('https://a/1.mp3')
+        scheduler.put(episode)
+        assert await scheduler.get() is episode
+        assert scheduler.retry(episode)
+        scheduler.task_done(episode)
+        assert await scheduler.get() is episode
+        assert not scheduler.retry(episode)
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(('policy', 'expected'), (
+    ('round-robin', ['https://a/1.mp3', 'https://b/1.mp3', 'https://a/2.mp3', 'https://a/3.mp3']),
+    ('newest', ['https://a/3.mp3', 'https://b/1.mp3', 'https://a/2.mp3', 'https://a/1.mp3']),
+    ('smallest', ['https://a/2.mp3', 'https://b/1.mp3', 'https://a/1.mp3', 'https://a/3.mp3']),
+))
+def test_scheduler_policy_order(policy: str, expected: list[str]):
+    scheduler = DownloadScheduler(4, None, 3, policy=policy)
+    scheduler.put(_make_episode('https://a/1.mp3', 'first', 3000, 1))
+    scheduler.put(_make_episode('https://a/2.mp3', 'first', 1000, 2))
+    scheduler.put(_make_episode('https://a/3.mp3', 'first', None, 4))
+    scheduler.put(_make_episode('https://b/1.mp3', 'second', 2000, 3))
+    assert _take_all(scheduler, 4) == expected
+
+
+def test_scheduler_weighted_policy():
+    scheduler = DownloadScheduler(10, None, 3, policy='weighted')
+    scheduler.set_weight('heavy', 2.5)
+    for i in range(4):
+        scheduler.put(_make_episode(f'https://a/{i}.mp3', 'light'))
+        scheduler.put(_make_episode(f'https://b/{i}.mp3', 'heavy'))
+    assert _take_all(scheduler, 4) == ['https://b/0.mp3', 'https://b/1.mp3', 'https://a/0.mp3', 'https://b/2.mp3']
+
+
+def test_scheduler_late_podcast_does_not_jump_queue():
+    async def run():
+        scheduler = DownloadScheduler(10, None, 3)
+        for i in range(3):
+            scheduler.put(_make_episode(f'https://a/{i}.mp3', 'early'))
+        await scheduler.get()
+        await scheduler.get()
+        for i in range(3):
+            scheduler.put(_make_episode(f'https://b/{i}.mp3', 'late'))
+        return [(await scheduler.get()).url for _ in range(4)]
+    assert asyncio.run(run()) == ['https://a/2.mp3', 'https://b/0.mp3', 'https://b/1.mp3', 'https://b/2.mp3']
+
+
+def test_scheduler_unknown_policy():
+    with pytest.raises(ValueError):
+        DownloadScheduler(1, None, 3, policy='random')
+
+
+def test_token_bucket_delay():
+    bucket = TokenBucket(10, 1)
+    assert bucket.get_delay() == 0
+    assert bucket.consume() == 0
+    assert bucket.get_delay() == pytest.approx(0.1, abs=0.01)
+    assert bucket.consume(5) == pytest.approx(0.5, abs=0.01)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import EpisodeException
+from podcastdownloader.sharding import EpisodeLocks, Shard, parse_shard
+
+
+@pytest.mark.parametrize(('test_value', 'expected'), (
+    ('1/4', (0, 4)),
+    ('4/4', (3, 4)),
+    (' 2 / 3 ', (1, 3)),
+))
+def test_parse_shard(test_value: str, expected: tuple[int, int]):
+    shard = parse_shard(test_value)
+    assert (shard.index, shard.count) == expected
+
+
+@pytest.mark.parametrize('test_value', ('0/4', '5/4', '1', '1/0', 'a/b'))
+def test_parse_shard_bad(test_value: str):
+    with pytest.raises(ValueError):
+        parse_shard(test_value)
+
+
+@pytest.mark.parametrize('worker_counts', (
+    (1,),
+    (1, 1, 1),
+    (4, 2),
+    (3, 1, 2),
+))
+def test_shards_split_feeds_exactly_once(worker_counts: tuple[int]):
+    feeds = {f'https://www.example.com/{i}.rss': {} for i in range(500)}
+    selected = []
+    for index, worker_count in enumerate(worker_counts):
+        for worker_index in range(worker_count):
+            shard = Shard(index, len(worker_counts)).for_worker(worker_index, worker_count)
+            selected.extend(shard.select(feeds))
+    assert sorted(selected) == sorted(feeds)
+
+
+def _hold_lock(lock_path: Path, file_path: Path, held: multiprocessing.Event, release: multiprocessing.Event):
+    episode = Episode('test', 'https://www.example.com/1.mp3', 'test')
+    episode.file_path = file_path
+    with EpisodeLocks(lock_path) as locks, locks.hold(episode):
+        held.set()
+        release.wait(10)
+
+
+def test_episode_locks_exclude_other_processes(tmp_path: Path):
+    episode = Episode('test', 'https://www.example.com/1.mp3', 'test')
+    episode.file_path = Path(tmp_path, 'test', '1.mp3')
+    other = Episode('other', 'https://www.example.com/2.mp3', 'test')
+    other.file_path = Path(tmp_path, 'test', '2.mp3')
+    locks = EpisodeLocks(Path(tmp_path, 'episodes.lock'))
+    held, release = multiprocessing.Event(), multiprocessing.Event()
+    process = multiprocessing.Process(target=_hold_lock, args=(locks.file_path, episode.file_path, held, release))
+    process.start()
+    try:
+        assert held.wait(10)
+        with locks.hold(episode) as result:
+            assert not result
+        with locks.hold(other) as result:
+            assert result
+    finally:
+        release.set()
+        process.join()
+    with locks.hold(episode) as result:
+        assert result
+    assert [p.name for p in tmp_path.iterdir()] == ['episodes.lock']
+
+
+def test_episode_locks_within_process(tmp_path: Path):
+    episode = Episode('test', 'https://www.example.com/1.mp3', 'test')
+    episode.file_path = Path(tmp_path, 'test', '1.mp3')
+    with EpisodeLocks(Path(tmp_path, 'episodes.lock')) as locks:
+        with locks.hold(episode) as result:
+            assert result
+            with locks.hold(episode) as nested_result:
+                assert not nested_result
+        with locks.hold(episode) as result:
+            assert result
+
+
+def test_episode_locks_unusable_file(tmp_path: Path):
+    episode = Episode('test', 'https://www.example.com/1.mp3', 'test')
+    episode.file_path = Path(tmp_path, 'test', '1.mp3')
+    Path(tmp_path, 'episodes.lock').mkdir()
+    with pytest.raises(EpisodeException):
+        with EpisodeLocks(Path(tmp_path, 'episodes.lock')).hold(episode):
+            pass
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+from pathlib import Path
+
+import mutagen
+import pytest
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.exceptions import TagEngineError
+from podcastdownloader.tag_engine import TagEngine
+
+_mp3_frame = b'\xff\xfb\x90\x64' + bytes(413)
+
+
+@pytest.fixture()
+def mp3_episode(tmp_path: Path) -> Episode:
+    episode = Episode('Test Episode', 'https://www.example.com/test.mp3', 'Test Podcast', summary='Summary')
+    episode.file_path = Path(tmp_path, 'test.mp3')
+    episode.file_path.write_bytes(_mp3_frame * 20)
+    return episode
+
+
+def test_tag_episode_mp3(mp3_episode: Episode):
+    assert TagEngine.tag_episode(mp3_episode)
+    tags = mutagen.File(mp3_episode.file_path).tags
+    assert tags['TIT2'].text == ['Test Episode']
+    assert tags['TALB'].text == ['Test Podcast']
+    assert tags['TDES'].text == ['Summary']
+
+
+def test_tag_episode_skips_matching_tags(mp3_episode: Episode):
+    TagEngine.tag_episode(mp3_episode)
+    modified_time = mp3_episode.file_path.stat().st_mtime_ns
+    assert not TagEngine.tag_episode(mp3_episode)
+    assert mp3_episode.file_path.stat().st_mtime_ns == modified_time
+    mp3_episode.title = 'New Title'
+    assert TagEngine.tag_episode(mp3_episode)
+    assert mutagen.File(mp3_episode.file_path).tags['TIT2'].text == ['New Title']
+
+
+def test_has_episode_tags(mp3_episode: Episode):
+    assert not TagEngine.has_episode_tags(mp3_episode, mp3_episode.file_path)
+    TagEngine.tag_episode(mp3_episode)
+    modified_time = mp3_episode.file_path.stat().st_mtime_ns
+    assert TagEngine.has_episode_tags(mp3_episode, mp3_episode.file_path)
+    other = Episode('Other Episode', 'https://www.example.com/other.mp3', 'Test Podcast', summary='Summary')
+    assert not TagEngine.has_episode_tags(other, mp3_episode.file_path)
+    assert mp3_episode.file_path.stat().st_mtime_ns == modified_time
+    mp3_episode.file_path.write_bytes(b'test')
+    assert not TagEngine.has_episode_tags(mp3_episode, mp3_episode.file_path)
+
+
+def test_tag_episode_unknown_format(mp3_episode: Episode):
+    mp3_episode.file_path.write_bytes(b'test')
+    with pytest.raises((TagEngineError, mutagen.MutagenError)):
+        TagEngine.tag_episode(mp3_episode)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+from pathlib import Path
+
 import pytest
 
 import podcastdownloader.utility_functions as util
@@ -31,3 +33,44 @@ def test_clean_text_line_non_feeds(test_input_string: str, expected: str):
 def test_clean_text_line_good(test_input_string: str, expected: str):
     result = util._clean_text_line(test_input_string)
     assert result == expected
+
+
+def test_load_feeds_from_text_file(tmp_path: Path):
+    feed_file = Path(tmp_path, 'feeds.txt')
+    feed_file.write_text(
+        '# Comment\n'
+        'https://www.example.com/a.rss\n'
+        '\n'
+        'https://www.example.com/b.rss # test comment\n'
+        'https://www.example.com/a.rss\n')
+    assert util.load_feeds_from_text_file((str(feed_file),)) == [
+        'https://www.example.com/a.rss', 'https://www.example.com/b.rss']
+
+
+def test_load_feeds_from_opml(tmp_path: Path):
+    opml_file = Path(tmp_path, 'feeds.opml')
+    opml_file.write_text(
+        '<opml version="2.0"><head><title>Subscriptions</title></head><body>'
+        '<outline text="Category">'
+        '<outline text="A" type="rss" xmlUrl="https://www.example.com/a.rss" weight="2"/>'
+        '<outline text="B" type="rss" xmlUrl="https://www.example.com/b.rss"/>'
+        '</outline>'
+        '<outline text="A again" type="rss" xmlUrl="https://www.example.com/a.rss"/>'
+        '<outline text="C" type="rss" xmlUrl="https://www.example.com/c.rss"/>'
+        '</body></opml>')
+    assert util.load_feeds_from_opml((str(opml_file),)) == {
+        'https://www.example.com/a.rss': {
+            'text': 'A', 'type': 'rss', 'xmlUrl': 'https://www.example.com/a.rss', 'weight': '2'},
+        'https://www.example.com/b.rss': {'text': 'B', 'type': 'rss', 'xmlUrl': 'https://www.example.com/b.rss'},
+        'https://www.example.com/c.rss': {'text': 'C', 'type': 'rss', 'xmlUrl': 'https://www.example.com/c.rss'},
+    }
+
+
+def test_get_feed_weights():
+    feed_attributes = {
+        'https://www.example.com/a.rss': {'weight': '2.5'},
+        'https://www.example.com/b.rss': {},
+        'https://www.example.com/c.rss': {'weight': '-1'},
+        'https://www.example.com/d.rss': {'weight': 'high'},
+    }
+    assert util.get_feed_weights(feed_attributes) == {'https://www.example.com/a.rss': 2.5}
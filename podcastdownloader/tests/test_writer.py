@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import os
+from pathlib import Path
+
+import pytest
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.podcast import Podcast
+from podcastdownloader.writer import PlaylistWriter, write_episode_playlist
+
+
+def _make_podcast(directory: Path, present: tuple[int, ...] = (0, 1)) -> Podcast:
+    podcast = Podcast('https://www.example.com/feed')
+    podcast.name = 'Test Podcast'
+    Path(directory, podcast.name).mkdir(exist_ok=True)
+    # Feeds list the newest episode first
+    for i in reversed(range(3)):
+        episode = Episode(f'Episode {i}', f'https://www.example.com/{i}.mp3', podcast.name, duration=60 * (i + 1))
+        episode.file_path = Path(directory, podcast.name, f'Episode {i}.mp3')
+        if i in present:
+            episode.file_path.touch()
+        podcast.episodes.append(episode)
+    return podcast
+
+
+@pytest.mark.parametrize(('test_format', 'file_name', 'expected'), (
+    ('m3u', 'episode_playlist.m3u', '#EXTM3U\n./Episode 0.mp3\n./Episode 1.mp3\n'),
+    ('extm3u', 'episode_playlist.m3u8',
+     '#EXTM3U\n#PLAYLIST:Test Podcast\n#EXTINF:60,Test Podcast - Episode 0\n./Episode 0.mp3\n'
+     '#EXTINF:120,Test Podcast - Episode 1\n./Episode 1.mp3\n'),
+    ('pls', 'episode_playlist.pls',
+     '[playlist]\nFile1=Episode 0.mp3\nTitle1=Episode 0\nLength1=60\n'
+     'File2=Episode 1.mp3\nTitle2=Episode 1\nLength2=120\nNumberOfEntries=2\nVersion=2\n'),
+    ('text', 'episode_list.txt', 'Episode 0.mp3\nEpisode 1.mp3\n'),
+))
+def test_write_episode_playlist(test_format: str, file_name: str, expected: str, tmp_path: Path):
+    write_episode_playlist(_make_podcast(tmp_path), (test_format,))
+    assert Path(tmp_path, 'Test Podcast', file_name).read_text() == expected
+
+
+def test_write_xspf_playlist(tmp_path: Path):
+    write_episode_playlist(_make_podcast(tmp_path), ('xspf',))
+    result = Path(tmp_path, 'Test Podcast', 'episode_playlist.xspf').read_text()
+    assert '<location>Episode%200.mp3</location>' in result
+    assert '<duration>120000</duration>' in result
+    assert 'Episode 2' not in result
+
+
+def test_write_audacious_playlist(tmp_path: Path):
+    write_episode_playlist(_make_podcast(tmp_path), ('audacious',))
+    lines = Path(tmp_path, 'Test Podcast', 'episode_playlist.audpl').read_text().splitlines()
+    assert lines[0] == 'title=Test%20Podcast'
+    assert lines[1] == 'uri=' + Path(tmp_path, 'Test Podcast', 'Episode 0.mp3').as_uri()
+    assert len(lines) == 5
+
+
+def test_write_episode_playlist_only_when_changed(tmp_path: Path):
+    podcast = _make_podcast(tmp_path)
+    playlist_path = Path(tmp_path, 'Test Podcast', 'episode_playlist.m3u')
+    write_episode_playlist(podcast, ('m3u',))
+    os.utime(playlist_path, (0, 0))
+    write_episode_playlist(podcast, ('m3u',))
+    assert playlist_path.stat().st_mtime == 0
+    podcast.episodes[0].file_path.touch()
+    write_episode_playlist(podcast, ('m3u',))
+    assert playlist_path.stat().st_mtime != 0
+    assert playlist_path.read_text().endswith('./Episode 2.mp3\n')
+    assert not Path(tmp_path, 'Test Podcast', 'episode_playlist.m3u.tmp').exists()
+
+
+def test_playlist_writer_waits_for_downloads(tmp_path: Path):
+    podcast = _make_podcast(tmp_path, present=(0,))
+    playlist_path = Path(tmp_path, 'Test Podcast', 'episode_playlist.m3u')
+    writer = PlaylistWriter(('m3u',))
+    writer.add_podcast(podcast, podcast.episodes[:2])
+    podcast.episodes[0].file_path.touch()
+    writer.finish_episode(podcast.episodes[0])
+    assert not playlist_path.exists()
+    writer.finish_episode(podcast.episodes[1])
+    assert playlist_path.read_text() == '#EXTM3U\n./Episode 0.mp3\n./Episode 2.mp3\n'
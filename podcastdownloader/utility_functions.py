@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+import concurrent.futures
 import logging
 import re
 import xml.etree.ElementTree as ElementTree
@@ -11,42 +12,84 @@ from podcastdownloader.exceptions import FeedException
 
 logger = logging.getLogger(__name__)
 
+STATE_DIRECTORY_NAME = '.podcastdownloader'
+
+
+def get_state_directory(destination: Path) -> Path:
+    return Path(destination, STATE_DIRECTORY_NAME)
+
+
+def create_executor(pool_size: Optional[int], use_processes: bool) -> concurrent.futures.Executor:
+    if use_processes:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=pool_size)
+    else:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
+
 
 def _check_required_path(file_path: str) -> Path:
     result = Path(file_path).resolve().expanduser()
     return result
 
 
+_non_feed_pattern = re.compile(r'^\s*(#.*)?$')
+_feed_pattern = re.compile(r'^\s*(.*?)(\s+#.*)?$')
+
+
 def load_feeds_from_text_file(feed_files: tuple[str]) -> list[str]:
-    result = []
+    result = {}
     feed_files = [_check_required_path(file) for file in feed_files]
     for feed_file in feed_files:
         with open(Path(feed_file), 'r') as feed:
-            for line in feed.readlines():
-                if parsed_line := _clean_text_line(line):
-                    result.append(parsed_line)
+            for line in feed:
+                if (parsed_line := _clean_text_line(line)) and parsed_line not in result:
+                    result[parsed_line] = None
                     logger.debug(f'Feed {parsed_line} added')
-    return result
+    return list(result)
 
 
 def _clean_text_line(in_string: str) -> Optional[str]:
-    non_feed_pattern = re.compile(r'^\s*(#.*)?$')
-    if re.match(non_feed_pattern, in_string):
+    if _non_feed_pattern.match(in_string):
         return None
-    feed_pattern = re.compile(r'^\s*(.*?)(\s+#.*)?$')
-    feed_match = re.match(feed_pattern, in_string)
+    feed_match = _feed_pattern.match(in_string)
     if feed_match:
         return feed_match.group(1)
     else:
         raise FeedException(f'Could not extract feed from {in_string.strip()}')
 
 
-def load_feeds_from_opml(opml_files: tuple[str]) -> list[str]:
-    result = []
+def load_feeds_from_opml(opml_files: tuple[str]) -> dict[str, dict[str, str]]:
+    result = {}
     opml_files = [_check_required_path(file) for file in opml_files]
     for opml_loc in opml_files:
-        opml_tree = ElementTree.parse(Path(opml_loc))
-        for opml_feed in opml_tree.getroot().iter('outline'):
-            result.append(opml_feed.attrib['xmlUrl'])
-            logger.debug(f'Feed {opml_feed.attrib["xmlUrl"]} added')
+        parents = []
+        for event, element in ElementTree.iterparse(Path(opml_loc), events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag != 'outline':
+                continue
+            if (url := element.get('xmlUrl')) and url not in result:
+                result[url] = dict(element.attrib)
+                logger.debug(f'Feed {url} added')
+            # Finished outlines are discarded so that memory use does not grow with the size of the file
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+    return result
+
+
+def get_feed_weights(feed_attributes: dict[str, dict[str, str]]) -> dict[str, float]:
+    result = {}
+    for url, attributes in feed_attributes.items():
+        if 'weight' not in attributes:
+            continue
+        try:
+            weight = float(attributes['weight'])
+        except ValueError:
+            weight = 0
+        if weight > 0:
+            result[url] = weight
+        else:
+            logger.warning(f'Ignoring invalid weight {attributes["weight"]} for {url}')
     return result
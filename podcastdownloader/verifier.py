@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+import aiohttp.client_exceptions
+
+from podcastdownloader.episode import Episode
+from podcastdownloader.resolution_cache import Resolution, ResolutionCache
+
+logger = logging.getLogger(__name__)
+
+
+def _stat_files(file_paths: list[Path]) -> list[Optional[int]]:
+    result = []
+    for file_path in file_paths:
+        try:
+            result.append(file_path.stat().st_size)
+        except OSError:
+            result.append(None)
+    return result
+
+
+def _check_audio(file_path: Path) -> Optional[str]:
+    import mutagen
+    try:
+        audio_file = mutagen.File(file_path)
+    except (mutagen.MutagenError, OSError) as e:
+        return str(e)
+    if audio_file is None:
+        return 'Unrecognised audio format'
+    if not getattr(audio_file.info, 'length', 0):
+        return 'Audio stream has no duration'
+    return None
+
+
+class EpisodeVerifier:
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            tolerance: float,
+            check_audio: bool,
+            network_concurrency: int,
+            executor: Optional[Executor] = None,
+            resolutions: Optional[ResolutionCache] = None,
+    ):
+        self.session = session
+        self.tolerance = tolerance
+        self.check_audio = check_audio
+        self.executor = executor
+        self.resolutions = resolutions
+        self._network_semaphore = asyncio.Semaphore(network_concurrency)
+
+    def _is_within_tolerance(self, actual_size: int, expected_size: int) -> bool:
+        return abs(actual_size - expected_size) <= expected_size * self.tolerance
+
+    async def _get_remote_size(self, url: str) -> Optional[int]:
+        if self.resolutions and (resolution := self.resolutions.get(url)) and resolution.content_length:
+            return resolution.content_length
+        async with self._network_semaphore:
+            try:
+                async with self.session.head(url, allow_redirects=True) as response:
+                    if response.status != 200:
+                        return None
+                    size = Episode._parse_positive_integer(response.headers.get('Content-Length'))
+                    if self.resolutions:
+                        self.resolutions.put(
+                            url, Resolution(str(response.url), response.headers.get('Content-Type'), size))
+                    return size
+            except (aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+                logger.debug(f'Could not retrieve size of {url}: {e}')
+                return None
+
+    async def _verify_episode(self, episode: Episode, actual_size: Optional[int]) -> dict:
+        result = {
+            'podcast': episode.podcast_name,
+            'title': episode.title,
+            'path': str(episode.file_path),
+            'url': episode.url,
+            'actual_size': actual_size,
+            'expected_size': episode.length,
+            'size_source': 'enclosure' if episode.length else None,
+            'status': 'ok',
+            'error': None,
+        }
+        if actual_size is None:
+            result['status'] = 'missing'
+            return result
+        # Enclosure lengths are often stale or wrong, so the server is asked before a file is flagged
+        if not episode.length or not self._is_within_tolerance(actual_size, episode.length):
+            if remote_size := await self._get_remote_size(episode.url):
+                result['expected_size'] = remote_size
+                result['size_source'] = 'content-length'
+        if not result['expected_size']:
+            result['status'] = 'unknown_size'
+        elif not self._is_within_tolerance(actual_size, result['expected_size']):
+            result['status'] = 'size_mismatch'
+        if self.check_audio and result['status'] in ('ok', 'unknown_size'):
+            loop = asyncio.get_running_loop()
+            if error := await loop.run_in_executor(self.executor, _check_audio, episode.file_path):
+                result['status'] = 'unreadable'
+                result['error'] = error
+        return result
+
+    async def verify_episodes(self, episodes: list[Episode]) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        sizes = await loop.run_in_executor(self.executor, _stat_files, [e.file_path for e in episodes])
+        return await asyncio.gather(*[self._verify_episode(e, size) for e, size in zip(episodes, sizes)])
+
+    @staticmethod
+    def is_flagged(result: dict) -> bool:
+        return result['status'] in ('missing', 'size_mismatch', 'unreadable')
@@ -3,28 +3,137 @@
 
 import logging
 import pathlib
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+from typing import Callable
 
+from podcastdownloader.episode import Episode
 from podcastdownloader.podcast import Podcast
 
 logger = logging.getLogger(__name__)
 
 
-def _write_m3u(podcast: Podcast):
-    podcast_path = podcast.episodes[0].file_path.parent
-    podcast_path.mkdir(parents=True, exist_ok=True)
-    with open(pathlib.Path(podcast_path, 'episode_playlist.m3u'), 'w') as file:
-        file.write('#EXTM3U\n')
-        for episode in reversed(podcast.episodes):
-            try:
-                file.write('./' + episode.file_path.name + '\n')
-            except AttributeError:
-                logger.warning(f'Could not write {episode.title} to playlist')
-    logger.debug(f'M3U playlist for {podcast.name} written')
+def _render_m3u(podcast: Podcast, episodes: list[Episode]) -> str:
+    return '#EXTM3U\n' + ''.join('./' + episode.file_path.name + '\n' for episode in episodes)
+
+
+def _render_extended_m3u(podcast: Podcast, episodes: list[Episode]) -> str:
+    lines = ['#EXTM3U', f'#PLAYLIST:{podcast.name}']
+    for episode in episodes:
+        lines.append(f'#EXTINF:{episode.duration or -1},{podcast.name} - {episode.title}')
+        lines.append('./' + episode.file_path.name)
+    return '\n'.join(lines) + '\n'
+
+
+def _render_pls(podcast: Podcast, episodes: list[Episode]) -> str:
+    lines = ['[playlist]']
+    for i, episode in enumerate(episodes, start=1):
+        lines.append(f'File{i}={episode.file_path.name}')
+        lines.append(f'Title{i}={episode.title}')
+        lines.append(f'Length{i}={episode.duration or -1}')
+    lines.append(f'NumberOfEntries={len(episodes)}')
+    lines.append('Version=2')
+    return '\n'.join(lines) + '\n'
+
+
+def _render_xspf(podcast: Podcast, episodes: list[Episode]) -> str:
+    playlist = ElementTree.Element('playlist', {'version': '1', 'xmlns': 'http://xspf.org/ns/0/'})
+    ElementTree.SubElement(playlist, 'title').text = podcast.name
+    track_list = ElementTree.SubElement(playlist, 'trackList')
+    for episode in episodes:
+        track = ElementTree.SubElement(track_list, 'track')
+        ElementTree.SubElement(track, 'location').text = urllib.parse.quote(episode.file_path.name)
+        ElementTree.SubElement(track, 'title').text = episode.title
+        ElementTree.SubElement(track, 'album').text = podcast.name
+        if episode.number:
+            ElementTree.SubElement(track, 'trackNum').text = str(episode.number)
+        if episode.duration:
+            ElementTree.SubElement(track, 'duration').text = str(episode.duration * 1000)
+    ElementTree.indent(playlist)
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ElementTree.tostring(playlist, encoding='unicode') + '\n'
+
+
+def _render_text(podcast: Podcast, episodes: list[Episode]) -> str:
+    return ''.join(episode.file_path.name + '\n' for episode in episodes)
+
+
+def _render_audacious(podcast: Podcast, episodes: list[Episode]) -> str:
+    lines = ['title=' + urllib.parse.quote(podcast.name)]
+    for episode in episodes:
+        lines.append('uri=' + episode.file_path.absolute().as_uri())
+        lines.append('title=' + urllib.parse.quote(episode.title))
+    return '\n'.join(lines) + '\n'
+
+
+_playlist_renderers: dict[str, tuple[str, Callable[[Podcast, list[Episode]], str]]] = {
+    'm3u': ('episode_playlist.m3u', _render_m3u),
+    'extm3u': ('episode_playlist.m3u8', _render_extended_m3u),
+    'pls': ('episode_playlist.pls', _render_pls),
+    'xspf': ('episode_playlist.xspf', _render_xspf),
+    'text': ('episode_list.txt', _render_text),
+    'audacious': ('episode_playlist.audpl', _render_audacious),
+}
+
+PLAYLIST_FORMATS = tuple(_playlist_renderers)
+
+
+def _write_if_changed(file_path: pathlib.Path, content: str) -> bool:
+    try:
+        if file_path.read_text(encoding='utf-8') == content:
+            return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    temporary_path = file_path.with_name(file_path.name + '.tmp')
+    temporary_path.write_text(content, encoding='utf-8')
+    temporary_path.replace(file_path)
+    return True
+
+
+def _get_present_episodes(podcast: Podcast) -> list[Episode]:
+    # Episodes are listed oldest first, and only once they have been downloaded
+    return [e for e in reversed(podcast.episodes) if e.file_path and e.file_path.exists()]
 
 
 def write_episode_playlist(podcast: Podcast, write_choices: tuple[str]):
+    if not write_choices:
+        return
+    episodes = _get_present_episodes(podcast)
+    if not episodes:
+        logger.debug(f'No downloaded episodes to write to playlists for {podcast.name}')
+        return
+    podcast_path = episodes[0].file_path.parent
     for format_choice in write_choices:
-        if format_choice == 'm3u':
-            _write_m3u(podcast)
-        else:
+        try:
+            file_name, render = _playlist_renderers[format_choice]
+        except KeyError:
             logger.error(f'Unknown playlist format type: {format_choice}')
+            continue
+        if _write_if_changed(pathlib.Path(podcast_path, file_name), render(podcast, episodes)):
+            logger.debug(f'{format_choice} playlist for {podcast.name} written')
+        else:
+            logger.debug(f'{format_choice} playlist for {podcast.name} unchanged')
+
+
+class PlaylistWriter:
+    def __init__(self, write_choices: tuple[str]):
+        self.write_choices = write_choices
+        self._podcasts: dict[str, Podcast] = {}
+        self._pending: dict[str, int] = {}
+
+    def add_podcast(self, podcast: Podcast, pending_episodes: list[Episode]):
+        if not self.write_choices:
+            return
+        if not pending_episodes and podcast.name not in self._pending:
+            write_episode_playlist(podcast, self.write_choices)
+            return
+        # The playlist is written once every queued episode of the podcast has been attempted
+        self._podcasts[podcast.name] = podcast
+        self._pending[podcast.name] = self._pending.get(podcast.name, 0) + len(pending_episodes)
+
+    def finish_episode(self, episode: Episode):
+        if episode.podcast_name not in self._pending:
+            return
+        self._pending[episode.podcast_name] -= 1
+        if self._pending[episode.podcast_name] <= 0:
+            del self._pending[episode.podcast_name]
+            write_episode_playlist(self._podcasts.pop(episode.podcast_name), self.write_choices)